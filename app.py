@@ -1,3 +1,5 @@
+import os
+
 import boto3
 import requests
 from flask import Flask, request
@@ -8,7 +10,9 @@ from flask import Flask, render_template
 
 app = Flask(__name__)
 
-dynamodb = boto3.resource('dynamodb', region_name="ap-southeast-1")
+# e.g. http://localhost:8000 to serve the table loaded into DynamoDB Local by populate_db.py.
+dynamodb = boto3.resource('dynamodb', region_name="ap-southeast-1",
+                          endpoint_url=os.environ.get("SUPPLEMENTARY_DYNAMODB_ENDPOINT_URL") or None)
 table=dynamodb.Table("dturesults")
 
 
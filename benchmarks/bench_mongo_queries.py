@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Benchmark cohort queries on the `semester_results` collection, e.g. the results of a branch
+in a semester of an examination, without and with `writers.SEMESTER_RESULTS_INDEXES`.
+
+Synthetic students are written to a scratch database of a running mongod with
+`writers.insert_timelines_to_mongodb`, so the documents are shaped like those of
+`populate_db.py`. Every query is timed, best of `--repeat`, and explained, first with only the
+`_id` index and then after `writers.create_mongodb_indexes`.
+
+Sample Run:
+
+$ python benchmarks/bench_mongo_queries.py --students 20000 --semesters 8
+"""
+from __future__ import absolute_import, division
+
+import os
+from   os.path                  import dirname, realpath
+import random
+import sys
+from   timeit                   import default_timer as timer
+
+import click
+
+sys.path.append(os.path.join(dirname(dirname(realpath(__file__))), "src/python"))
+from   records                  import PageMetadata, StudentResult
+from   timelines                import TimelineIndex
+import writers
+
+
+BRANCHES = ("CE", "CO", "EC", "EE", "EN", "IT", "ME", "MC", "PE", "SE")
+SEMESTERS = ("I", "II", "III", "IV", "V", "VI", "VII", "VIII")
+EXAMINATIONS = ("MAY-2013", "DEC-2013", "MAY-2014", "DEC-2014", "MAY-2015", "DEC-2015",
+                "MAY-2016", "DEC-2016")
+
+
+def synthetic_results(num_students, num_semesters, seed=0):
+    """Records of `num_students` students per branch, in a regular and a back notice per semester."""
+    rng = random.Random(seed)
+    for branch in BRANCHES:
+        for num, (semester, examination) in enumerate(zip(SEMESTERS[:num_semesters], EXAMINATIONS)):
+            for kind in ("", "_BACK"):
+                page = PageMetadata("B.Tech", branch, semester, f"06/01/{2014 + num // 2}",
+                                    examination, f"No.DTU/Results/BTECH/{examination}{kind}",
+                                    f"{examination}_{branch}_{semester}{kind}.pdf", 1)
+                students = range(num_students) if not kind else rng.sample(range(num_students),
+                                                                           num_students // 10)
+                for student in students:
+                    codes = tuple(f"{branch}-{num + 1}0{subject}" for subject in range(1, 6))
+                    yield StudentResult(page, f"STUDENT {student}", f"2K12/{branch}/{student}",
+                                        "7.5", "24", None, codes,
+                                        tuple(rng.randint(30, 100) for _ in codes))
+
+
+def time_query(collection, query, repeat):
+    """Best of `repeat` seconds to fetch every document matching `query`, and the winning plan."""
+    best = None
+    for _ in range(repeat):
+        start_ts = timer()
+        num_docs = len(list(collection.find(query)))
+        seconds = timer() - start_ts
+        best = seconds if best is None else min(best, seconds)
+    explain = collection.find(query).explain()
+    stages, plan = [], explain["queryPlanner"]["winningPlan"]
+    while plan:
+        stages.append(plan["stage"])
+        plan = plan.get("inputStage")
+    return best, num_docs, explain["executionStats"]["totalDocsExamined"], "<".join(stages)
+
+
+QUERIES = {
+    "branch+semester+exam": {"branch": "CE", "semester": "III", "examination_date": "DEC-2014"},
+    "branch+semester":      {"branch": "CE", "semester": "III"},
+    "rollno":               {"rollno": "2K12/CE/7"},
+    "notice":               {"notice": "No.DTU/Results/BTECH/DEC-2014"},
+}
+
+
+@click.command()
+@click.option('--students', type=click.INT, default=5000, help='Students per branch.')
+@click.option('--semesters', type=click.IntRange(1, len(SEMESTERS)), default=8)
+@click.option('--repeat', type=click.INT, default=5)
+@click.option('--database', type=click.STRING, default="dtu_benchmark",
+              help='Scratch database, dropped at the end.')
+def main(students, semesters, repeat, database):
+    db = writers.get_db().client[database]
+    db.client.drop_database(database)
+    try:
+        index = TimelineIndex()
+        index.add(synthetic_results(students, semesters))
+        writers.insert_timelines_to_mongodb(index.timelines(), db=db)
+        collection = db.semester_results
+        print(f"{collection.estimated_document_count()} documents in semester_results")
+
+        results = {}
+        for indexed in (False, True):
+            if indexed:
+                start_ts = timer()
+                writers.create_mongodb_indexes(db)
+                print(f"Created indexes in {timer() - start_ts:.1f}s")
+            for name, query in QUERIES.items():
+                results[name, indexed] = time_query(collection, query, repeat)
+
+        print(f"{'query':24}{'docs':>8}{'ms before':>12}{'examined':>10}{'ms after':>12}"
+              f"{'examined':>10}  plan after")
+        for name in QUERIES:
+            before, num_docs, examined_before, _ = results[name, False]
+            after, _, examined_after, plan = results[name, True]
+            print(f"{name:24}{num_docs:8}{before * 1000:12.1f}{examined_before:10}"
+                  f"{after * 1000:12.1f}{examined_after:10}  {plan}")
+    finally:
+        db.client.drop_database(database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""
+Benchmark `parse_results.sanitize_df` on fixture DataFrames shaped like the output of
+`tabula.read_pdf` for a DTU result page.
+
+Sample Run:
+
+$ python benchmarks/bench_sanitize.py --pages 200 --rows 40
+"""
+from __future__ import absolute_import, division
+
+import os
+from   os.path                  import dirname, realpath
+import random
+import sys
+from   timeit                   import default_timer as timer
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(dirname(dirname(realpath(__file__))), "src/python"))
+from   parse_results            import SANITIZED_NAME_MAP, sanitize_df
+
+
+SUBJECTS = ['MC-301', 'MC-302', 'MC-303', 'MC-304', 'MC-305',
+            'MC-306', 'MC-307', 'MC-308', 'MC-309']
+
+
+def make_page_df(num_rows, wrap_every=7, max_wrap_lines=2, seed=0):
+    """
+    Build a DataFrame as tabula reads a result page, including the 'Max. Marks / Credits'
+    row, names wrapped over two lines and 'Papers Failed' cells wrapped over up to
+    `max_wrap_lines` lines.
+    """
+    rng = random.Random(seed)
+    columns = ['Unnamed: 0', 'Sr.No. Name', 'Roll No.'] + SUBJECTS + ['TC', 'SPI', 'Unnamed: 1']
+    blank = [np.nan] * len(columns)
+
+    rows = [[np.nan, np.nan, 'Max. Marks / Credits'] + ['100/4'] * len(SUBJECTS)
+            + ['30', np.nan, 'Papers Failed']]
+    for num in range(1, num_rows + 1):
+        marks = [str(rng.randint(10, 100)) for _ in SUBJECTS]
+        papers_failed = np.nan
+        if num % wrap_every == 3:
+            lines = rng.randint(2, max_wrap_lines)
+            papers_failed = "MC-30{}MC-".format(rng.randint(1, 9))
+        rows.append([np.nan, f"{num} STUDENT  NAME", f"2K12/MC/{num}"] + marks
+                    + [str(rng.randint(20, 30)), "{:.2f}".format(rng.uniform(40, 95)), papers_failed])
+        if num % wrap_every == 0:
+            # A long name wrapped over two lines.
+            row = list(blank)
+            row[1] = "BHARDWAJ"
+            rows.append(row)
+        if num % wrap_every == 3:
+            for _ in range(lines - 1):
+                row = list(blank)
+                row[-1] = "30{}MC-".format(rng.randint(1, 9))
+                rows.append(row)
+    return pd.DataFrame(rows, columns=columns)
+
+
+def legacy_sanitize_df(df):
+    """`sanitize_df` as it was before the continuation rows were merged with pandas ops."""
+    df.columns = [SANITIZED_NAME_MAP.get(x.lower().replace(" ", ""), x) for x in df.columns]
+    df = df[pd.notnull(df['name']) | pd.notnull(df['papers_failed'])].copy()
+    drop_indices = []
+    for row_num, row in df.iterrows():
+        row_vals = row.values.tolist()
+        row_vals.remove(row['papers_failed'])
+        if not any([pd.notnull(val) for val in row_vals]) and row_num > 0:
+            drop_indices.append(row_num)
+            df.loc[row_num - 1, 'papers_failed'] = df.loc[row_num - 1, 'papers_failed'] + " " + row['papers_failed']
+    if drop_indices:
+        df = df.drop(drop_indices)
+        df.reset_index(drop=True, inplace=True)
+    del df['Unnamed: 0']
+    if 'Max. Marks / Credits' in df.iloc[0].values:
+        df = df.drop(0)
+    df.reset_index(drop=True, inplace=True)
+    df['name'] = df['name'].apply(lambda x: x.strip("0123456789 ").replace("  ", " ")
+    if isinstance(x, str) else x)
+    drop_indices = []
+    for row_num, row in df.iterrows():
+        row_vals = row.values.tolist()
+        row_vals.remove(row['name'])
+        if not any([pd.notnull(val) for val in row_vals]) and row_num > 0:
+            drop_indices.append(row_num)
+            df.loc[row_num - 1, 'name'] = df.loc[row_num - 1, 'name'] + " " + row['name']
+    if drop_indices:
+        df = df.drop(drop_indices)
+        df.reset_index(drop=True, inplace=True)
+    return df
+
+
+def time_per_page(func, page_dfs):
+    """Returns the mean seconds taken by `func` per page."""
+    start_ts = timer()
+    for df in page_dfs:
+        func(df.copy())
+    return (timer() - start_ts) / len(page_dfs)
+
+
+@click.command()
+@click.option('--pages', type=click.INT, default=100, help='Number of fixture pages.')
+@click.option('--rows', type=click.INT, default=40, help='Number of students per page.')
+def main(pages, rows):
+    # Pages with at most 2 line wraps, which both implementations handle alike.
+    page_dfs = [make_page_df(rows, seed=seed) for seed in range(pages)]
+    same = all(legacy_sanitize_df(df.copy()).equals(sanitize_df(df.copy())) for df in page_dfs[:10])
+    print(f"Outputs identical on 2-line wraps: {same}")
+
+    before = time_per_page(legacy_sanitize_df, page_dfs)
+    after = time_per_page(sanitize_df, page_dfs)
+    print(f"{'':10}{'ms/page':>10}")
+    print(f"{'before':10}{before * 1000:10.2f}")
+    print(f"{'after':10}{after * 1000:10.2f}")
+    print(f"Speedup: {before / after:.1f}x over {pages} pages of {rows} rows")
+
+
+if __name__ == '__main__':
+    main()
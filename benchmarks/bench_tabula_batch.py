@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""
+Compare the cold-cache wall-clock time of extracting the tables of a directory of pdfs with
+one JVM per pdf (`utils.tabula_read_pdf`) against one JVM per batch (`utils.tabula_prefetch`).
+
+Every mode runs in a fresh process against an empty temporary cache directory.
+
+The speedup of batches is unverified: this needs a JVM and the corpus of pdfs, and hasn't been
+run on them yet. Record its output in the README when it is.
+
+Sample Run:
+
+$ python benchmarks/bench_tabula_batch.py --pdf-dir data/dtu_results --limit 100 --batch-size 25
+"""
+from __future__ import absolute_import, division
+
+from   concurrent.futures.process \
+                                import ProcessPoolExecutor
+import os
+from   os.path                  import dirname, realpath
+import subprocess
+import sys
+import tempfile
+from   timeit                   import default_timer as timer
+
+import click
+
+SRC_DIR = os.path.join(dirname(dirname(realpath(__file__))), "src/python")
+sys.path.append(SRC_DIR)
+
+
+def list_pdfs(pdf_dir, limit):
+    pdfs = sorted(os.path.join(pdf_dir, name) for name in os.listdir(pdf_dir) if name.endswith(".pdf"))
+    return pdfs[:limit] if limit else pdfs
+
+
+def run_mode(mode, pdfs, batch_size, num_processes):
+    """Runs in a child process whose caches dir is empty."""
+    from utils import tabula_prefetch, tabula_read_pdf
+
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        if mode == "per-file":
+            list(executor.map(tabula_read_pdf, pdfs, ["all"] * len(pdfs)))
+        else:
+            batches = [pdfs[i:i + batch_size] for i in range(0, len(pdfs), batch_size)]
+            list(executor.map(tabula_prefetch, batches))
+
+
+@click.command()
+@click.option('--pdf-dir', type=click.Path(file_okay=False, exists=True), required=True)
+@click.option('--limit', type=click.INT, default=0, help='Only use the first N pdfs.')
+@click.option('--batch-size', type=click.INT, default=25, help='Pdfs per JVM in batch mode.')
+@click.option('--num-processes', type=click.INT, default=os.cpu_count())
+@click.option('--mode', type=click.Choice(["per-file", "batch"]), default=None,
+              help='Internal: run a single mode in this process.')
+def main(pdf_dir, limit, batch_size, num_processes, mode):
+    pdfs = list_pdfs(realpath(pdf_dir), limit)
+    if mode:
+        run_mode(mode, pdfs, batch_size, num_processes)
+        return
+
+    timings = {}
+    for mode in ("per-file", "batch"):
+        with tempfile.TemporaryDirectory(prefix="bench_tabula_") as caches_dir:
+            env = dict(os.environ, SUPPLEMENTARY_CACHES_DIR=caches_dir)
+            start_ts = timer()
+            subprocess.run([sys.executable, realpath(__file__), "--pdf-dir", pdf_dir,
+                            "--limit", str(limit), "--batch-size", str(batch_size),
+                            "--num-processes", str(num_processes), "--mode", mode],
+                           env=env, check=True)
+            timings[mode] = timer() - start_ts
+
+    print(f"{len(pdfs)} pdfs, {num_processes} processes, batch size {batch_size}")
+    for mode, seconds in timings.items():
+        print(f"{mode:10}{seconds:10.1f}s{seconds / len(pdfs) * 1000:10.0f} ms/pdf")
+    print(f"Speedup: {timings['per-file'] / timings['batch']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+Compare the table extraction engines of `parse_results.TABLE_ENGINES` over a directory of
+result pdfs: per-page latency of a cold extraction and record-level agreement of the parsed
+results. Records are matched on (rollno, page) and agree if all their fields are equal.
+
+Caches are written to a temporary directory so that every extraction is cold.
+
+Sample Run:
+
+$ python benchmarks/compare_engines.py --pdf-dir data/dtu_results --limit 50
+"""
+from __future__ import absolute_import, division
+
+import collections
+import os
+from   os.path                  import basename, dirname, realpath
+import sys
+import tempfile
+from   timeit                   import default_timer as timer
+
+import click
+
+os.environ.setdefault("SUPPLEMENTARY_CACHES_DIR", tempfile.mkdtemp(prefix="compare_engines_"))
+sys.path.append(os.path.join(dirname(dirname(realpath(__file__))), "src/python"))
+from   parse_results            import TABLE_ENGINES, parse_dtu_result_pdf
+
+
+def records_by_key(results):
+    return {(r.rollno, r.page.pdf_pagenum): r.to_dict() for r in results}
+
+
+@click.command()
+@click.option('--pdf-dir', type=click.Path(file_okay=False, exists=True), required=True)
+@click.option('--limit', type=click.INT, default=0, help='Only use the first N pdfs.')
+@click.option('--verbose', is_flag=True, help='Print every pdf.')
+def main(pdf_dir, limit, verbose):
+    pdfs = sorted(os.path.join(pdf_dir, name) for name in os.listdir(pdf_dir) if name.endswith(".pdf"))
+    pdfs = pdfs[:limit] if limit else pdfs
+    engines = sorted(TABLE_ENGINES)
+
+    seconds = collections.Counter()
+    pages = collections.Counter()
+    failures = collections.Counter()
+    num_records = collections.Counter()
+    agreeing, total = 0, 0
+    for pdf in pdfs:
+        parsed = {}
+        for engine in engines:
+            start_ts = timer()
+            try:
+                pages_df = TABLE_ENGINES[engine](pdf, pages='all')
+                seconds[engine] += timer() - start_ts
+                pages[engine] += len(pages_df)
+                # Served from the cache populated above.
+                parsed[engine] = records_by_key(parse_dtu_result_pdf(pdf, engine, fallback=False))
+                num_records[engine] += len(parsed[engine])
+            except Exception as err:
+                failures[engine] += 1
+                parsed[engine] = {}
+                if verbose:
+                    print(f"{basename(pdf)}: {engine} failed: {err!r}")
+
+        keys = set().union(*(records.keys() for records in parsed.values()))
+        same = [key for key in keys
+                if len({repr(sorted(records.get(key, {}).items())) for records in parsed.values()}) == 1]
+        agreeing += len(same)
+        total += len(keys)
+        if verbose:
+            print(f"{basename(pdf)}: {len(same)}/{len(keys)} records agree")
+
+    print(f"{len(pdfs)} pdfs")
+    print(f"{'engine':12}{'pages':>8}{'ms/page':>10}{'records':>10}{'failed':>8}")
+    for engine in engines:
+        ms_per_page = seconds[engine] / pages[engine] * 1000 if pages[engine] else float("nan")
+        print(f"{engine:12}{pages[engine]:8}{ms_per_page:10.1f}{num_records[engine]:10}{failures[engine]:8}")
+    print(f"Record-level agreement: {agreeing}/{total} ({agreeing / total if total else 0:.1%})")
+
+
+if __name__ == '__main__':
+    main()
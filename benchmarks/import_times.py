@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the startup of the entry points: the time to import each module in a fresh
+interpreter, as paid by every CLI invocation and spawned worker, and the time to print the
+`--help` of each script.
+
+Every run is appended to a history file along with the git revision, and compared with the
+last run on the same host, like `run_benchmarks`. With `--details`, the modules taking the
+longest to import are listed for each entry point, from `python -X importtime`.
+
+Sample Run:
+
+$ python benchmarks/import_times.py --repeat 5 --details
+"""
+from __future__ import absolute_import, division
+
+import json
+import os
+from   os.path                  import dirname, realpath
+import platform
+import subprocess
+import sys
+import time
+from   timeit                   import default_timer as timer
+
+import click
+
+from   run_benchmarks           import TOP_DIR, git_revision, last_run
+
+SRC_DIR = os.path.join(TOP_DIR, "src/python")
+
+DEFAULT_HISTORY_FILE = os.path.join(TOP_DIR, "benchmarks/import_history.ndjson")
+
+MODULES = ("utils", "parse_results", "populate_db", "worker_pool", "manage_caches",
+           "result_store", "snapshots", "timelines", "writers", "dynamodb",
+           "mongodb_to_dynamodb", "changes")
+"""Modules imported by the CLIs and by the workers of a pool."""
+
+SCRIPTS = ("parse_results.py", "populate_db.py", "manage_caches.py", "result_store.py",
+           "snapshots.py", "timelines.py", "mongodb_to_dynamodb.py")
+"""Scripts whose `--help` is timed."""
+
+_IMPORT = "import time; start_ts = time.perf_counter(); import {}; print(time.perf_counter() - start_ts)"
+
+
+def import_seconds(module, repeat):
+    """Best of `repeat` times to import `module` in a fresh interpreter, None if it fails."""
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", _IMPORT.format(module)], cwd=SRC_DIR,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True)
+        if proc.returncode:
+            return None
+        seconds = float(proc.stdout.strip().splitlines()[-1])
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def help_seconds(script, repeat):
+    """Best of `repeat` wall times of `<script> --help`, interpreter startup included."""
+    best = None
+    for _ in range(repeat):
+        start_ts = timer()
+        proc = subprocess.run([sys.executable, script, "--help"], cwd=SRC_DIR,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds = timer() - start_ts
+        if proc.returncode:
+            return None
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def heaviest_imports(module, num=5):
+    """`(cumulative seconds, package)` of the packages slowest to import along with `module`."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    # import time: self [us] | cumulative | imported package
+    # with the imports of a module listed before it and indented one more level. The imports
+    # at startup, e.g. site, are listed before those of `module`.
+    packages = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == module:
+                break
+            packages = {}
+            continue
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0), int(cumulative) / 1e6)
+    return sorted(((seconds, name) for name, seconds in packages.items()), reverse=True)[:num]
+
+
+@click.command()
+@click.option('--repeat', type=click.INT, default=5, help='Report the best of this many runs.')
+@click.option('--details', is_flag=True, help='List the slowest imports of each module.')
+@click.option('--history-file', type=click.Path(dir_okay=False), default=DEFAULT_HISTORY_FILE)
+@click.option('--threshold', type=click.FLOAT, default=0.2,
+              help='Report entry points slower than the last run by more than this fraction.')
+@click.option('--fail-on-regression', is_flag=True, help='Exit with 1 if any entry point regressed.')
+def main(repeat, details, history_file, threshold, fail_on_regression):
+    results = {}
+    for module in MODULES:
+        results[f"import {module}"] = import_seconds(module, repeat)
+    for script in SCRIPTS:
+        results[f"{script} --help"] = help_seconds(script, repeat)
+
+    params = dict(repeat=repeat)
+    run = dict(timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), revision=git_revision(),
+               host=platform.node(), python=platform.python_version(), params=params,
+               results={name: seconds and seconds * 1000 for name, seconds in results.items()})
+    prev = last_run(history_file, run["host"], params)
+
+    print(f"{'entry point':32}{'ms':>10}{'prev ms':>10}")
+    slower = []
+    for name, ms in run["results"].items():
+        prev_ms = prev and prev["results"].get(name)
+        print(f"{name:32}{ms if ms is not None else float('nan'):10.0f}"
+              + (f"{prev_ms:10.0f}" if prev_ms else f"{'-':>10}"))
+        if ms and prev_ms and ms > prev_ms * (1 + threshold):
+            slower.append((name, prev_ms, ms))
+        if details and name.startswith("import "):
+            for seconds, package in heaviest_imports(name[len("import "):]):
+                print(f"    {package:28}{seconds * 1000:10.0f}")
+
+    os.makedirs(dirname(realpath(history_file)), exist_ok=True)
+    with open(history_file, "a") as f:
+        f.write(json.dumps(run, sort_keys=True) + "\n")
+
+    for name, prev_ms, ms in slower:
+        print(f"Regression: {name} {prev_ms:.0f} -> {ms:.0f} ms (since {prev['revision']})")
+    if slower and fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the parsing pipeline on synthetic result pdfs, see `synthetic_pdf`, so that it can be
+run anywhere without the corpus.
+
+For every engine of `parse_results.TABLE_ENGINES` the following stages are timed, cold against
+an empty temporary cache directory and warm against the caches populated by the cold run:
+
+    extract     the engine, e.g. `utils.tabula_read_pdf`
+    texts       `utils.pdfplumber_extract_texts`
+    sanitize    `parse_results.sanitize_df`
+    metadata    `parse_results.parse_metadata`
+    parse       `parse_results.parse_dtu_result_pdf`, end to end
+
+Stages are reported as ms/page and records/sec. Texts are extracted after the tables, so the
+pdfplumber engine serves them from its cache. Every run is appended to a history file along
+with the git revision, and compared with the last run on the same host with the same
+parameters so that regressions show up.
+
+Sample Run:
+
+$ python benchmarks/run_benchmarks.py --pdfs 20 --pages 5 --rows 40 --fail-on-regression
+"""
+from __future__ import absolute_import, division
+
+import json
+import os
+from   os.path                  import dirname, realpath
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from   timeit                   import default_timer as timer
+
+import click
+
+TOP_DIR = dirname(dirname(realpath(__file__)))
+os.environ.setdefault("SUPPLEMENTARY_CACHES_DIR", tempfile.mkdtemp(prefix="run_benchmarks_"))
+sys.path.append(os.path.join(TOP_DIR, "src/python"))
+sys.path.append(dirname(realpath(__file__)))
+from   synthetic_pdf            import write_result_pdf
+
+DEFAULT_HISTORY_FILE = os.path.join(TOP_DIR, "benchmarks/history.ndjson")
+
+
+def run_engine(engine, pdfs, cold_only):
+    """
+    Runs in a child process whose caches dir is empty. Returns `{stage: (seconds, pages)}` and
+    the number of records parsed.
+
+    :param cold_only:
+        Only time `parse_dtu_result_pdf` against the empty caches.
+    """
+    from loguru import logger as log
+    from parse_results import TABLE_ENGINES, parse_dtu_result_pdf, parse_metadata, sanitize_df
+    from utils import pdfplumber_extract_texts
+    log.remove()
+
+    def timed(func, *args):
+        start_ts = timer()
+        result = func(*args)
+        return result, timer() - start_ts
+
+    timings = {}
+
+    def add(stage, seconds, pages):
+        prev_seconds, prev_pages = timings.get(stage, (0, 0))
+        timings[stage] = (prev_seconds + seconds, prev_pages + pages)
+
+    num_records = 0
+    if cold_only:
+        for pdf in pdfs:
+            results, seconds = timed(parse_dtu_result_pdf, pdf, engine)
+            num_records += len(results)
+            add("parse_cold", seconds, len({r.page.pdf_pagenum for r in results}))
+        return timings, num_records
+
+    for pdf in pdfs:
+        for temperature in ("cold", "warm"):
+            pages_df, seconds = timed(TABLE_ENGINES[engine], pdf, 'all')
+            add(f"extract_{temperature}", seconds, len(pages_df))
+            # Pages requested as by `parse_dtu_result_pdf`.
+            texts, seconds = timed(pdfplumber_extract_texts, pdf, range(len(pages_df)))
+            add(f"texts_{temperature}", seconds, len(texts))
+
+        copies = [df.copy() for df in pages_df if df is not None]
+        _, seconds = timed(lambda: [sanitize_df(df) for df in copies])
+        add("sanitize", seconds, len(copies))
+        _, seconds = timed(lambda: [parse_metadata(pdf, num, text) for num, text in enumerate(texts)])
+        add("metadata", seconds, len(texts))
+
+        results, seconds = timed(parse_dtu_result_pdf, pdf, engine)
+        num_records += len(results)
+        add("parse_warm", seconds, len(pages_df))
+    return timings, num_records
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=TOP_DIR, check=True,
+                                  stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=TOP_DIR,
+                               stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def last_run(history_file, host, params):
+    """The last run in `history_file` on `host` with `params`, if any."""
+    last = None
+    if os.path.exists(history_file):
+        with open(history_file) as f:
+            for line in f:
+                run = json.loads(line)
+                if run["host"] == host and run["params"] == params:
+                    last = run
+    return last
+
+
+def regressions(results, prev_results, threshold):
+    """`(engine, stage, prev, now)` of every stage slower per page by more than `threshold`."""
+    slower = []
+    for engine, stages in results.items():
+        for stage, stats in stages.items():
+            prev = prev_results.get(engine, {}).get(stage)
+            if prev and stats["ms_per_page"] > prev["ms_per_page"] * (1 + threshold):
+                slower.append((engine, stage, prev["ms_per_page"], stats["ms_per_page"]))
+    return slower
+
+
+@click.command()
+@click.option('--pdfs', 'num_pdfs', type=click.INT, default=10, help='Number of synthetic pdfs.')
+@click.option('--pages', type=click.INT, default=5, help='Pages per pdf.')
+@click.option('--rows', type=click.INT, default=40, help='Students per page.')
+@click.option('--engine', 'engines', multiple=True,
+              help='Engines to benchmark. All, if not given; tabula is skipped without java.')
+@click.option('--history-file', type=click.Path(dir_okay=False), default=DEFAULT_HISTORY_FILE)
+@click.option('--threshold', type=click.FLOAT, default=0.2,
+              help='Report stages slower per page than the last run by more than this fraction.')
+@click.option('--fail-on-regression', is_flag=True, help='Exit with 1 if any stage regressed.')
+@click.option('--pdf-dir', type=click.Path(file_okay=False), default=None,
+              help='Internal: run a single engine on these pdfs in this process.')
+@click.option('--cold-only', is_flag=True, help='Internal: see `run_engine`.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='Internal: write the timings of a single engine to this file.')
+def main(num_pdfs, pages, rows, engines, history_file, threshold, fail_on_regression, pdf_dir,
+         cold_only, output):
+    if pdf_dir:
+        pdfs = sorted(os.path.join(pdf_dir, name) for name in os.listdir(pdf_dir))
+        timings, num_records = run_engine(engines[0], pdfs, cold_only)
+        with open(output, "w") as f:
+            json.dump(dict(timings=timings, num_records=num_records), f)
+        return
+
+    from parse_results import TABLE_ENGINES
+    engines = list(engines or sorted(TABLE_ENGINES))
+    if "tabula" in engines and shutil.which("java") is None:
+        print("Skipping tabula, java isn't installed")
+        engines.remove("tabula")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="run_benchmarks_") as tmpdir:
+        pdf_dir = os.path.join(tmpdir, "pdfs")
+        os.mkdir(pdf_dir)
+        for num in range(num_pdfs):
+            write_result_pdf(os.path.join(pdf_dir, f"{num:04}.pdf"), pages, rows, seed=num)
+
+        for engine in engines:
+            stats = {}
+            for cold_only in (True, False):
+                caches_dir = tempfile.mkdtemp(prefix="caches_", dir=tmpdir)
+                output = os.path.join(tmpdir, "timings.json")
+                env = dict(os.environ, SUPPLEMENTARY_CACHES_DIR=caches_dir)
+                subprocess.run([sys.executable, realpath(__file__), "--engine", engine,
+                                "--pdf-dir", pdf_dir, "--output", output]
+                               + (["--cold-only"] if cold_only else []),
+                               env=env, check=True)
+                with open(output) as f:
+                    child = json.load(f)
+                for stage, (seconds, num_pages) in child["timings"].items():
+                    stats[stage] = dict(ms_per_page=seconds / num_pages * 1000 if num_pages else None,
+                                        records_per_sec=child["num_records"] / seconds if seconds else None)
+            results[engine] = dict(sorted(stats.items()))
+
+    params = dict(pdfs=num_pdfs, pages=pages, rows=rows)
+    run = dict(timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), revision=git_revision(),
+               host=platform.node(), python=platform.python_version(), params=params,
+               results=results)
+    prev = last_run(history_file, run["host"], params)
+
+    print(f"{num_pdfs} pdfs, {pages} pages, {rows} rows per page")
+    print(f"{'engine':12}{'stage':16}{'ms/page':>10}{'records/s':>12}{'prev ms/page':>14}")
+    for engine, stages in results.items():
+        for stage, stats in stages.items():
+            prev_stats = prev and prev["results"].get(engine, {}).get(stage)
+            prev_ms = f"{prev_stats['ms_per_page']:14.2f}" if prev_stats else f"{'-':>14}"
+            print(f"{engine:12}{stage:16}{stats['ms_per_page']:10.2f}{stats['records_per_sec']:12.0f}"
+                  f"{prev_ms}")
+
+    os.makedirs(dirname(realpath(history_file)), exist_ok=True)
+    with open(history_file, "a") as f:
+        f.write(json.dumps(run, sort_keys=True) + "\n")
+
+    slower = regressions(results, prev["results"], threshold) if prev else []
+    for engine, stage, prev_ms, ms in slower:
+        print(f"Regression: {engine} {stage} {prev_ms:.2f} -> {ms:.2f} ms/page "
+              f"(since {prev['revision']})")
+    if slower and fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Generate DTU style result pdfs locally, without any dependency.
+
+Pages carry the header block shown in `parse_results.parse_metadata`, the 'Sr.No. Name Roll No.'
+table with a 'Max. Marks / Credits' row, names wrapped over two lines, 'Papers Failed' cells
+wrapped over several lines and the 'Date :' footer. Text is laid out in Helvetica at fixed column
+offsets, which is what tabula and pdfplumber see in the real notices.
+"""
+from __future__ import absolute_import, division
+
+import random
+
+
+PAGE_WIDTH, PAGE_HEIGHT = 842, 595
+FONT_SIZE = 7
+LINE_HEIGHT = 11
+
+SUBJECTS = [
+    ('MC-301', 'MODERN ALGEBRA'),
+    ('MC-302', 'OPERATIONS RESEARCH'),
+    ('MC-303', 'FINANCIAL ENGINEERING'),
+    ('MC-304', 'INTERNET & NETWORK SECURITY'),
+    ('MC-305', 'DATABASE MANAGEMENT SYSTEM'),
+    ('MC-306', 'DATABASE MANAGEMENT SYSTEM LAB'),
+    ('MC-307', 'OPERATIONS RESEARCH LAB'),
+    ('MC-308', 'INTERNET & NETWORK SECURITY LAB'),
+    ('MC-309', 'MINOR PROJECT-I'),
+]
+FIRST_NAMES = ["AAKRITI", "AAYUSH", "ABHISHEK", "AMAN", "ANISH", "ARUSHI", "GARIMA", "ISHAAN", "KAPIL"]
+LAST_NAMES = ["MAKKER", "YADAV", "GAUTAM", "PRIYADARSHI", "KUKREJA", "GUPTA", "GARG", "JAIN", "KUMAR"]
+
+# x offsets of the table columns.
+X_SRNO, X_NAME, X_ROLLNO, X_FIRST_SUBJECT, SUBJECT_SPACING = 20, 38, 190, 260, 42
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _content_stream(texts):
+    """PDF content stream drawing each `(x, y, text)` of `texts`."""
+    ops = [f"BT /F1 {FONT_SIZE} Tf"]
+    for x, y, text in texts:
+        ops.append(f"1 0 0 1 {x} {y} Tm ({_escape(text)}) Tj")
+    ops.append("ET")
+    return "\n".join(ops).encode("latin-1")
+
+
+def write_pdf(path, pages):
+    """
+    Write a pdf to `path`.
+
+    :param pages:
+        A list of pages, each a list of `(x, y, text)` in points from the bottom left corner.
+    """
+    objects = {1: None, 2: None, 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+                                   b"/Encoding /WinAnsiEncoding >>"}
+    kids = []
+    for texts in pages:
+        content = _content_stream(texts)
+        content_num, page_num = len(objects) + 1, len(objects) + 2
+        objects[content_num] = (b"<< /Length %d >>\nstream\n" % len(content)) + content + b"\nendstream"
+        objects[page_num] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                             b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+                             % (PAGE_WIDTH, PAGE_HEIGHT, content_num))
+        kids.append(b"%d 0 R" % page_num)
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = len(out)
+        out += b"%d 0 obj\n" % num + objects[num] + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for num in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[num]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def result_pages(num_pages, rows_per_page, wrap_every=7, max_papers_failed_lines=3, seed=0):
+    """
+    Texts of the pages of a result notice of semester V of 2K12 Mathematics and Computing.
+
+    Every `wrap_every`-th student has a name wrapped over two lines, and another one failed
+    enough papers for 'Papers Failed' to wrap over up to `max_papers_failed_lines` lines.
+    """
+    rng = random.Random(seed)
+    x_subjects = [X_FIRST_SUBJECT + i * SUBJECT_SPACING for i in range(len(SUBJECTS))]
+    x_tc = x_subjects[-1] + SUBJECT_SPACING
+    x_spi = x_tc + SUBJECT_SPACING
+    x_papers_failed = x_spi + SUBJECT_SPACING
+
+    pages = []
+    rollno = 0
+    for page_num in range(num_pages):
+        y = PAGE_HEIGHT - 30
+        texts = []
+
+        def line(*cells):
+            nonlocal y
+            texts.extend((x, y, text) for x, text in cells)
+            y -= LINE_HEIGHT
+
+        line((300, "Delhi Technological University"))
+        line((330, "Visit - http://exam.dce.edu"))
+        line((310, "(Formerly Delhi College of Engineering)"))
+        line((20, "No.DTU/Results/BTECH/DEC/2014/"))
+        line((370, "Result Notification"))
+        line((390, "DEC/2014"))
+        line((20, "THE RESULT OF THE CANDIDATES WHO APPEARED IN THE FOLLOWING EXAMINATIONS HELD IN "
+                  "DEC-2014 IS DECLARED AS UNDER : -"))
+        line((20, "Program : Bachelor of Technology Sem : V"))
+        line((20, "Branch :  Mathematics and Computing"))
+        for i in range(0, len(SUBJECTS), 3):
+            line((20, " ".join(f"{code}:{name}" for code, name in SUBJECTS[i:i + 3])))
+        line((20, "TC: Total Credits D: Detained A: Absent RL: Result Later RW: Result Withdrawn"))
+
+        line((X_SRNO, "Sr.No."), (X_NAME, "Name"), (X_ROLLNO, "Roll No."),
+             *zip(x_subjects, (code for code, _ in SUBJECTS)), (x_tc, "TC"), (x_spi, "SPI"))
+        line((X_SRNO, "Max. Marks / Credits"),
+             *zip(x_subjects, ["100/4"] * 5 + ["100/2"] * 3 + ["200/4"]),
+             (x_tc, "30"), (x_papers_failed, "Papers Failed"))
+
+        for row in range(rows_per_page):
+            rollno += 1
+            marks = [rng.randint(10, 100) for _ in SUBJECTS]
+            failed = [code for (code, _), mark in zip(SUBJECTS, marks) if mark < 40]
+            if rollno % wrap_every == 3:
+                num_lines = rng.randint(2, max_papers_failed_lines)
+                failed = [code for code, _ in SUBJECTS[:2 * num_lines]]
+            credits = max(0, 30 - 4 * len(failed))
+            papers_failed = "".join(failed)
+            # Papers failed wrap every 15 characters, e.g. 'MC-305MC-303MC-' / '302MC-301'.
+            papers_failed_lines = [papers_failed[i:i + 15] for i in range(0, len(papers_failed), 15)]
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            name = f"{first}  {last}"
+            wrapped_name = None
+            if rollno % wrap_every == 0:
+                wrapped_name = "BHARDWAJ"
+            line((X_SRNO, str(rollno)), (X_NAME, name), (X_ROLLNO, f"2K12/MC/{rollno}"),
+                 *zip(x_subjects, map(str, marks)), (x_tc, str(credits)),
+                 (x_spi, "{:.2f}".format(sum(marks) / len(marks))),
+                 *([(x_papers_failed, papers_failed_lines[0])] if papers_failed_lines else []))
+            for extra in papers_failed_lines[1:]:
+                line((x_papers_failed, extra))
+            if wrapped_name:
+                line((X_NAME, wrapped_name))
+
+        line((20, "Any discrepancy in the result in r/o name/roll no/registration should be brought to "
+                  "the notice of A.R. (Acad.)/OIC B.Tech. (Eve.) within 15 days of declaration of result."))
+        line((20, f"Date : 06/01/2015 OSD(Results)  __________________________ Deputy/Controller of "
+                  f"Examinations:_________________________ {page_num + 1}/{num_pages}"))
+        pages.append(texts)
+    return pages
+
+
+def write_result_pdf(path, num_pages, rows_per_page, seed=0, **kwargs):
+    """Write a synthetic result pdf to `path`. See `result_pages` for `kwargs`."""
+    write_pdf(path, result_pages(num_pages, rows_per_page, seed=seed, **kwargs))
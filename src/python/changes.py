@@ -0,0 +1,108 @@
+"""
+Journal of the records last written to each DB, so that a run writes only the students whose
+records changed since.
+
+The content hash of the records of a student, see `records.StudentResult.content_hash`, is
+committed to SQLite per DB, roll number, semester and notice once the student is written. A
+student is written again only if one of its records is new or differs from the one written last
+time, e.g. after new notices were added to the corpus or the parser changed.
+
+Usage:
+
+    hashes = WrittenHashes("data/written_hashes.sqlite", target="mongodb://localhost:27017/dtu")
+    record_hashes = timeline_hashes(timeline)
+    if hashes.change(timeline.rollno, record_hashes) != "unchanged":
+        write(timeline)
+        hashes.record({timeline.rollno: record_hashes})
+"""
+from __future__ import absolute_import, division
+
+from   collections              import defaultdict
+import hashlib
+import sqlite3
+import time
+
+
+def timeline_hashes(timeline):
+    """
+    `{(semester, notice): hash}` of the records of a `timelines.StudentTimeline`. The records of
+    a semester and notice spread over several pages or pdfs share one hash.
+    """
+    hashes = defaultdict(list)
+    for semester in timeline.semesters:
+        for result in semester.sources:
+            hashes[(result.page.semester or "", result.page.notice or "")].append(
+                result.content_hash())
+    return {key: values[0] if len(values) == 1 else
+                 hashlib.sha256("".join(sorted(values)).encode("utf-8")).hexdigest()
+            for key, values in hashes.items()}
+
+
+class WrittenHashes(object):
+    """
+    Hashes of the records last written to `target`, e.g. a MongoDB database or a DynamoDB table,
+    keyed by roll number, semester and notice.
+    """
+
+    def __init__(self, path, target):
+        self.path = str(path)
+        self.target = target
+        # Autocommit, so that what was written is durable as soon as it is recorded.
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS written_hashes (
+                target          TEXT,
+                rollno          TEXT,
+                semester        TEXT,
+                notice          TEXT,
+                hash            TEXT,
+                updated_at      REAL,
+                PRIMARY KEY (target, rollno, semester, notice)
+            )""")
+
+    def close(self):
+        self.conn.close()
+
+    def written(self, rollno):
+        """`{(semester, notice): hash}` last written for `rollno`."""
+        return {(semester, notice): hash for semester, notice, hash in self.conn.execute(
+            "SELECT semester, notice, hash FROM written_hashes WHERE target = ? AND rollno = ?",
+            (self.target, rollno))}
+
+    def change(self, rollno, hashes):
+        """
+        'new' if nothing was written for `rollno`, 'updated' if any of `hashes` wasn't written,
+        'unchanged' otherwise. Records written before but missing from `hashes`, e.g. of notices
+        not parsed in this run, don't count as a change: the last write of the student still
+        holds them.
+        """
+        written = self.written(rollno)
+        if not written:
+            return "new"
+        if any(written.get(key) != hash for key, hash in hashes.items()):
+            return "updated"
+        return "unchanged"
+
+    def record(self, written):
+        """
+        Record that the students of `written`, `{rollno: {(semester, notice): hash}}`, were
+        written, in one transaction. The records of those students written before are
+        forgotten, as a write replaces the whole item in some DBs, e.g. DynamoDB: a student
+        written without the records of a notice which failed to parse is written again once
+        they are back.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN")
+        self.conn.executemany("DELETE FROM written_hashes WHERE target = ? AND rollno = ?",
+                              [(self.target, rollno) for rollno in written])
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO written_hashes VALUES (?, ?, ?, ?, ?, ?)",
+            [(self.target, rollno, semester, notice, hash, now)
+             for rollno, hashes in written.items()
+             for (semester, notice), hash in hashes.items()])
+        self.conn.execute("COMMIT")
+
+    def clear(self):
+        """Forget everything written to `target`, e.g. after the DB was dropped."""
+        self.conn.execute("DELETE FROM written_hashes WHERE target = ?", (self.target,))
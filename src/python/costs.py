@@ -0,0 +1,103 @@
+"""
+Estimates of the seconds a task parsing (a range of pages of) a pdf takes, so that the most
+expensive tasks can be submitted first and don't end up as the tail of a run.
+
+The wall-clock time of every task is recorded in SQLite along with the size, mtime and content
+digest of the pdf. A task is estimated to take as long as it did last time if the pdf didn't
+change, and as long as its number of pages times the mean seconds per page of all the recorded
+tasks otherwise.
+
+Pdfs are identified by their path relative to the results dir, like in `progress`, so that pdfs
+of the same name in different directories have costs of their own.
+"""
+from __future__ import absolute_import, division
+
+import os
+from   os.path                  import realpath, relpath
+import sqlite3
+import time
+
+from   utils                    import file_digest, page_numbers, pdf_num_pages
+
+
+DEFAULT_SECONDS_PER_PAGE = 1.0
+"""Seconds per page until some tasks are recorded."""
+
+BYTES_PER_PAGE = 50 * 2**10
+"""Rough size of a page of a result pdf, for files whose pages can't be counted."""
+
+
+def task_num_pages(filepath, pages):
+    """Number of pages parsed by a task, see `parse_results.shard_pages`."""
+    if pages != 'all':
+        return len(page_numbers(pages, None))
+    try:
+        return pdf_num_pages(filepath)
+    except Exception:
+        return max(1, os.path.getsize(filepath) // BYTES_PER_PAGE)
+
+
+class TaskCosts(object):
+    """
+    Usage:
+
+        costs = TaskCosts("data/task_costs.sqlite", root="data/dtu_results")
+        tasks = sorted(tasks, key=lambda task: costs.estimate(*task), reverse=True)
+        ...
+        costs.record(filepath, pages, seconds)
+
+    :param root:
+        The dir of the pdfs, which are recorded under their path relative to it. Under their
+        absolute path if None.
+    """
+
+    def __init__(self, path, root=None):
+        self.path = str(path)
+        self.root = None if root is None else realpath(str(root))
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS task_costs (
+                filename        TEXT,
+                pages           TEXT,
+                size            INTEGER,
+                mtime_ns        INTEGER,
+                digest          TEXT,
+                num_pages       INTEGER,
+                seconds         REAL,
+                updated_at      REAL,
+                PRIMARY KEY (filename, pages)
+            )""")
+        total_seconds, total_pages = self.conn.execute(
+            "SELECT SUM(seconds), SUM(num_pages) FROM task_costs WHERE num_pages > 0").fetchone()
+        self.seconds_per_page = (total_seconds / total_pages if total_pages
+                                 else DEFAULT_SECONDS_PER_PAGE)
+
+    def close(self):
+        self.conn.close()
+
+    def key(self, filepath):
+        """Name of `filepath` in the table."""
+        filepath = realpath(str(filepath))
+        return filepath if self.root is None else relpath(filepath, self.root)
+
+    def estimate(self, filepath, pages='all'):
+        """Estimated seconds to parse `pages` of `filepath`."""
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, digest, seconds FROM task_costs WHERE filename = ? AND pages = ?",
+            (self.key(filepath), pages)).fetchone()
+        if row is not None:
+            size, mtime_ns, digest, seconds = row
+            stat = os.stat(filepath)
+            if ((stat.st_size, stat.st_mtime_ns) == (size, mtime_ns)
+                    or file_digest(filepath) == digest):
+                return seconds
+        return task_num_pages(filepath, pages) * self.seconds_per_page
+
+    def record(self, filepath, pages, seconds):
+        """Record that parsing `pages` of `filepath` took `seconds`, whatever its outcome."""
+        stat = os.stat(filepath)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO task_costs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.key(filepath), pages, stat.st_size, stat.st_mtime_ns, file_digest(filepath),
+             task_num_pages(filepath, pages), seconds, time.time()))
@@ -0,0 +1,271 @@
+"""
+Batched writes to DynamoDB, e.g. to the `dturesults` table read by `app.py`.
+
+`BatchWriter` puts items in `BatchWriteItem` calls of 25 items, the most DynamoDB accepts,
+from a pool of threads. Items left unprocessed by DynamoDB, e.g. when the table is throttled,
+are retried with exponential backoff. The write capacity used by all the threads is kept under
+`max_wcu` write capacity units per second, so that a load doesn't starve the table of its
+provisioned capacity.
+
+Set `endpoint_url` to run against DynamoDB Local or moto instead of AWS, e.g.
+
+    $ docker run -p 8000:8000 amazon/dynamodb-local
+    $ export SUPPLEMENTARY_DYNAMODB_ENDPOINT_URL=http://localhost:8000
+
+Usage:
+
+    client = get_client(endpoint_url="http://localhost:8000")
+    create_table(client, "dturesults", "rollno")
+    with BatchWriter(client, "dturesults", "rollno", num_threads=4, max_wcu=100) as writer:
+        for item in items:
+            writer.put(item)
+    log.info(f"Wrote {writer.num_written} items, {writer.num_failed} failed")
+"""
+from __future__ import absolute_import, division
+
+from   concurrent.futures       import ThreadPoolExecutor
+from   decimal                  import Decimal
+import json
+from   loguru                   import logger as log
+import math
+import os
+import random
+import threading
+import time
+
+import metrics
+
+
+TABLE_NAME = "dturesults"
+KEY = "rollno"
+REGION_NAME = "ap-southeast-1"
+ENDPOINT_URL = os.environ.get("SUPPLEMENTARY_DYNAMODB_ENDPOINT_URL") or None
+
+MAX_BATCH_SIZE = 25
+"""Most items DynamoDB accepts in a `BatchWriteItem` call."""
+
+DEFAULT_NUM_THREADS = 4
+DEFAULT_MAX_RETRIES = 8
+DEFAULT_MAX_WCU = None
+
+RETRYABLE_ERRORS = ("ProvisionedThroughputExceededException", "ThrottlingException",
+                    "RequestLimitExceeded", "InternalServerError", "ServiceUnavailable")
+
+
+def get_client(region_name=REGION_NAME, endpoint_url=ENDPOINT_URL):
+    """A low level DynamoDB client. Clients, unlike resources, may be shared between threads."""
+    import boto3
+    return boto3.client("dynamodb", region_name=region_name, endpoint_url=endpoint_url)
+
+
+def create_table(client, table_name=TABLE_NAME, key=KEY):
+    """Create `table_name` with the string hash key `key`, billed on demand, unless it exists."""
+    try:
+        client.describe_table(TableName=table_name)
+        return
+    except Exception as err:
+        if _error_code(err) != "ResourceNotFoundException":
+            raise
+    client.create_table(TableName=table_name,
+                        KeySchema=[dict(AttributeName=key, KeyType="HASH")],
+                        AttributeDefinitions=[dict(AttributeName=key, AttributeType="S")],
+                        BillingMode="PAY_PER_REQUEST")
+    client.get_waiter("table_exists").wait(TableName=table_name)
+    log.info(f"Created DynamoDB table {table_name!r}")
+
+
+def to_attribute_value(value):
+    """
+    The DynamoDB attribute value of a python value, e.g. `{"N": "85"}` for 85 and
+    `{"M": {"MC-301": {"N": "85"}}}` for a dict of marks. NaN and missing values are NULL.
+    """
+    if hasattr(value, "item") and not isinstance(value, (bytes, str)):
+        value = value.item()    # numpy scalars
+    if value is None:
+        return {"NULL": True}
+    if isinstance(value, bool):
+        return {"BOOL": value}
+    if isinstance(value, (int, float, Decimal)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return {"NULL": True}
+        return {"N": str(Decimal(repr(value)) if isinstance(value, float) else value)}
+    if isinstance(value, str):
+        return {"S": value}
+    if isinstance(value, bytes):
+        return {"B": value}
+    if isinstance(value, dict):
+        return {"M": {str(k): to_attribute_value(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {"L": [to_attribute_value(v) for v in value]}
+    return {"S": str(value)}
+
+
+def from_attribute_value(value):
+    """The python value of a scalar DynamoDB attribute value, e.g. "2K12/MC/45" of `{"S": ...}`."""
+    (kind, value), = value.items()
+    if kind == "N":
+        return Decimal(value)
+    return None if kind == "NULL" else value
+
+
+def to_item(record):
+    """The DynamoDB item of a dict, see `to_attribute_value`."""
+    return {str(k): to_attribute_value(v) for k, v in record.items()}
+
+
+def item_wcu(item):
+    """Write capacity units a put of `item` consumes: one per started KiB."""
+    return max(1, math.ceil(len(json.dumps(item, default=str)) / 1024))
+
+
+def _error_code(err):
+    return getattr(err, "response", {}).get("Error", {}).get("Code")
+
+
+class WriteBudget(object):
+    """A token bucket of write capacity units, shared by threads."""
+
+    def __init__(self, wcu_per_second):
+        self.rate = wcu_per_second
+        self.tokens = wcu_per_second
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, units):
+        """Wait until `units` WCU may be consumed without going over the budget."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= units
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            metrics.observe("dynamodb_budget_wait_seconds", wait)
+            time.sleep(wait)
+
+    def refund(self, units):
+        """Give back `units` acquired but not consumed, e.g. by items left unprocessed."""
+        with self.lock:
+            self.tokens = min(self.rate, self.tokens + units)
+
+
+class BatchWriter(object):
+    """
+    Puts items to `table_name` in batches of `MAX_BATCH_SIZE` from `num_threads` threads.
+
+    Items are dicts of python values, converted with `to_item`. Two items with the same `key`
+    in a batch would fail the whole batch, so the last one wins. At most `2 * num_threads`
+    batches are pending at any time, `put` blocking meanwhile, so that memory doesn't grow with
+    the number of items.
+
+    :param max_wcu:
+        Write capacity units per second all the threads may consume. No limit if None.
+    :param max_retries:
+        Times unprocessed items of a batch are retried before they are counted as failed.
+    """
+
+    def __init__(self, client, table_name=TABLE_NAME, key=KEY, num_threads=DEFAULT_NUM_THREADS,
+                 max_wcu=DEFAULT_MAX_WCU, max_retries=DEFAULT_MAX_RETRIES, base_delay=0.05,
+                 max_delay=5.0):
+        self.client = client
+        self.table_name = table_name
+        self.key = key
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = WriteBudget(max_wcu) if max_wcu else None
+        self.num_written = self.num_failed = 0
+        self.failed_keys = []
+        self._batch = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(2 * num_threads)
+        self._futures = set()
+        self._executor = ThreadPoolExecutor(num_threads, thread_name_prefix="dynamodb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, record):
+        """Put the dict `record`, which must have a `key`."""
+        self._batch[record[self.key]] = to_item(record)
+        if len(self._batch) >= MAX_BATCH_SIZE:
+            self._submit()
+
+    def _submit(self):
+        items, self._batch = list(self._batch.values()), {}
+        self._slots.acquire()
+        future = self._executor.submit(self._write_batch, items)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(lambda future: self._done(future, items))
+
+    def _done(self, future, items):
+        try:
+            failed = future.result()
+        except Exception as err:
+            log.error(f"Failed to write {len(items)} items to DynamoDB: {err!r}")
+            failed = items
+        with self._lock:
+            self._futures.discard(future)
+            self.num_written += len(items) - len(failed)
+            self.num_failed += len(failed)
+            self.failed_keys.extend(from_attribute_value(item[self.key]) for item in failed)
+        self._slots.release()
+
+    def _backoff(self, attempt):
+        # Full jitter, so that throttled threads don't retry in lockstep.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _write_batch(self, items):
+        """Write `items` with `BatchWriteItem`. Returns the items which failed."""
+        requests = [{"PutRequest": {"Item": item}} for item in items]
+        attempt = 0
+        while requests:
+            if self.budget:
+                units = sum(item_wcu(request["PutRequest"]["Item"]) for request in requests)
+                self.budget.acquire(units)
+            try:
+                with metrics.timed("dynamodb_batch_seconds"):
+                    response = self.client.batch_write_item(
+                        RequestItems={self.table_name: requests})
+            except Exception as err:
+                if _error_code(err) not in RETRYABLE_ERRORS or attempt >= self.max_retries:
+                    log.error(f"Failed to write {len(requests)} items to DynamoDB: {err!r}")
+                    metrics.inc("dynamodb_items_total", len(requests), status="failed")
+                    return [request["PutRequest"]["Item"] for request in requests]
+                unprocessed = requests
+            else:
+                unprocessed = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            metrics.inc("dynamodb_items_total", len(requests) - len(unprocessed), status="ok")
+            if self.budget and unprocessed:
+                self.budget.refund(units * len(unprocessed) / len(requests))
+            requests = unprocessed
+            if requests:
+                if attempt >= self.max_retries:
+                    log.error(f"Gave up on {len(requests)} items unprocessed by DynamoDB "
+                              f"after {attempt} retries")
+                    metrics.inc("dynamodb_items_total", len(requests), status="failed")
+                    return [request["PutRequest"]["Item"] for request in requests]
+                metrics.inc("dynamodb_retries_total")
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+        return []
+
+    def flush(self):
+        """Wait for every item put so far to be written."""
+        if self._batch:
+            self._submit()
+        while True:
+            with self._lock:
+                futures = list(self._futures)
+            if not futures:
+                break
+            for future in futures:
+                future.exception()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
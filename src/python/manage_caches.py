@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+Inspect and maintain the extraction caches in `data/caches`.
+
+Sample Run:
+
+$ python src/python/manage_caches.py stats
+$ python src/python/manage_caches.py prune --pdf-dir data/dtu_results
+"""
+from __future__ import absolute_import, division
+
+import click
+from   loguru                   import logger as log
+from   os.path                  import realpath
+
+from   utils                    import (extractor_version, file_digest,
+                                        get_filepaths, get_topdir,
+                                        open_cache)
+
+
+CACHE_NAMES = ("tabula", "pdfplumber")
+
+
+def is_orphaned(key, digests):
+    """
+    An entry is orphaned if its key isn't an `utils.extraction_cache_key`, e.g. the old
+    basename keys, if it was written by another version of the extractor or if no pdf
+    in `digests` has the contents it was extracted from.
+    """
+    if not isinstance(key, tuple) or len(key) != 4:
+        return True
+    extractor, version, digest, _ = key
+    try:
+        if version != extractor_version(extractor):
+            return True
+    except KeyError:
+        return True
+    return digest not in digests
+
+
+def prune_cache(cache, digests, dry_run=False):
+    """Deletes orphaned entries from `cache`. Returns the number of such entries."""
+    orphaned = [key for key in cache.iterkeys() if is_orphaned(key, digests)]
+    if not dry_run:
+        for key in orphaned:
+            cache.delete(key)
+        cache.cull()
+    return len(orphaned)
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option('--reset', is_flag=True, help='Reset the hit/miss counters after printing them.')
+def stats(reset):
+    """Print size and hit/miss counters of every cache."""
+    print(f"{'cache':12}{'entries':>10}{'MiB':>10}{'hits':>10}{'misses':>10}{'hit ratio':>10}")
+    for name in CACHE_NAMES:
+        cache = open_cache(name)
+        hits, misses = cache.stats(reset=reset)
+        ratio = hits / (hits + misses) if hits + misses else 0
+        print(f"{name:12}{len(cache):10}{cache.volume() / 2**20:10.1f}{hits:10}{misses:10}{ratio:10.2f}")
+
+
+@main.command()
+@click.option('--pdf-dir', type=click.Path(file_okay=False, exists=True),
+              default=str(get_topdir() / "data/dtu_results"),
+              help='Entries of pdfs not present in this dir are orphans.')
+@click.option('--dry-run', is_flag=True, help="Only report the number of orphaned entries.")
+def prune(pdf_dir, dry_run):
+    """Delete entries of unknown pdfs, stale extractor versions or old key formats."""
+    digests = {file_digest(filepath) for filepath in get_filepaths(realpath(pdf_dir))
+               if filepath.endswith(".pdf")}
+    log.info(f"Found {len(digests)} distinct pdfs in {pdf_dir!r}")
+    for name in CACHE_NAMES:
+        num_orphaned = prune_cache(open_cache(name), digests, dry_run=dry_run)
+        log.info(f"{name}: {'found' if dry_run else 'pruned'} {num_orphaned} orphaned entries")
+
+
+if __name__ == '__main__':
+    main()
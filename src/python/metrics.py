@@ -0,0 +1,199 @@
+"""
+Counters and histograms of the stages of the ingestion pipeline.
+
+Usage:
+
+    import metrics
+
+    with metrics.timed("tabula_seconds", mode="read"):
+        pages_df = tabula.read_pdf(filepath)
+    metrics.inc("cache_requests_total", cache="tabula", result="miss")
+    metrics.observe("records_per_file", len(records), buckets=metrics.COUNT_BUCKETS)
+
+Every process records to its own `REGISTRY`. `worker_pool.SupervisedPool` sends what a worker
+recorded during a task back to the parent along with the result, see `drain` and `merge`, so
+the parent of a run has the metrics of all its workers and writes them with `write_summary`:
+a JSON summary and a Prometheus textfile, e.g. for the textfile collector of node_exporter.
+"""
+from __future__ import absolute_import, division
+
+from   contextlib               import contextmanager
+import json
+import os
+from   timeit                   import default_timer as timer
+
+
+PREFIX = "supplementary_"
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+"""Default buckets of histograms, in seconds."""
+
+COUNT_BUCKETS = (0, 1, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+"""Buckets of histograms of sizes, e.g. records per file."""
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_key(name, labels):
+    return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+
+class Histogram(object):
+
+    __slots__ = ("buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        # Not cumulative: counts[i] is the number of values in (buckets[i-1], buckets[i]], and
+        # the last one counts the values above all the buckets.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self.max = None
+
+    def observe(self, value):
+        for num, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            num = len(self.buckets)
+        self.counts[num] += 1
+        self.sum += value
+        self.count += 1
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        if other.buckets != self.buckets:
+            raise ValueError(f"Can't merge histograms with buckets {other.buckets} and {self.buckets}")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def __reduce__(self):
+        return _histogram, (self.buckets, self.counts, self.sum, self.count, self.max)
+
+
+def _histogram(buckets, counts, sum, count, max):
+    histogram = Histogram(buckets)
+    histogram.counts, histogram.sum, histogram.count, histogram.max = counts, sum, count, max
+    return histogram
+
+
+class Registry(object):
+    """Counters and histograms, each identified by a name and labels."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        key = _key(name, labels)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(buckets)
+        self.histograms[key].observe(value)
+
+    @contextmanager
+    def timed(self, name, **labels):
+        """Observe the seconds taken by the block in the histogram `name`."""
+        start_ts = timer()
+        try:
+            yield
+        finally:
+            self.observe(name, timer() - start_ts, **labels)
+
+    def drain(self):
+        """Return a picklable copy of the metrics recorded since the last drain, and reset them."""
+        snapshot = (self.counters, self.histograms)
+        self.counters, self.histograms = {}, {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """Add a snapshot returned by `drain`, e.g. in another process."""
+        counters, histograms = snapshot
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, histogram in histograms.items():
+            if key in self.histograms:
+                self.histograms[key].merge(histogram)
+            else:
+                self.histograms[key] = histogram
+
+    def summary(self):
+        """
+        A JSON serializable summary, e.g.
+
+            {
+                "counters"  : {"cache_requests_total{cache=tabula,result=hit}": 12, ...},
+                "histograms": {"tabula_seconds{mode=read}": {"count": 3, "sum": 7.9,
+                                                            "mean": 2.63, "max": 3.1}, ...},
+            }
+        """
+        return dict(
+            counters    = {_format_key(*key): value for key, value in sorted(self.counters.items())},
+            histograms  = {_format_key(*key): dict(count=h.count, sum=h.sum, max=h.max,
+                                                   mean=h.sum / h.count if h.count else None)
+                           for key, h in sorted(self.histograms.items())},
+        )
+
+    def report(self):
+        """One line per histogram of seconds with the total time spent, largest first."""
+        timings = [(h.sum, h.count, name, labels) for (name, labels), h in self.histograms.items()
+                   if name.endswith("_seconds")]
+        return "\n".join(f"{_format_key(name, labels)}: {total:.1f}s over {count}"
+                         for total, count, name, labels in sorted(timings, reverse=True))
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        def fmt(labels, **extra):
+            labels = list(labels) + list(extra.items())
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+        lines = []
+        for kind, metrics in (("counter", self.counters), ("histogram", self.histograms)):
+            names = sorted({name for name, _ in metrics})
+            for name in names:
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                for (metric_name, labels), value in sorted(metrics.items()):
+                    if metric_name != name:
+                        continue
+                    if kind == "counter":
+                        lines.append(f"{PREFIX}{name}{fmt(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + ("+Inf",), value.counts):
+                        cumulative += count
+                        lines.append(f"{PREFIX}{name}_bucket{fmt(labels, le=bound)} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{fmt(labels)} {value.sum}")
+                    lines.append(f"{PREFIX}{name}_count{fmt(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, path):
+        """
+        Write `summary` to `<path>.json` and `prometheus` to `<path>.prom`, each atomically so
+        that a collector never reads a partial file.
+        """
+        for ext, content in ((".json", json.dumps(self.summary(), indent=4)),
+                             (".prom", self.prometheus())):
+            with open(str(path) + ext + ".tmp", "w") as f:
+                f.write(content)
+            os.replace(str(path) + ext + ".tmp", str(path) + ext)
+
+
+REGISTRY = Registry()
+"""Metrics of this process."""
+
+inc             = REGISTRY.inc
+observe         = REGISTRY.observe
+timed           = REGISTRY.timed
+drain           = REGISTRY.drain
+merge           = REGISTRY.merge
+report          = REGISTRY.report
+write_summary   = REGISTRY.write_summary
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""
+Copy the `results` collection of MongoDB to the `dturesults` DynamoDB table read by `app.py`.
+
+Documents are read in pages of `--batch-size` in `_id` order, so that memory doesn't grow with
+the collection, and put by the threads of a `dynamodb.BatchWriter`. The `_id` of a document
+becomes the `rollno` key of its item, and numbers and nested documents become typed attributes,
+see `dynamodb.to_attribute_value`.
+
+After every page is written, its last `_id` is checkpointed to SQLite. A migration which died
+resumes after the last checkpoint, so that at most one page is copied again. A page with items
+DynamoDB failed to write stops the migration before its checkpoint.
+
+Sample Run:
+
+$ python src/python/mongodb_to_dynamodb.py --threads 8 --wcu 500
+$ SUPPLEMENTARY_DYNAMODB_ENDPOINT_URL=http://localhost:8000 \\
+    python src/python/mongodb_to_dynamodb.py --create-table --restart
+"""
+from __future__ import absolute_import, division
+
+from   loguru                   import logger as log
+import sqlite3
+import sys
+import time
+from   timeit                   import default_timer as timer
+
+import click
+
+import dynamodb
+from   utils                    import get_topdir
+from   writers                  import get_db
+
+
+DEFAULT_CHECKPOINT_DB = get_topdir() / "data/migration_checkpoints.sqlite"
+DEFAULT_BATCH_SIZE = 1000
+
+
+class MigrationCheckpoint(object):
+    """
+    The last `_id` copied from a collection to a table, in SQLite.
+
+    Usage:
+
+        checkpoint = MigrationCheckpoint("data/migration_checkpoints.sqlite", "results", "dturesults")
+        last_id, num_migrated = checkpoint.load()
+        ...
+        checkpoint.save(last_id, num_migrated)
+    """
+
+    def __init__(self, path, collection, table_name):
+        self.key = (collection, table_name)
+        # Autocommit, so that each checkpoint is durable as soon as it is saved.
+        self.conn = sqlite3.connect(str(path), isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS migration_checkpoints (
+                collection      TEXT,
+                table_name      TEXT,
+                last_id         TEXT,
+                num_migrated    INTEGER,
+                updated_at      REAL,
+                PRIMARY KEY (collection, table_name)
+            )""")
+
+    def close(self):
+        self.conn.close()
+
+    def load(self):
+        """`(last _id, number of documents migrated)`, `(None, 0)` if nothing was migrated."""
+        from bson import json_util
+        row = self.conn.execute(
+            "SELECT last_id, num_migrated FROM migration_checkpoints "
+            "WHERE collection = ? AND table_name = ?", self.key).fetchone()
+        if row is None:
+            return None, 0
+        # Extended JSON, so that an ObjectId or a number stays one.
+        return json_util.loads(row[0])["_id"], row[1]
+
+    def save(self, last_id, num_migrated):
+        from bson import json_util
+        self.conn.execute(
+            "INSERT OR REPLACE INTO migration_checkpoints VALUES (?, ?, ?, ?, ?)",
+            self.key + (json_util.dumps({"_id": last_id}), num_migrated, time.time()))
+
+    def clear(self):
+        self.conn.execute(
+            "DELETE FROM migration_checkpoints WHERE collection = ? AND table_name = ?", self.key)
+
+
+def iter_pages(collection, after_id=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yields the documents of `collection` with an `_id` greater than `after_id`, in lists of
+    `batch_size` in `_id` order. Each page is a query of its own on the `_id` index, so that
+    no cursor stays open while a page is written.
+    """
+    while True:
+        query = {} if after_id is None else {"_id": {"$gt": after_id}}
+        page = list(collection.find(query).sort("_id", 1).limit(batch_size))
+        if not page:
+            return
+        yield page
+        after_id = page[-1]["_id"]
+
+
+def to_record(document):
+    """The item of a document of the `results` collection, keyed by rollno."""
+    record = {key: value for key, value in document.items() if key != "_id"}
+    record[dynamodb.KEY] = str(document["_id"])
+    return record
+
+
+def migrate(collection, client, table_name=dynamodb.TABLE_NAME, checkpoint=None,
+            batch_size=DEFAULT_BATCH_SIZE, num_threads=dynamodb.DEFAULT_NUM_THREADS,
+            max_wcu=dynamodb.DEFAULT_MAX_WCU):
+    """
+    Copy `collection` to the DynamoDB table `table_name`, resuming after `checkpoint`, a
+    `MigrationCheckpoint`, if given.
+
+    :return:
+        The number of documents migrated, including those of previous runs.
+    """
+    last_id, num_migrated = checkpoint.load() if checkpoint else (None, 0)
+    if last_id is not None:
+        log.info(f"Resuming after _id {last_id!r}, {num_migrated} documents already migrated")
+    start_ts, num_copied = timer(), 0
+    with dynamodb.BatchWriter(client, table_name, dynamodb.KEY, num_threads=num_threads,
+                              max_wcu=max_wcu) as writer:
+        for page in iter_pages(collection, last_id, batch_size):
+            for document in page:
+                writer.put(to_record(document))
+            writer.flush()
+            if writer.num_failed:
+                raise RuntimeError(f"{writer.num_failed} items failed to be written after _id "
+                                   f"{last_id!r}, rerun to resume from there")
+            last_id = page[-1]["_id"]
+            num_copied += len(page)
+            if checkpoint:
+                checkpoint.save(last_id, num_migrated + num_copied)
+            seconds = timer() - start_ts
+            log.info(f"Migrated {num_migrated + num_copied} documents, up to _id {last_id!r} "
+                     f"({num_copied / seconds if seconds else 0:.0f} docs/sec)")
+    return num_migrated + num_copied
+
+
+@click.command()
+@click.option('--collection', type=click.STRING, default="results",
+              help='Collection of the dtu MongoDB database to copy.')
+@click.option('--table', type=click.STRING, default=dynamodb.TABLE_NAME)
+@click.option('--endpoint-url', type=click.STRING, default=dynamodb.ENDPOINT_URL,
+              help='e.g. http://localhost:8000 for DynamoDB Local. '
+                   'Defaults to $SUPPLEMENTARY_DYNAMODB_ENDPOINT_URL, else AWS.')
+@click.option('--batch-size', type=click.IntRange(1), default=DEFAULT_BATCH_SIZE,
+              help='Read this many documents per query and checkpoint after each of them.')
+@click.option('--threads', type=click.IntRange(1), default=dynamodb.DEFAULT_NUM_THREADS,
+              help='Threads sending BatchWriteItem calls.')
+@click.option('--wcu', type=click.IntRange(1), default=dynamodb.DEFAULT_MAX_WCU,
+              help='Write capacity units per second to use at most. No limit by default.')
+@click.option('--checkpoint-db', type=click.Path(dir_okay=False),
+              default=str(DEFAULT_CHECKPOINT_DB))
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and copy every document.')
+@click.option('--create-table', is_flag=True,
+              help='Create the table, billed on demand, if it doesn\'t exist.')
+def main(collection, table, endpoint_url, batch_size, threads, wcu, checkpoint_db, restart,
+         create_table):
+    client = dynamodb.get_client(endpoint_url=endpoint_url)
+    if create_table:
+        dynamodb.create_table(client, table, dynamodb.KEY)
+    checkpoint = MigrationCheckpoint(checkpoint_db, collection, table)
+    try:
+        if restart:
+            checkpoint.clear()
+        num_migrated = migrate(get_db()[collection], client, table, checkpoint, batch_size,
+                               threads, wcu)
+    except RuntimeError as err:
+        log.error(str(err))
+        sys.exit(1)
+    finally:
+        checkpoint.close()
+    log.info(f"Migrated {num_migrated} documents of {collection!r} to {table!r}")
+
+
+if __name__ == '__main__':
+    main()
@@ -23,31 +23,92 @@ Parse results of DTU into the following json structure.
 """
 from __future__ import absolute_import, division
 
-from   concurrent.futures       import as_completed
-from   concurrent.futures.process \
-                                import ProcessPoolExecutor
 import json
 import os
 from   os.path                  import basename, dirname, realpath
+from   functools                import partial
 import re
 import sys
 
-import pandas as pd
-import psutil
 from   timeit                   import default_timer as timer
 
 from   loguru                   import logger as log
 # fmt = "[{time}|{function:}|{line}|{level}] {message}"
 
 sys.path.append(realpath(dirname(__file__)))
-from   utils                    import (get_filepaths, get_topdir,
+from   costs                    import TaskCosts
+import metrics
+from   progress                 import ParseProgress
+from   records                  import PageMetadata, StudentResult
+from   worker_pool              import (DEFAULT_MAX_RSS, DEFAULT_MAX_TASKS_PER_WORKER,
+                                        DEFAULT_TASK_TIMEOUT, SupervisedPool,
+                                        failure_status)
+from   utils                    import (file_digest, get_filepaths, get_topdir,
+                                        get_cache, page_numbers, pdf_num_pages,
+                                        write_ndjson,
                                         pdfplumber_extract_text,
-                                        tabula_read_pdf)
+                                        pdfplumber_extract_texts,
+                                        pdfplumber_read_pdf,
+                                        tabula_prefetch, tabula_read_pdf,
+                                        tabula_read_pdf_with_hints, TableHeaderNotFound)
 
 log.remove()
 log.add(sys.stdout, level="INFO")
 
 
+TABLE_ENGINES = {
+    'tabula'       : tabula_read_pdf,
+    'pdfplumber'   : pdfplumber_read_pdf,
+}
+"""
+Table extraction engines. An engine is called as `engine(filepath, pages)` and returns a list
+of `pandas.DataFrame`, one per page, with the columns `tabula.read_pdf` reads from a DTU result
+page. `sanitize_df` turns them into the same sanitized DataFrame regardless of the engine. An
+engine which can tell a page has no result table returns None for it.
+"""
+
+DEFAULT_ENGINE = 'tabula'
+
+EXTRACTION_STRATEGIES = dict(TABLE_ENGINES, **{
+    'tabula-hints'      : tabula_read_pdf_with_hints,
+    'tabula-lattice'    : partial(tabula_read_pdf, lattice=True),
+})
+"""
+Ways of extracting the tables of a pdf, called like the engines of `TABLE_ENGINES`, which are
+among them.
+"""
+
+FALLBACK_STRATEGIES = {
+    'no_tables'     : ['tabula-hints', 'pdfplumber', 'tabula-lattice'],
+    'bad_columns'   : ['tabula-hints', 'pdfplumber', 'tabula-lattice'],
+    'bad_rows'      : ['pdfplumber', 'tabula-lattice', 'tabula-hints'],
+    'error'         : ['pdfplumber', 'tabula-hints', 'tabula-lattice'],
+}
+"""
+Strategies `parse_dtu_result_pdf` tries, in this order, after a strategy failed with a class of
+failure of `classify_failure`, see `next_strategy`. The area and columns of the hints locate a
+table tabula didn't find and replace a misread header. pdfplumber reads rows from the positions
+of the words, and needs no JVM, e.g. after tabula-java crashed.
+"""
+
+DETERMINISTIC_FAILURES = {'no_tables', 'bad_columns', 'bad_rows'}
+"""Classes of failures which happen again whenever a strategy is run on the same pdf."""
+
+FAILED = "failed"
+STRATEGY_CACHE = "strategies"
+"""
+Cache of the strategy whose tables were sanitized for a pdf, keyed on `(PARSER_VERSION, engine,
+digest, pages)`, so that later runs start with it. `FAILED` if every strategy failed with one of
+the `DETERMINISTIC_FAILURES`.
+"""
+
+DEFAULT_PAGES_PER_TASK = 50
+"""Pdfs with more pages than this are parsed in parallel in tasks of this many pages."""
+
+PARSER_VERSION = "3"
+"""Bump this whenever a change to the parser changes its output, so that all pdfs are parsed again."""
+
+
 SANITIZED_NAME_MAP = {
     'sr.no.name'   : 'name',
     'rollno.'      : 'rollno',
@@ -55,6 +116,42 @@ SANITIZED_NAME_MAP = {
 }
 
 
+def _merge_continuation_rows(df, column):
+    """
+    Fold rows in which only `column` has a value into the closest preceding row
+    that has other values too. Values of `column` are joined with a space, so a
+    cell wrapped over any number of lines ends up in a single row.
+
+    :param df:
+        pandas.DataFrame
+    :param column:
+        Name of the column which may wrap over multiple lines
+    :return:
+        pandas.DataFrame with continuation rows dropped and a fresh RangeIndex
+    """
+    import numpy as np
+    import pandas as pd
+
+    isnull = df.isnull().values
+    col_num = df.columns.get_loc(column)
+    is_continuation = np.delete(isnull, col_num, axis=1).all(axis=1) & ~isnull[:, col_num]
+    # The first row has nothing above it to be folded into.
+    is_continuation[:1] = False
+    if not is_continuation.any():
+        return df.reset_index(drop=True)
+
+    # Position, among the rows that are kept, of the row each continuation folds into.
+    lead_pos = np.cumsum(~is_continuation)[is_continuation] - 1
+    values = df[column].values
+    merged = values[~is_continuation].copy()
+    for pos, value in zip(lead_pos, values[is_continuation]):
+        merged[pos] = value if pd.isnull(merged[pos]) else f"{merged[pos]} {value}"
+
+    df = df[~is_continuation].reset_index(drop=True)
+    df[column] = merged
+    return df
+
+
 def sanitize_df(df):
     """
     Parse and sanitize a DatFrame to have correct values.
@@ -66,6 +163,8 @@ def sanitize_df(df):
     :return:
         Sanitized pandas.DataFrame
     """
+    import pandas as pd
+
     sanitized_names = []
     for x in df.columns:
         new_name = SANITIZED_NAME_MAP.get(x.lower().replace(" ", ""), None)
@@ -80,7 +179,19 @@ def sanitize_df(df):
     # Drop rows which have nan in name column.
     # if df['name'].lower():
     #     import ipdb; ipdb.set_trace()
-    df = df[pd.notnull(df['name']) | pd.notnull(df['papers_failed'])].copy()
+    df = df[pd.notnull(df['name']) | pd.notnull(df['papers_failed'])].reset_index(drop=True)
+
+    """
+    Drop first row. Assert that we are not dropping a random row. First row is expected to be read as:
+
+    0                      NaN  Max. Marks / Credits  100/4  100/4  100/4  100/4  100/4  100/2  100/2  100/2  200/4  30    NaN  Papers Failed
+
+    It is dropped before merging papers failed, so that papers failed which wrapped over from the
+    previous page aren't merged into it. Those are left as the first row, see `fold_continuations`.
+    """
+    if 'Max. Marks / Credits' in df.iloc[0].values:
+        log.debug(f"Dropping first row {df.iloc[0].values.tolist()!r}")
+        df = df.drop(0)
 
     """
     Papers failed in multiple lines must be added to the row above.
@@ -91,31 +202,11 @@ def sanitize_df(df):
     23                    NaN         NaN    NaN    NaN    NaN    NaN    NaN    NaN    NaN    NaN    NaN   NaN    NaN        302MC-301
     25       47 RAJAT  CHOPRA  2K12/MC/51     93     91     88     91     96     78     94     77    184  30.0  90.07              NaN
     """
-    # TODO: Check the behavior when papers_failed span more than 2 lines.
-    drop_indices = []
-    for row_num, row in df.iterrows():
-        row_vals = row.values.tolist()
-        row_vals.remove(row['papers_failed'])
-        if not any([pd.notnull(val) for val in row_vals]) and row_num > 0:
-            drop_indices.append(row_num)
-            df.loc[row_num - 1, 'papers_failed'] = df.loc[row_num - 1, 'papers_failed'] + " " + row['papers_failed']
-    if drop_indices:
-        df = df.drop(drop_indices)
-        df.reset_index(drop=True, inplace=True)
+    df = _merge_continuation_rows(df, 'papers_failed')
 
     log.debug("Deleting column 'Unnamed: 0'.")
     del df['Unnamed: 0']
 
-    """
-    Drop first row. Assert that we are not dropping a random row. First row is expected to be read as:
-
-    0                      NaN  Max. Marks / Credits  100/4  100/4  100/4  100/4  100/4  100/2  100/2  100/2  200/4  30    NaN  Papers Failed
-    """
-    if 'Max. Marks / Credits' in df.iloc[0].values:
-        log.debug(f"Dropping first row {df.iloc[0].values.tolist()!r}")
-        df = df.drop(0)
-    df.reset_index(drop=True, inplace=True)
-
     # Remove number and space from the begining of names. Also replace double spaces with a single space.
     df['name'] = df['name'].apply(lambda x: x.strip("0123456789 ").replace("  ", " ")
     if isinstance(x, str) else x)
@@ -131,20 +222,10 @@ def sanitize_df(df):
     3       KRISHNA KUMAR  2K12/MC/31     47     53     48     49     45     60     88     70     95  30.0  53.13              NaN
     ...
     """
-    drop_indices = []
-    for row_num, row in df.iterrows():
-        row_vals = row.values.tolist()
-        row_vals.remove(row['name'])
-        if not any([pd.notnull(val) for val in row_vals]) and row_num > 0:
-            drop_indices.append(row_num)
-            df.loc[row_num - 1, 'name'] = df.loc[row_num - 1, 'name'] + " " + row['name']
-    if drop_indices:
-        df = df.drop(drop_indices)
-        df.reset_index(drop=True, inplace=True)
-    return df
+    return _merge_continuation_rows(df, 'name')
 
 
-def parse_metadata(filepath, page_num):
+def parse_metadata(filepath, page_num, text=None):
     """
     A typical page for BTech results looks as follows.
     =======================================================
@@ -191,11 +272,17 @@ def parse_metadata(filepath, page_num):
     Date : 06/01/2015 OSD(Results)  __________________________ Deputy/Controller of Examinations:_________________________ 1/3
     =======================================================
 
+    :param filepath:
+        A path to the pdf file
+    :param page_num:
+        0-indexed page number
     :param text:
+        Text of the page, if already extracted. Read with `pdfplumber_extract_text` otherwise.
     :return:
     """
     log.debug(f"Parsing metadata filepath={filepath!r} page={page_num}...")
-    text = pdfplumber_extract_text(filepath, page_num)
+    if text is None:
+        text = pdfplumber_extract_text(filepath, page_num)
 
     res = dict(
         program             = None,
@@ -233,14 +320,119 @@ def parse_metadata(filepath, page_num):
 
     return res
 
-def parse_dtu_result_pdf(filepath):
+class NoTablesFound(ValueError):
+    pass
+
+
+def classify_failure(exc):
+    """
+    Class of the failure of a strategy to extract sanitizable tables:
+
+        no_tables       the strategy found no table or header, i.e. `NoTablesFound`
+        bad_columns     a column wasn't found, e.g. KeyError('name') when the header was misread
+        bad_rows        the rows couldn't be sanitized, e.g. an empty page
+        error           anything else, e.g. tabula-java crashed or the pdf couldn't be read,
+                        which may not happen again
+    """
+    if isinstance(exc, (NoTablesFound, TableHeaderNotFound)):
+        return "no_tables"
+    if isinstance(exc, KeyError):
+        return "bad_columns"
+    if isinstance(exc, (IndexError, AttributeError, TypeError)):
+        return "bad_rows"
+    return "error"
+
+
+def extract_tables(filepath, strategy, pages='all'):
+    """
+    Extract the tables in `pages` of `filepath` with `strategy` of `EXTRACTION_STRATEGIES` and
+    sanitize them. Raises `NoTablesFound` if there are none, or the error sanitizing a page raised.
+
+    :return:
+        A list of `(num, sanitized pandas.DataFrame)`, one per page with a table, `num` being
+        the position of the page among `pages`, e.g. 0 for its first page.
+    """
+    # Use the table extraction strategy to parse the tables in the pdf, the time taken by the
+    # extractor itself is in the 'tabula_seconds' and 'pdfplumber_seconds' metrics.
+    with metrics.timed("extract_seconds", strategy=strategy):
+        # This will be a list of `pandas.DataFrame`
+        pages_df = EXTRACTION_STRATEGIES[strategy](filepath, pages=pages)
+    pages_df = [(num, df) for num, df in enumerate(pages_df) if df is not None]
+    if len(pages_df) == 0:
+        raise NoTablesFound(f"{strategy} found 0 pages in {basename(filepath)!r}")
+
+    log.info(f"Found {len(pages_df)} pages in {filepath}")
+    sanitized_dfs = []
+    for num, df in pages_df:
+        log.debug(f"Sanitizing page no {num}...")
+        try:
+            with metrics.timed("sanitize_seconds"):
+                sanitized_dfs.append((num, sanitize_df(df)))
+        except Exception as exc:
+            log.info(f"{strategy}: page {num} of {basename(filepath)} failed with {exc!r}")
+            raise
+    return sanitized_dfs
+
+
+def next_strategy(engine, failure, tried):
+    """
+    The strategy to try after the strategies in `tried` failed, the last one with the class of
+    failure `failure`: `engine`, then the `FALLBACK_STRATEGIES` of `failure`. None if all of
+    them were tried.
+    """
+    for strategy in [engine] + FALLBACK_STRATEGIES[failure]:
+        if strategy not in tried:
+            return strategy
+    return None
+
+
+def fold_continuations(results):
+    """
+    Fold results which only hold the rest of a name or of the papers failed of the student
+    above them into that student. `sanitize_df` does so within a page; this catches names and
+    papers failed which wrapped over to the next page.
+
+    :param results:
+        A list of `records.StudentResult` in page order.
+    """
+    folded = []
+    for result in results:
+        is_continuation = (result.rollno is None and result.SPI is None
+                           and result.total_credits is None
+                           and all(marks is None for marks in result.marks))
+        if not (folded and is_continuation):
+            folded.append(result)
+            continue
+        above = folded[-1]
+        if result.name is not None:
+            above.name = result.name if above.name is None else f"{above.name} {result.name}"
+        if result.papers_failed is not None:
+            above.papers_failed = (result.papers_failed if above.papers_failed is None
+                                   else f"{above.papers_failed} {result.papers_failed}")
+    return folded
+
+
+def parse_dtu_result_pdf(filepath, engine=DEFAULT_ENGINE, fallback=True, pages='all'):
     """
     Parse a dtu result pdf.
 
+    If the tables extracted by `engine` can't be sanitized, the `FALLBACK_STRATEGIES` of the
+    class of the failure are tried in turn, see `next_strategy`, and the first one whose tables
+    can be sanitized is used. The strategy used is remembered in the `STRATEGY_CACHE`, and tried
+    first when the pdf is parsed again.
+
     :param filepath:
         A path to the pdf file
+    :param engine:
+        Name of the table extraction engine in `TABLE_ENGINES`
+    :param fallback:
+        Only use `engine` if False, e.g. to compare engines.
+    :param pages:
+        'all' or a range of pages like '51-100', 1-indexed, see `parse_pdfs`. Page numbers
+        in the results count from the first page of the range.
     :return:
-        A list of `dict` where each entry is in the following form.
+        A list of `records.StudentResult`. `StudentResult.to_dict` turns each of them into a
+        `dict` in the following form.
 
         results = [
             {
@@ -268,113 +460,340 @@ def parse_dtu_result_pdf(filepath):
     """
     filepath = realpath(filepath)
     log.info(f"Parsing {filepath}")
-
-    # Use tabula to parse the tables in the pdf
     start_ts = timer()
-    # This will be a list of `pandas.DataFrame`
-    pages_df = tabula_read_pdf(filepath, pages='all')
-    log.debug(f"Took {timer() - start_ts} to parse {filepath}")
-
-    if len(pages_df) == 0:
-        raise ValueError(f"tabula found 0 pages in {basename(filepath)!r}")
 
-    log.info(f"Found {len(pages_df)} pages in {filepath}")
-    sanitized_dfs = []
-    for num, df in enumerate(pages_df):
-        log.debug(f"Sanitizing page no {num}...")
-        sanitized_dfs.append(sanitize_df(df))
+    strategy_cache = get_cache(STRATEGY_CACHE)
+    known = None
+    if fallback:
+        key = (PARSER_VERSION, engine, file_digest(filepath), pages)
+        known = strategy_cache.get(key)
+    strategy = known if known not in (None, FAILED) else engine
+
+    errors, failures = {}, set()
+    while strategy is not None:
+        try:
+            sanitized_dfs = extract_tables(filepath, strategy, pages)
+            break
+        except Exception as exc:
+            failure = classify_failure(exc)
+            metrics.inc("strategy_failures_total", strategy=strategy, failure=failure)
+            log.info(f"{strategy} failed on {basename(filepath)}: {failure}: {exc!r}")
+            errors[strategy] = exc
+            failures.add(failure)
+        # Don't try the whole cascade again for a pdf none of the strategies could parse.
+        strategy = (next_strategy(engine, failure, errors) if fallback and known != FAILED
+                    else None)
+    else:
+        # Unless a strategy may succeed next time, e.g. after tabula-java crashed.
+        if fallback and known != FAILED and failures <= DETERMINISTIC_FAILURES:
+            strategy_cache[key] = FAILED
+        # The error of the engine, so that failures are reported as without fallbacks.
+        raise errors[engine]
+    if fallback and strategy != known:
+        strategy_cache[key] = strategy
+    log.debug(f"Took {timer() - start_ts} to parse {filepath} with {strategy}")
     log.info(f"Parsed tables in {filepath}")
 
+    first_page = 0 if pages == 'all' else page_numbers(pages, None)[0]
+    # The page of each table, pages without a table being skipped by the engine.
+    page_nums = [first_page + num for num, _ in sanitized_dfs]
+    # Open the pdf once for all the pages instead of once per page.
+    page_texts = pdfplumber_extract_texts(filepath, page_nums)
+
     parsed_data = []
-    for num, df in enumerate(sanitized_dfs):
+    for num, (_, df), text in zip(page_nums, sanitized_dfs, page_texts):
         log.debug(f"Extracting metadata from page no {num}...")
-        metadata = parse_metadata(filepath, num)
-        for row in json.loads(df.to_json(orient="records")):
-            parsed_data.append(
-            dict(
-                name                = row.pop("name"),
-                rollno              = row.pop("rollno"),
-                program             = metadata["program"],
-                branch              = metadata["branch"],
-                semester            = metadata["semester"],
-                pdf_filename        = basename(filepath),
-                pdf_pagenum         = num,
-                release_date        = metadata["release_date"],
-                examination_date    = metadata["examination_date"],
-                notice              = metadata["notice"],
-                SPI                 = row.pop("SPI"),
-                total_credits       = row.pop("TC"),
-                papers_failed       = row.pop("papers_failed"),
-                marks               = row,
-            )
-        )
+        with metrics.timed("metadata_seconds"):
+            metadata = parse_metadata(filepath, num, text=text)
+        page = PageMetadata(pdf_filename=basename(filepath), pdf_pagenum=num, **metadata)
+        parsed_data.extend(StudentResult.from_df(df, page))
+    parsed_data = fold_continuations(parsed_data)
+
+    metrics.observe("parse_seconds", timer() - start_ts, engine=engine)
+    metrics.observe("pages_per_file", len(sanitized_dfs), buckets=metrics.COUNT_BUCKETS)
+    metrics.observe("records_per_file", len(parsed_data), buckets=metrics.COUNT_BUCKETS)
+    metrics.inc("pdfs_by_strategy_total", strategy=strategy)
+    if strategy != engine:
+        metrics.inc("recovered_records_total", len(parsed_data))
     return parsed_data
 
 
+def shard_pages(filepath, pages_per_task):
+    """
+    Page ranges of the tasks parsing `filepath`, i.e. ['all'] unless it has more than
+    `pages_per_task` pages, e.g. ['1-50', '51-100', '101-120'].
+    """
+    try:
+        num_pages = pdf_num_pages(filepath) if pages_per_task else 0
+    except Exception:
+        # Not a pdf, which is reported by the task parsing it.
+        num_pages = 0
+    if num_pages <= pages_per_task:
+        return ['all']
+    return [f"{first + 1}-{min(first + pages_per_task, num_pages)}"
+            for first in range(0, num_pages, pages_per_task)]
+
+
+def parse_pdfs(pool, filepaths, engine=DEFAULT_ENGINE, pages_per_task=DEFAULT_PAGES_PER_TASK,
+               costs=None):
+    """
+    Parse `filepaths` with the `worker_pool.SupervisedPool` `pool` and yield
+    `(filepath, results, error)` as each pdf is parsed, like `SupervisedPool.run`.
+
+    Pdfs with more than `pages_per_task` pages are split into tasks of that many pages, see
+    `shard_pages`, so that a few large pdfs don't keep a single worker busy while the others
+    are idle. The tables of every range of pages are cached separately. The results of the
+    ranges are merged back in page order and names or papers failed which wrapped over from
+    one range to the next are folded into their student, see `fold_continuations`. A pdf
+    fails with the first error of any of its ranges.
+
+    :param costs:
+        If given, a `costs.TaskCosts`. Tasks are submitted in decreasing order of their
+        estimated cost, so that the run doesn't end with a long task on a single worker, and
+        the time every task took is recorded for the next runs.
+    """
+    shards = {filepath: shard_pages(filepath, pages_per_task) for filepath in filepaths}
+    num_sharded = sum(len(pages) > 1 for pages in shards.values())
+    if num_sharded:
+        log.info(f"Splitting {num_sharded} pdfs into tasks of {pages_per_task} pages")
+
+    tasks = [(filepath, pages) for filepath in filepaths for pages in shards[filepath]]
+    if costs:
+        estimates = {task: costs.estimate(*task) for task in tasks}
+        tasks.sort(key=estimates.get, reverse=True)
+        log.info(f"Estimated {sum(estimates.values()) / pool.num_workers / 60:.1f} minutes of "
+                 f"work per worker, longest task {max(estimates.values(), default=0):.0f}s")
+
+    parsed, failed = {}, set()
+
+    def args():
+        for filepath, pages in tasks:
+            if filepath not in failed:
+                yield (filepath, pages), (filepath, engine, True, pages)
+
+    for (filepath, pages), results, exc in pool.run(parse_dtu_result_pdf, args()):
+        seconds = pool.task_seconds.pop((filepath, pages))
+        if costs:
+            costs.record(filepath, pages, seconds)
+        if filepath in failed:
+            continue
+        if isinstance(exc, NoTablesFound) and len(shards[filepath]) > 1:
+            # Pages without tables, e.g. the last page of a notice with only signatures.
+            results, exc = [], None
+        if exc:
+            failed.add(filepath)
+            parsed.pop(filepath, None)
+            yield filepath, None, exc
+            continue
+        parsed.setdefault(filepath, {})[pages] = results
+        if len(parsed[filepath]) < len(shards[filepath]):
+            continue
+        by_pages = parsed.pop(filepath)
+        results = fold_continuations([result for pages in shards[filepath]
+                                      for result in by_pages[pages]])
+        if results:
+            yield filepath, results, None
+        else:
+            yield filepath, None, NoTablesFound(f"{engine} found 0 pages in {basename(filepath)!r}")
+
+
+def prefetch_tables(filepaths, batch_size, pool=None):
+    """
+    Warm the tabula cache for `filepaths` using `utils.tabula_prefetch`, i.e. one JVM per
+    batch of `batch_size` pdfs instead of one JVM per pdf.
+
+    :param pool:
+        If given, batches are extracted in parallel by this `worker_pool.SupervisedPool`,
+        with a timeout of `batch_size` times the timeout of a task of the pool.
+    """
+    batches = [filepaths[i:i + batch_size] for i in range(0, len(filepaths), batch_size)]
+    log.info(f"Prefetching tables of {len(filepaths)} pdfs in {len(batches)} batches")
+    if pool:
+        tasks = ((num, (batch,)) for num, batch in enumerate(batches))
+        batch_timeout = pool.task_timeout and pool.task_timeout * batch_size
+        for num, num_extracted, exc in pool.run(tabula_prefetch, tasks, task_timeout=batch_timeout):
+            if exc:
+                log.error(f"Failed to prefetch a batch of {len(batches[num])} pdfs: {exc!r}")
+            else:
+                log.info(f"Prefetched tables of {num_extracted} pdfs")
+    else:
+        for batch in batches:
+            log.info(f"Prefetched tables of {tabula_prefetch(batch)} pdfs")
+
+
+def _stale_records(filepaths, all_filepaths):
+    """
+    `(file names, pdfs)`: the `pdf_filename` of the records to drop from a previous dump when
+    `filepaths` are parsed again, and the pdfs of `all_filepaths` which must be parsed again
+    too. A record only names the file of its pdf, so the records of a pdf can't be told from
+    those of a pdf of the same name in another dir, which is parsed again as well.
+    """
+    stale = {basename(filepath) for filepath in filepaths}
+    parsed = set(filepaths)
+    siblings = [filepath for filepath in all_filepaths
+                if basename(filepath) in stale and filepath not in parsed]
+    return stale, siblings
+
+
+def _drop_records(dump_file, stale=None):
+    """
+    Rewrite `dump_file` atomically without the records whose `pdf_filename` is in `stale`, or
+    without any record if None. A last line cut short, i.e. by a run killed while writing it,
+    is dropped as well, its pdf not being journaled as parsed.
+    """
+    tmp = str(dump_file) + ".tmp"
+    with open(tmp, "w") as out:
+        if stale is not None and os.path.exists(dump_file):
+            with open(dump_file) as f:
+                for line in f:
+                    if (line.endswith("\n") and line.strip()
+                            and json.loads(line)["pdf_filename"] not in stale):
+                        out.write(line)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp, str(dump_file))
+
+
 def parse_all_pdf(dirpath=get_topdir() / "data/dtu_results",
                   parallel=False,
-                  num_processes=psutil.cpu_count(logical=True),
+                  num_processes=os.cpu_count(),
                   progress_file=get_topdir() / "etc/parse_progress.json",
                   refresh_progress_file=False,
-                  dump_parsed_data_file=get_topdir() / "data/parsed_data.json"):
-    """Parse all pdf results available in `dirpath`"""
-    res = []
-    progress_history = {}
-    if not refresh_progress_file and progress_file and os.path.exists(progress_file):
-        progress_file = realpath(progress_file)
-        log.info("Reading previous parsing progress from {!r}".format(progress_file))
-        with open(progress_file, "r") as f:
-            progress_history = json.load(f)
-
-    curr_progress = {}
-
-    if parallel:
-        with ProcessPoolExecutor(max_workers=num_processes) as executor:
-            future_to_pdf = {}
-            for filepath in get_filepaths(realpath(dirpath)):
-                if progress_history.get(basename(filepath), False) is True:
-                    curr_progress[basename(filepath)] = True
-                    continue
-                else:
-                    future_to_pdf[executor.submit(parse_dtu_result_pdf,
-                                                  os.path.join(dirpath, filepath))] = filepath
-            for future in as_completed(future_to_pdf):
-                filepath = future_to_pdf[future]
-                try:
-                    res_filename = future.result()
-                    log.info(f"Successfully parsed {filepath!r}")
-                    curr_progress[basename(filepath)] = True
-                    res.extend(res_filename)
-                except KeyboardInterrupt:
-                    raise
-                except Exception as exc:
-                    log.error(f"Failed to parse {basename(filepath)}: {exc}")
-                    curr_progress[basename(filepath)] = repr(exc)
-    else:
-        # Enables interactive debugging on errors
-        for filepath in get_filepaths(realpath(dirpath)):
-            if progress_history.get(basename(filepath), False) is True:
-                curr_progress[basename(filepath)] = True
-            else:
+                  dump_parsed_data_file=get_topdir() / "data/parsed_data.ndjson",
+                  tabula_batch_size=0,
+                  engine=DEFAULT_ENGINE,
+                  progress_db=get_topdir() / "data/parse_progress.sqlite",
+                  task_timeout=DEFAULT_TASK_TIMEOUT,
+                  max_worker_rss=DEFAULT_MAX_RSS,
+                  max_tasks_per_worker=DEFAULT_MAX_TASKS_PER_WORKER,
+                  metrics_file=get_topdir() / "data/parse_metrics",
+                  pages_per_task=DEFAULT_PAGES_PER_TASK,
+                  costs_db=get_topdir() / "data/task_costs.sqlite"):
+    """
+    Parse all pdf results available in `dirpath`
+
+    :param progress_file:
+        The outcome of every pdf is exported to this file as `{<filename>: True | <error>}` at the end.
+    :param refresh_progress_file:
+        Parse all the pdfs, even those `progress_db` says are parsed already.
+    :param tabula_batch_size:
+        If non-zero, extract the tables of that many pdfs per JVM before parsing,
+        see `prefetch_tables`. Only used with the tabula engine.
+    :param engine:
+        Name of the table extraction engine in `TABLE_ENGINES`
+    :param dump_parsed_data_file:
+        The records of every pdf are written to this file as newline delimited JSON as soon
+        as the pdf is parsed, and synced to disk before the pdf is journaled as parsed in
+        `progress_db`. Read it back lazily with `utils.iter_ndjson`. The records of the pdfs
+        which aren't parsed again are kept, and those of the pdfs parsed again are replaced,
+        see `_stale_records`.
+    :param progress_db:
+        SQLite journal, see `progress.ParseProgress`. The outcome of every pdf is committed as
+        soon as it is known, and only new, changed or previously failed pdfs are parsed.
+    :param task_timeout:
+        With `parallel`, seconds after which parsing a pdf is abandoned and recorded with the
+        status 'timeout'.
+    :param max_worker_rss:
+        With `parallel`, bytes of memory after which a worker is killed ('memory' status if it
+        was parsing) or replaced.
+    :param max_tasks_per_worker:
+        With `parallel`, replace a worker by a fresh process after parsing this many pdfs.
+    :param metrics_file:
+        The `metrics` of the run, including those of the workers, are written to
+        `<metrics_file>.json` and `<metrics_file>.prom` at the end.
+    :param pages_per_task:
+        With `parallel`, pdfs with more pages than this are parsed in tasks of this many pages,
+        see `parse_pdfs`. 0 disables it.
+    :param costs_db:
+        With `parallel`, SQLite file of the seconds every task took, see `costs.TaskCosts`.
+        The tasks expected to take the longest are submitted first.
+    :return:
+        Number of records parsed.
+    """
+    num_records = 0
+    start_ts = timer()
+    parser_version = f"{PARSER_VERSION}/{engine}"
+    progress = ParseProgress(progress_db, root=dirpath)
+    log.info(f"Recording parsing progress in {str(progress_db)!r}")
+
+    all_filepaths = get_filepaths(realpath(dirpath))
+    filepaths = [filepath for filepath in all_filepaths
+                 if refresh_progress_file or progress.needs_parse(filepath, parser_version)]
+    log.info(f"Parsing {len(filepaths)} new, changed or previously failed pdfs")
+
+    dump_file = None
+    if dump_parsed_data_file:
+        # The previous records of the pdfs parsed again are dropped before their new ones are
+        # appended. The pdfs are forgotten first, so that a run killed in between leaves them
+        # to be parsed by the next one.
+        stale, siblings = _stale_records(filepaths, all_filepaths)
+        filepaths += siblings
+        for filepath in filepaths:
+            progress.forget(filepath)
+        _drop_records(dump_parsed_data_file, None if refresh_progress_file else stale)
+        dump_file = open(dump_parsed_data_file, "a")
+
+    def on_success(filepath, records):
+        if dump_file:
+            write_ndjson((record.to_dict() for record in records), dump_file)
+            # On disk before the pdf is journaled as parsed, so that a killed run is resumed
+            # without losing the records of the pdfs it parsed.
+            os.fsync(dump_file.fileno())
+        progress.record(filepath, parser_version, num_records=len(records))
+        metrics.inc("pdfs_total", status="ok")
+        metrics.inc("records_total", len(records))
+        return len(records)
+
+    def on_failure(filepath, exc):
+        log.error(f"Failed to parse {basename(filepath)}: {exc!r}")
+        progress.record(filepath, parser_version, error=exc, status=failure_status(exc))
+        metrics.inc("pdfs_total", status=failure_status(exc))
+
+    try:
+        if parallel:
+            pool = SupervisedPool(num_processes,
+                                  task_timeout=task_timeout,
+                                  max_rss=max_worker_rss,
+                                  max_tasks_per_worker=max_tasks_per_worker)
+            costs = TaskCosts(costs_db, root=dirpath)
+            try:
+                if tabula_batch_size and engine == 'tabula':
+                    # Tables of pdfs split into ranges of pages are cached per range instead.
+                    prefetch_tables([f for f in filepaths if shard_pages(f, pages_per_task) == ['all']],
+                                    tabula_batch_size, pool=pool)
+                for filepath, res_filename, exc in parse_pdfs(pool, filepaths, engine, pages_per_task,
+                                                              costs=costs):
+                    if exc:
+                        on_failure(filepath, exc)
+                    else:
+                        log.info(f"Successfully parsed {filepath!r}")
+                        num_records += on_success(filepath, res_filename)
+            finally:
+                costs.close()
+        else:
+            if tabula_batch_size and engine == 'tabula':
+                prefetch_tables(filepaths, tabula_batch_size)
+            # Enables interactive debugging on errors
+            for filepath in filepaths:
                 try:
-                    res.extend(parse_dtu_result_pdf(filepath))
-                    curr_progress[basename(filepath)] = True
+                    res_filename = parse_dtu_result_pdf(filepath, engine)
                 except KeyboardInterrupt:
                     raise
                 except Exception as exc:
-                    log.error(f"Failed to parse {basename(filepath)}: {exc}")
-                    curr_progress[basename(filepath)] = repr(exc)
+                    on_failure(filepath, exc)
                     import ipdb; ipdb.set_trace()
-
-    with open(progress_file, "w+") as f:
-        json.dump(curr_progress, f, indent=4, sort_keys=True)
-
-    if dump_parsed_data_file:
-        with open(dump_parsed_data_file, "w") as f:
-            json.dump(res, f, indent=4, sort_keys=True)
-
-    return res
-
-
-
-
+                else:
+                    num_records += on_success(filepath, res_filename)
+    finally:
+        if dump_file:
+            dump_file.close()
+        if progress_file:
+            progress.export_json(progress_file)
+        progress.close()
+        metrics.inc("run_seconds_total", timer() - start_ts)
+        log.info(f"Time spent per stage:\n{metrics.report()}")
+        if metrics_file:
+            metrics.write_summary(metrics_file)
+            log.info(f"Wrote metrics to {str(metrics_file)!r}.json and .prom")
+
+    return num_records
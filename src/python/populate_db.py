@@ -1,113 +1,122 @@
 #!/usr/bin/env python
 
 """
-This script populates a local MongoDB instance.
+This script populates the DB, a local MongoDB instance by default, see `writers`.
 """
 from __future__ import absolute_import, division
 
-from   concurrent.futures       import as_completed
-from   concurrent.futures.process \
-                                import ProcessPoolExecutor
-
 import click
-import json
+import itertools
 from   loguru                   import logger as log
 import os
 from   os.path                  import realpath
-import psutil
-from   pymongo                  import MongoClient
 import time
-
-from   parse_results            import parse_dtu_result_pdf
-from   utils                    import get_filepaths
-
-
-MAX_NUM_PROCESSES = psutil.cpu_count(logical=True)
-
-client = MongoClient(host="localhost", port=27017)
-db = client.dtu
-
-
-def parse_and_populate_db(pdf):
+from   timeit                   import default_timer as timer
+
+from   costs                    import TaskCosts
+import dynamodb
+import metrics
+from   parse_results            import (DEFAULT_ENGINE, DEFAULT_PAGES_PER_TASK,
+                                        TABLE_ENGINES, parse_dtu_result_pdf, parse_pdfs,
+                                        prefetch_tables, shard_pages)
+from   records                  import StudentResult
+from   utils                    import get_filepaths, get_topdir, iter_ndjson
+from   worker_pool              import (DEFAULT_MAX_RSS, DEFAULT_MAX_TASKS_PER_WORKER,
+                                        DEFAULT_TASK_TIMEOUT, SupervisedPool,
+                                        failure_status)
+from   writers                  import (DEFAULT_BATCH_SIZE, DEFAULT_QUEUE_SIZE, WRITERS,
+                                        DynamoDBWriter, MongoWriter, NdjsonWriter,
+                                        WriterProcess)
+
+
+MAX_NUM_PROCESSES = os.cpu_count()
+
+def parse_and_populate_db(pdf, writer, engine=DEFAULT_ENGINE):
+    """Parse `pdf` and send its records to the `writers.WriterProcess` `writer`."""
     if not pdf.endswith(".pdf"):
         return
     try:
-        df_list = parse_dtu_result_pdf(pdf)
+        results = parse_dtu_result_pdf(pdf, engine)
         log.info(f"{pdf}: Parsing OK")
+        metrics.inc("pdfs_total", status="ok")
     except Exception as err:
         log.error(f"{pdf}: Failed to parse: {err!r}")
+        metrics.inc("pdfs_total", status="failed")
         return
+    writer.put(results)
 
-    for df in df_list:
-        try:
-            insert_df_to_mongodb(df)
-            log.info(f"{pdf}: Inserted to DB")
-        except Exception as err:
-            log.error(f"{pdf}: Failed to insert a page to DB: {err!r}")
 
-
-def insert_df_to_mongodb(df):
+def populate_db(dirname=None, filepath=None, tabula_batch_size=0, engine=DEFAULT_ENGINE,
+                parsed_file=None, task_timeout=DEFAULT_TASK_TIMEOUT, max_worker_rss=DEFAULT_MAX_RSS,
+                max_tasks_per_worker=DEFAULT_MAX_TASKS_PER_WORKER,
+                pages_per_task=DEFAULT_PAGES_PER_TASK,
+                costs_db=get_topdir() / "data/task_costs.sqlite", writer=None,
+                batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE, hashes_db=None,
+                force=False):
     """
-    :param df:
-        pandas.DataFrame
-    :return:
+    Populate the DB from a pdf, a directory of pdfs or the output of `parse_results.parse_all_pdf`.
+
+    The pdfs of a directory are parsed in parallel, large ones in tasks of `pages_per_task`
+    pages, see `parse_results.parse_pdfs`. The tasks expected to take the longest, according
+    to the timings recorded in `costs_db` by previous runs, are submitted first.
+
+    The records of every pdf are sent to a `writers.WriterProcess`, which merges them into one
+    timeline per student, see `timelines`, and writes the students in batches of `batch_size`
+    with `writer` while the other pdfs are parsed. The latest notice of a student wins
+    whatever the order the pdfs were parsed in. At most `queue_size` pdfs wait for the writer,
+    parsing being held back meanwhile.
+
+    Given `hashes_db`, the students whose records are the same as when they were last written
+    to the DB are skipped, see `changes`, unless `force`.
+
+    :param writer:
+        One of `writers.WRITERS`, `writers.MongoWriter` by default.
     """
-    for i, _row in df.iterrows():
-        row = json.loads(_row.to_json()) # find a better way
-        row.pop("TC", None)
-        row.pop("SPI", None)
-        row.pop("papers_failed", None)
-        name = row.pop("name", None)
-        if not name:
-            log.error(f"name not present in row {_row.to_dict()!r}, SKIPPING...")
-            continue
-        collection_id = row.pop("roll_no")
-        if not collection_id:
-            log.error(f"roll_no not present in row {_row.to_dict()!r}, SKIPPING...")
-            continue
-        # row = {k:int(v) for k,v in row.items()}
-        row["name"] = name
-        row["_id"] = collection_id
-        log.debug("Inserting {}".format(row))
-        db.results.find_one_and_update(
-            filter = {
-                "_id": collection_id
-            },
-            update = {
-                "$set": row
-            },
-            upsert=True
-        )
-
-
-DYNAMODB = None
-def insert_df_to_dynamodb(df):
-    if not DYNAMODB:
-        import boto3
-        global  DYNAMODB
-        DYNAMODB = boto3.resource('dynamodb', region_name="ap-southeast-1")
-
-
-def populate_db(dirname=None, filepath=None):
-    if dirname and filepath:
-        raise ValueError("Specify either filename or dirname")
-    if filepath:
-        if not filepath.endswith(".pdf"):
-            log.warning("{!r} isn't a pdf file.")
-            return
-        parse_and_populate_db(filepath)
-    else:
-        with ProcessPoolExecutor(max_workers=MAX_NUM_PROCESSES) as executor:
-            future_to_pdf = {executor.submit(parse_and_populate_db, filepath): filepath
-                             for filepath in get_filepaths(realpath(dirname))}
-            for future in as_completed(future_to_pdf):
-                filename = future_to_pdf[future]
-                try:
-                    future.result()
-                except Exception as exc:
-                    log.error(repr(exc))
-                else:
-                    log.info(f"Successfully parsed {filename!r}")
+    if sum(bool(x) for x in (dirname, filepath, parsed_file)) > 1:
+        raise ValueError("Specify either filename, dirname or parsed_file")
+    if filepath and not filepath.endswith(".pdf"):
+        log.warning("{!r} isn't a pdf file.")
+        return
+    writer = WriterProcess(writer or MongoWriter(batch_size), batch_size, queue_size,
+                           hashes_db=hashes_db, force=force)
+    with writer:
+        if parsed_file:
+            # Stream records from the output of `parse_results.parse_all_pdf`.
+            records = (StudentResult.from_dict(record) for record in iter_ndjson(parsed_file))
+            for results in iter(lambda: list(itertools.islice(records, batch_size)), []):
+                writer.put(results)
+        elif filepath:
+            parse_and_populate_db(filepath, writer, engine)
+        else:
+            parse_dir(dirname, writer, tabula_batch_size, engine, task_timeout, max_worker_rss,
+                      max_tasks_per_worker, pages_per_task, costs_db)
+
+
+def parse_dir(dirname, writer, tabula_batch_size, engine, task_timeout, max_worker_rss,
+              max_tasks_per_worker, pages_per_task, costs_db):
+    """Parse the pdfs in `dirname` in parallel and send their records to `writer`."""
+    filepaths = [f for f in get_filepaths(realpath(dirname)) if f.endswith(".pdf")]
+    pool = SupervisedPool(MAX_NUM_PROCESSES,
+                          task_timeout=task_timeout,
+                          max_rss=max_worker_rss,
+                          max_tasks_per_worker=max_tasks_per_worker)
+    costs = TaskCosts(costs_db, root=dirname)
+    try:
+        if tabula_batch_size and engine == 'tabula':
+            prefetch_tables([f for f in filepaths if shard_pages(f, pages_per_task) == ['all']],
+                            tabula_batch_size, pool=pool)
+        for filename, results, exc in parse_pdfs(pool, filepaths, engine, pages_per_task,
+                                                 costs=costs):
+            if exc:
+                log.error(f"{filename}: {failure_status(exc)}: {exc!r}")
+                metrics.inc("pdfs_total", status=failure_status(exc))
+                continue
+            log.info(f"Successfully parsed {filename!r}")
+            metrics.inc("pdfs_total", status="ok")
+            # Blocks while the writer is behind, which holds back new tasks of the pool.
+            writer.put(results)
+    finally:
+        costs.close()
 
 
 @click.command()
@@ -115,14 +124,84 @@ def populate_db(dirname=None, filepath=None):
               help='Populate DB using this DTU result file.')
 @click.option('--dir', type=click.Path(file_okay=False),
               help='Populate DB using all the DTU result files in this dir.')
+@click.option('--parsed-file', type=click.Path(dir_okay=False, exists=True),
+              help='Populate DB from the newline delimited JSON written by parse_results.parse_all_pdf.')
 @click.option('--logfile', type=click.STRING,
              help='Ouput logs to this file. Default is a rendom file in /tmp.')
-def main(file, dir, logfile):
+@click.option('--tabula-batch-size', type=click.INT, default=0,
+              help='Extract tables of this many pdfs per JVM before parsing. 0 disables batching.')
+@click.option('--engine', type=click.Choice(sorted(TABLE_ENGINES)), default=DEFAULT_ENGINE,
+              help='Table extraction engine.')
+@click.option('--timeout', type=click.INT, default=DEFAULT_TASK_TIMEOUT,
+              help='Seconds after which a pdf is abandoned.')
+@click.option('--max-worker-rss-mb', type=click.INT, default=DEFAULT_MAX_RSS // 2**20,
+              help='Kill or replace a worker, including its JVM, using more memory than this.')
+@click.option('--max-tasks-per-worker', type=click.INT, default=DEFAULT_MAX_TASKS_PER_WORKER,
+              help='Replace a worker by a fresh process after this many pdfs.')
+@click.option('--pages-per-task', type=click.INT, default=DEFAULT_PAGES_PER_TASK,
+              help='Parse pdfs with more pages than this in tasks of this many pages. 0 disables it.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False),
+              default=str(get_topdir() / "data/populate_db_metrics"),
+              help='Write metrics of the run to <metrics-file>.json and <metrics-file>.prom.')
+@click.option('--costs-db', type=click.Path(dir_okay=False),
+              default=str(get_topdir() / "data/task_costs.sqlite"),
+              help='Seconds taken by every task in previous runs, to submit the longest first.')
+@click.option('--writer', type=click.Choice(sorted(WRITERS)), default="mongo",
+              help='Write the students to MongoDB, DynamoDB or a newline delimited JSON file.')
+@click.option('--output', type=click.Path(dir_okay=False),
+              default=str(get_topdir() / "data/timelines.ndjson"),
+              help='File written by the ndjson writer.')
+@click.option('--dynamodb-table', type=click.STRING, default=dynamodb.TABLE_NAME,
+              help='Table written by the dynamodb writer.')
+@click.option('--dynamodb-endpoint-url', type=click.STRING, default=dynamodb.ENDPOINT_URL,
+              help='e.g. http://localhost:8000 for DynamoDB Local. '
+                   'Defaults to $SUPPLEMENTARY_DYNAMODB_ENDPOINT_URL, else AWS.')
+@click.option('--dynamodb-threads', type=click.IntRange(1), default=dynamodb.DEFAULT_NUM_THREADS,
+              help='Threads sending BatchWriteItem calls.')
+@click.option('--dynamodb-wcu', type=click.IntRange(1), default=dynamodb.DEFAULT_MAX_WCU,
+              help='Write capacity units per second the dynamodb writer may use. No limit by default.')
+@click.option('--dynamodb-create-table', is_flag=True,
+              help='Create the table, billed on demand, if it doesn\'t exist.')
+@click.option('--batch-size', type=click.IntRange(1), default=DEFAULT_BATCH_SIZE,
+              help='Write this many documents per bulk write to the DB.')
+@click.option('--queue-size', type=click.IntRange(1), default=DEFAULT_QUEUE_SIZE,
+              help='Hold back parsing while this many pdfs wait to be written.')
+@click.option('--hashes-db', type=click.Path(dir_okay=False),
+              default=str(get_topdir() / "data/written_hashes.sqlite"),
+              help='Hashes of the records written to each DB, to skip unchanged students.')
+@click.option('--force', is_flag=True,
+              help='Write every student, e.g. after the DB was dropped, even if unchanged.')
+def main(file, dir, parsed_file, logfile, tabula_batch_size, engine, timeout, max_worker_rss_mb,
+         max_tasks_per_worker, pages_per_task, metrics_file, costs_db, writer, output,
+         dynamodb_table, dynamodb_endpoint_url, dynamodb_threads, dynamodb_wcu,
+         dynamodb_create_table, batch_size, queue_size, hashes_db, force):
     logfile = f"~/tmp/populate_db.{time.time()}.{os.getpid()}.log" if not logfile else logfile
     logfile = realpath(logfile)
     log.add(sink=open(logfile, "w"), level="INFO")
     log.info(f"Writing logs to {logfile}")
-    populate_db(dirname=dir, filepath=file)
+    if writer == "ndjson":
+        writer = NdjsonWriter(output)
+    elif writer == "dynamodb":
+        writer = DynamoDBWriter(dynamodb_table, endpoint_url=dynamodb_endpoint_url,
+                                num_threads=dynamodb_threads, max_wcu=dynamodb_wcu,
+                                create_table=dynamodb_create_table)
+    else:
+        writer = MongoWriter(batch_size)
+    start_ts = timer()
+    try:
+        populate_db(dirname=dir, filepath=file, tabula_batch_size=tabula_batch_size, engine=engine,
+                    parsed_file=parsed_file, task_timeout=timeout,
+                    max_worker_rss=max_worker_rss_mb * 2**20,
+                    max_tasks_per_worker=max_tasks_per_worker,
+                    pages_per_task=pages_per_task, costs_db=costs_db,
+                    writer=writer, batch_size=batch_size, queue_size=queue_size,
+                    hashes_db=hashes_db, force=force)
+    finally:
+        # Includes the metrics of the workers, see `worker_pool`.
+        metrics.inc("run_seconds_total", timer() - start_ts)
+        log.info(f"Time spent per stage:\n{metrics.report()}")
+        metrics.write_summary(metrics_file)
+        log.info(f"Wrote metrics to {metrics_file!r}.json and .prom")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,124 @@
+"""
+Crash-safe journal of the outcome of parsing every pdf.
+
+Every outcome is committed to SQLite as soon as it is known, along with the size, mtime and
+content digest of the pdf and the version of the parser. A pdf needs to be parsed again only if
+it is new, its contents changed, the parser changed or its last parse failed.
+
+Pdfs are identified by their path relative to the results dir, so that pdfs of the same name in
+different directories, e.g. the notices of two years, have a progress of their own.
+"""
+from __future__ import absolute_import, division
+
+import json
+import os
+from   os.path                  import realpath, relpath
+import sqlite3
+import time
+
+from   utils                    import file_digest
+
+
+class ParseProgress(object):
+    """
+    Usage:
+
+        progress = ParseProgress("data/parse_progress.sqlite", root="data/dtu_results")
+        if progress.needs_parse(filepath, parser_version):
+            try:
+                records = parse(filepath)
+            except Exception as exc:
+                progress.record(filepath, parser_version, error=exc)
+            else:
+                progress.record(filepath, parser_version, num_records=len(records))
+
+    :param root:
+        The dir of the pdfs, which are journaled under their path relative to it. Under their
+        absolute path if None.
+    """
+
+    def __init__(self, path, root=None):
+        self.path = str(path)
+        self.root = None if root is None else realpath(str(root))
+        # Autocommit, so that each outcome is durable as soon as it is recorded.
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS parse_progress (
+                filename        TEXT PRIMARY KEY,
+                size            INTEGER,
+                mtime_ns        INTEGER,
+                digest          TEXT,
+                parser_version  TEXT,
+                status          TEXT,
+                error           TEXT,
+                num_records     INTEGER,
+                updated_at      REAL
+            )""")
+
+    def close(self):
+        self.conn.close()
+
+    def key(self, filepath):
+        """Name of `filepath` in the journal."""
+        filepath = realpath(str(filepath))
+        return filepath if self.root is None else relpath(filepath, self.root)
+
+    def _get(self, filepath):
+        return self.conn.execute(
+            "SELECT size, mtime_ns, digest, parser_version, status FROM parse_progress "
+            "WHERE filename = ?", (self.key(filepath),)).fetchone()
+
+    def needs_parse(self, filepath, parser_version):
+        """
+        True unless `filepath` was parsed successfully by `parser_version` and is unchanged
+        since. The content digest is computed only if the size or mtime of the file changed.
+        """
+        row = self._get(filepath)
+        if row is None:
+            return True
+        size, mtime_ns, digest, prev_parser_version, status = row
+        if status != "ok" or prev_parser_version != parser_version:
+            return True
+        stat = os.stat(filepath)
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+            return False
+        if file_digest(filepath) != digest:
+            return True
+        # Touched but not modified, e.g. synced again.
+        self.conn.execute("UPDATE parse_progress SET size = ?, mtime_ns = ? WHERE filename = ?",
+                          (stat.st_size, stat.st_mtime_ns, self.key(filepath)))
+        return False
+
+    def record(self, filepath, parser_version, error=None, num_records=None, status=None):
+        """
+        Record the outcome of parsing `filepath`.
+
+        :param error:
+            The exception raised by the parser, if any.
+        :param status:
+            'ok' if there is no `error` and 'failed' otherwise, unless given.
+        """
+        stat = os.stat(filepath)
+        status = status or ("ok" if error is None else "failed")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO parse_progress VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.key(filepath), stat.st_size, stat.st_mtime_ns, file_digest(filepath),
+             parser_version, status, None if error is None else repr(error), num_records,
+             time.time()))
+
+    def forget(self, filepath):
+        """Forget the outcome of `filepath`, so that it is parsed again."""
+        self.conn.execute("DELETE FROM parse_progress WHERE filename = ?", (self.key(filepath),))
+
+    def export_json(self, path):
+        """
+        Write the legacy mapping of `{<path>: True | <repr of the error>}` to `path` atomically,
+        e.g. for `examples/scratch.get_err_stats`. Paths are relative to `root`.
+        """
+        progress = {filename: True if status == "ok" else error
+                    for filename, status, error in self.conn.execute(
+                        "SELECT filename, status, error FROM parse_progress")}
+        with open(str(path) + ".tmp", "w+") as f:
+            json.dump(progress, f, indent=4, sort_keys=True)
+        os.replace(str(path) + ".tmp", str(path))
@@ -0,0 +1,128 @@
+"""
+Compact records of parsed results.
+
+All the students on a page share its metadata, so a `StudentResult` holds a reference to one
+`PageMetadata` instead of a copy of it, and the subject codes of a page are one tuple shared by
+all its students. Pickling a list of results, e.g. to send it back from a worker process, writes
+each `PageMetadata` and subject codes tuple once.
+"""
+from __future__ import absolute_import, division
+
+import hashlib
+import json
+
+
+class PageMetadata(object):
+    """Metadata of a page of a result pdf, see `parse_results.parse_metadata`."""
+
+    __slots__ = ("program", "branch", "semester", "release_date", "examination_date", "notice",
+                 "pdf_filename", "pdf_pagenum")
+
+    def __init__(self, program, branch, semester, release_date, examination_date, notice,
+                 pdf_filename, pdf_pagenum):
+        self.program            = program
+        self.branch             = branch
+        self.semester           = semester
+        self.release_date       = release_date
+        self.examination_date   = examination_date
+        self.notice             = notice
+        self.pdf_filename       = pdf_filename
+        self.pdf_pagenum        = pdf_pagenum
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, PageMetadata) and self.__reduce__() == other.__reduce__()
+
+    def __repr__(self):
+        return f"PageMetadata({self.pdf_filename!r}, page={self.pdf_pagenum})"
+
+
+class StudentResult(object):
+    """
+    Result of a student on a page of a result pdf.
+
+    `marks[i]` are the marks in the subject `subject_codes[i]`.
+    """
+
+    __slots__ = ("page", "name", "rollno", "SPI", "total_credits", "papers_failed",
+                 "subject_codes", "marks")
+
+    def __init__(self, page, name, rollno, SPI, total_credits, papers_failed, subject_codes, marks):
+        self.page           = page
+        self.name           = name
+        self.rollno         = rollno
+        self.SPI            = SPI
+        self.total_credits  = total_credits
+        self.papers_failed  = papers_failed
+        self.subject_codes  = subject_codes
+        self.marks          = marks
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, StudentResult) and self.__reduce__() == other.__reduce__()
+
+    def __repr__(self):
+        return f"StudentResult({self.rollno!r}, {self.name!r}, {self.page!r})"
+
+    @classmethod
+    def from_df(cls, df, page):
+        """
+        Results of all the students in a DataFrame sanitized by `parse_results.sanitize_df`.
+        Every column other than name, rollno, SPI, TC and papers_failed holds marks.
+
+        :param page:
+            `PageMetadata` of the page the DataFrame was read from.
+        """
+        # NaN becomes None and numpy scalars become Python ones, as a round-trip through JSON would.
+        df = df.astype(object).where(df.notnull(), None)
+        subject_codes = tuple(c for c in df.columns
+                              if c not in ("name", "rollno", "SPI", "TC", "papers_failed"))
+        marks = zip(*(df[c].tolist() for c in subject_codes)) if subject_codes else ((),) * len(df)
+        return [cls(page, *fields, subject_codes, tuple(student_marks))
+                for (*fields, student_marks) in zip(df["name"].tolist(),
+                                                    df["rollno"].tolist(),
+                                                    df["SPI"].tolist(),
+                                                    df["TC"].tolist(),
+                                                    df["papers_failed"].tolist(),
+                                                    marks)]
+
+    @classmethod
+    def from_dict(cls, record):
+        """Inverse of `to_dict`."""
+        page = PageMetadata(record["program"], record["branch"], record["semester"],
+                            record["release_date"], record["examination_date"], record["notice"],
+                            record["pdf_filename"], record["pdf_pagenum"])
+        return cls(page, record["name"], record["rollno"], record["SPI"], record["total_credits"],
+                   record["papers_failed"], tuple(record["marks"]), tuple(record["marks"].values()))
+
+    def to_dict(self):
+        """The record as documented in `parse_results.parse_dtu_result_pdf`."""
+        page = self.page
+        return dict(
+            name                = self.name,
+            rollno              = self.rollno,
+            program             = page.program,
+            branch              = page.branch,
+            semester            = page.semester,
+            pdf_filename        = page.pdf_filename,
+            pdf_pagenum         = page.pdf_pagenum,
+            release_date        = page.release_date,
+            examination_date    = page.examination_date,
+            notice              = page.notice,
+            SPI                 = self.SPI,
+            total_credits       = self.total_credits,
+            papers_failed       = self.papers_failed,
+            marks               = dict(zip(self.subject_codes, self.marks)),
+        )
+
+    def content_hash(self):
+        """
+        sha256 of the record as returned by `to_dict`, the same across runs and processes as
+        long as neither the pdf nor its parse change.
+        """
+        text = json.dumps(self.to_dict(), sort_keys=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+"""
+Columnar store of parsed results.
+
+Records parsed by `parse_results.parse_all_pdf` are written to a Parquet dataset partitioned by
+program, branch and semester:
+
+    <root>/program=Bachelor of Technology/branch=Mathematics and Computing/semester=V/<part>.parquet
+
+The free-form `marks` dict of a record is stored as a pair of list columns, `subject_codes` and
+`marks`, holding the subject codes and their marks in the same order. The batch ("2K12") and
+branch code ("MC") from the roll number are stored as columns too, so that cohort queries only
+scan the partitions and columns they need:
+
+    >>> load_results(root, batch="2K12", branch_code="MC", semester="V",
+    ...              columns=["rollno", "name", "subject_codes", "marks"])
+
+Sample Run:
+
+$ python src/python/result_store.py export --parsed-file data/parsed_data.ndjson
+$ python src/python/result_store.py query --batch 2K12 --branch-code MC --semester V
+"""
+from __future__ import absolute_import, division
+
+import itertools
+from   loguru                   import logger as log
+import os
+import shutil
+from   timeit                   import default_timer as timer
+
+import click
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from   utils                    import get_topdir, iter_ndjson
+
+
+DEFAULT_STORE_DIR = get_topdir() / "data/results_store"
+
+PARTITION_COLS = ["program", "branch", "semester"]
+
+SCHEMA = pa.schema([
+    ("rollno",              pa.string()),
+    ("name",                pa.string()),
+    ("batch",               pa.string()),
+    ("branch_code",         pa.string()),
+    ("program",             pa.string()),
+    ("branch",              pa.string()),
+    ("semester",            pa.string()),
+    ("notice",              pa.string()),
+    ("release_date",        pa.string()),
+    ("examination_date",    pa.string()),
+    ("pdf_filename",        pa.string()),
+    ("pdf_pagenum",         pa.int32()),
+    ("SPI",                 pa.string()),
+    ("total_credits",       pa.string()),
+    ("papers_failed",       pa.string()),
+    ("subject_codes",       pa.list_(pa.string())),
+    ("marks",               pa.list_(pa.string())),
+])
+
+
+def _to_str(value):
+    """Marks and grades are a mix of numbers and codes like 'A' or 'RL'. Store them as text."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _to_columns(records):
+    """Convert records as returned by `parse_results.parse_dtu_result_pdf` to a dict of columns."""
+    columns = {field.name: [] for field in SCHEMA}
+    for record in records:
+        rollno_parts = (record["rollno"] or "").split("/")
+        columns["batch"].append(rollno_parts[0] if len(rollno_parts) == 3 else None)
+        columns["branch_code"].append(rollno_parts[1] if len(rollno_parts) == 3 else None)
+        columns["subject_codes"].append(list(record["marks"]))
+        columns["marks"].append([_to_str(v) for v in record["marks"].values()])
+        for name in ("rollno", "name", "program", "branch", "semester", "notice", "release_date",
+                     "examination_date", "pdf_filename", "SPI", "total_credits", "papers_failed"):
+            columns[name].append(_to_str(record[name]))
+        columns["pdf_pagenum"].append(record["pdf_pagenum"])
+    return columns
+
+
+def export_records(records, root=DEFAULT_STORE_DIR, chunk_size=100000):
+    """
+    Write `records` to the dataset at `root`, `chunk_size` records at a time, so that memory
+    doesn't grow with the number of records. The partitions records are written to replace
+    those of the dataset, so that exporting the same records again doesn't duplicate them.
+    Other partitions are kept.
+
+    :return:
+        Number of records written.
+    """
+    num_records = 0
+    records = iter(records)
+    # Written next to `root` first, as the records of a partition may span several chunks.
+    staging = str(root).rstrip(os.sep) + ".export"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    try:
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            table = pa.Table.from_pydict(_to_columns(chunk), schema=SCHEMA)
+            pq.write_to_dataset(table, root_path=staging, partition_cols=PARTITION_COLS)
+            num_records += len(chunk)
+            log.info(f"Wrote {num_records} records to {staging!r}")
+        for dirpath in [dirpath for dirpath, _, filenames in os.walk(staging) if filenames]:
+            partition = os.path.join(str(root), os.path.relpath(dirpath, staging))
+            if os.path.exists(partition):
+                shutil.rmtree(partition)
+            os.makedirs(os.path.dirname(partition), exist_ok=True)
+            os.replace(dirpath, partition)
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+    return num_records
+
+
+def open_dataset(root=DEFAULT_STORE_DIR):
+    """Returns a `pyarrow.dataset.Dataset` over the store at `root`."""
+    partitioning = ds.partitioning(pa.schema([(name, pa.string()) for name in PARTITION_COLS]),
+                                   flavor="hive")
+    return ds.dataset(str(root), format="parquet", partitioning=partitioning)
+
+
+def load_results(root=DEFAULT_STORE_DIR, columns=None, **filters):
+    """
+    Load results from the store as a `pandas.DataFrame`.
+
+    :param columns:
+        Only read these columns. All columns are read if None.
+    :param filters:
+        Equality filters like `semester="V"`. Filters on `PARTITION_COLS` skip whole
+        directories; other columns are filtered using the statistics of each file.
+    """
+    expression = None
+    for name, value in filters.items():
+        condition = ds.field(name) == value
+        expression = condition if expression is None else expression & condition
+    return open_dataset(root).to_table(columns=columns, filter=expression).to_pandas()
+
+
+def explode_marks(df):
+    """Turn the `subject_codes`/`marks` list columns of `df` into one row per (rollno, subject)."""
+    long_df = df[["rollno", "subject_codes", "marks"]].copy()
+    long_df["pairs"] = [list(zip(codes, marks))
+                        for codes, marks in zip(long_df.pop("subject_codes"), long_df.pop("marks"))]
+    long_df = long_df.explode("pairs").dropna(subset=["pairs"])
+    long_df["subject_code"] = long_df["pairs"].str[0]
+    long_df["marks"] = long_df.pop("pairs").str[1]
+    return long_df.reset_index(drop=True)
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option('--parsed-file', type=click.Path(dir_okay=False, exists=True),
+              default=str(get_topdir() / "data/parsed_data.ndjson"),
+              help='Newline delimited JSON written by parse_results.parse_all_pdf.')
+@click.option('--root', type=click.Path(file_okay=False), default=str(DEFAULT_STORE_DIR),
+              help='Directory of the Parquet dataset.')
+@click.option('--overwrite', is_flag=True,
+              help='Delete the existing dataset first, including the partitions of which no '
+                   'record is exported.')
+def export(parsed_file, root, overwrite):
+    """Export parsed records to the Parquet dataset."""
+    if overwrite and os.path.exists(root):
+        shutil.rmtree(root)
+    num_records = export_records(iter_ndjson(parsed_file), root)
+    log.info(f"Exported {num_records} records to {root!r}")
+
+
+@main.command()
+@click.option('--root', type=click.Path(file_okay=False, exists=True), default=str(DEFAULT_STORE_DIR))
+@click.option('--program', type=click.STRING)
+@click.option('--branch', type=click.STRING)
+@click.option('--semester', type=click.STRING)
+@click.option('--batch', type=click.STRING, help='Year of the roll number, e.g. 2K12.')
+@click.option('--branch-code', type=click.STRING, help='Branch in the roll number, e.g. MC.')
+@click.option('--columns', type=click.STRING, default="rollno,name,subject_codes,marks",
+              help='Comma separated columns to read.')
+def query(root, program, branch, semester, batch, branch_code, columns):
+    """Print the results matching the filters."""
+    filters = dict(program=program, branch=branch, semester=semester, batch=batch,
+                   branch_code=branch_code)
+    start_ts = timer()
+    df = load_results(root, columns=columns.split(","),
+                      **{k: v for k, v in filters.items() if v is not None})
+    print(df.to_string())
+    log.info(f"Read {len(df)} results in {timer() - start_ts:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+
+"""
+Single file snapshots of the extraction caches and the parsed outputs, to warm up a fresh
+machine with one download instead of syncing every pdf and cache file from dropbox.
+
+A snapshot is a zip archive holding `MANIFEST.json` and the files of `CACHES_DIR`, under
+`caches/`, and of `DEFAULT_OUTPUTS`, under their path relative to the top dir. The manifest
+lists the sha256 and size of every file, and the archive is named after the sha256 of that
+list, so that two snapshots of the same contents have the same name:
+
+    data/snapshots/snapshot-<sha256 of the files in the manifest>.zip
+
+SQLite files, e.g. the index of every diskcache, are copied with the backup API, so that a
+snapshot taken during a run is consistent. Restoring extracts every file in parallel into a
+staging dir, checks its size and sha256, and then swaps the restored caches and outputs in. If
+a swap fails, the caches and outputs already swapped are put back. Only the caches and the
+`DEFAULT_OUTPUTS` are restored, and a snapshot naming any other path is rejected.
+
+Sample Run:
+
+$ python src/python/snapshots.py create
+$ python src/python/dropbox_updown.py snapshots data/snapshots --yes
+$ python src/python/snapshots.py restore data/snapshots/snapshot-0123456789abcdef.zip
+"""
+from __future__ import absolute_import, division
+
+from   concurrent.futures       import ThreadPoolExecutor
+import hashlib
+import json
+from   loguru                   import logger as log
+import os
+from   os.path                  import basename
+from   pathlib                  import Path, PurePosixPath
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from   timeit                   import default_timer as timer
+import zipfile
+
+import click
+
+from   utils                    import CACHES_DIR, get_filepaths, get_topdir
+
+
+DEFAULT_SNAPSHOT_DIR = get_topdir() / "data/snapshots"
+
+DEFAULT_OUTPUTS = (
+    "data/parsed_data.ndjson",
+    "data/parse_progress.sqlite",
+    "data/task_costs.sqlite",
+    "data/results_store",
+    "etc/parse_progress.json",
+)
+"""Outputs of parsing included in snapshots, relative to the top dir, if they exist."""
+
+MANIFEST_NAME = "MANIFEST.json"
+MANIFEST_VERSION = 1
+CACHES_ROOT = "caches"
+
+SQLITE_SUFFIXES = (".db", ".sqlite")
+SKIPPED_SUFFIXES = ("-wal", "-shm", "-journal", ".tmp")
+"""Files left out of snapshots. SQLite files are copied whole, with their WAL, by `_copy_sqlite`."""
+
+RE_SNAPSHOT_NAME = re.compile(r"^snapshot-([0-9a-f]{16,64})\.zip$")
+
+DEFAULT_NUM_THREADS = os.cpu_count() or 4
+
+
+def _sha256(filepath):
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _copy_sqlite(src, dst):
+    """Consistent copy of a SQLite database which may be written to meanwhile."""
+    source = sqlite3.connect(str(src))
+    target = sqlite3.connect(str(dst))
+    try:
+        with target:
+            source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def snapshot_files(caches_dir=CACHES_DIR, outputs=DEFAULT_OUTPUTS, topdir=None):
+    """
+    Yields `(root, arcname, filepath)` of every file to snapshot. `arcname` is the path of the
+    file in the archive, see `restore_path`, and `root` the caches or the output it is part of.
+    """
+    topdir = Path(topdir or get_topdir())
+    roots = [(CACHES_ROOT, Path(caches_dir))] + [(output, topdir / output) for output in outputs]
+    for root, path in roots:
+        if path.is_dir():
+            filepaths = sorted(get_filepaths(str(path)))
+        elif path.exists():
+            filepaths = [str(path)]
+        else:
+            continue
+        for filepath in filepaths:
+            if filepath.endswith(SKIPPED_SUFFIXES):
+                continue
+            relpath = os.path.relpath(filepath, os.path.realpath(str(path)))
+            yield root, (root if relpath == "." else f"{root}/{Path(relpath).as_posix()}"), filepath
+
+
+def restore_path(arcname, caches_dir=CACHES_DIR, topdir=None):
+    """Where the file `arcname` of a snapshot is restored."""
+    if arcname == CACHES_ROOT or arcname.startswith(CACHES_ROOT + "/"):
+        return Path(caches_dir) / arcname[len(CACHES_ROOT) + 1:]
+    return Path(topdir or get_topdir()) / arcname
+
+
+def create_snapshot(snapshot_dir=DEFAULT_SNAPSHOT_DIR, caches_dir=CACHES_DIR,
+                    outputs=DEFAULT_OUTPUTS, num_threads=DEFAULT_NUM_THREADS,
+                    compresslevel=6, topdir=None):
+    """
+    Write a snapshot of `caches_dir` and `outputs` to `snapshot_dir`.
+
+    :return:
+        Path of the snapshot. If a snapshot of the same contents exists, it is returned instead.
+    """
+    start_ts = timer()
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix=".snapshot-", dir=str(snapshot_dir)) as tmpdir:
+        roots, files = set(), []
+        for num, (root, arcname, filepath) in enumerate(snapshot_files(caches_dir, outputs, topdir)):
+            if filepath.endswith(SQLITE_SUFFIXES):
+                copy = os.path.join(tmpdir, f"{num}{os.path.splitext(filepath)[1]}")
+                _copy_sqlite(filepath, copy)
+                filepath = copy
+            roots.add(root)
+            files.append((arcname, filepath))
+        log.info(f"Hashing {len(files)} files")
+        with ThreadPoolExecutor(num_threads) as executor:
+            digests = list(executor.map(lambda file: _sha256(file[1]), files))
+
+        manifest = dict(
+            version     = MANIFEST_VERSION,
+            created_at  = time.strftime("%Y-%m-%dT%H:%M:%S"),
+            roots       = sorted(roots),
+            files       = [dict(name=arcname, size=os.path.getsize(filepath), sha256=digest)
+                           for (arcname, filepath), digest in zip(files, digests)],
+        )
+        manifest_digest = manifest_sha256(manifest)
+        path = snapshot_dir / f"snapshot-{manifest_digest[:16]}.zip"
+        if path.exists():
+            log.info(f"{str(path)!r} already holds these contents")
+            return path
+
+        tmp_path = os.path.join(tmpdir, basename(path))
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED,
+                             compresslevel=compresslevel) as archive:
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=4, sort_keys=True))
+            for arcname, filepath in files:
+                archive.write(filepath, arcname)
+        os.replace(tmp_path, str(path))
+
+    total_size = sum(file["size"] for file in manifest["files"])
+    log.info(f"Wrote {len(files)} files, {total_size / 2**20:.1f} MiB, to {str(path)!r} "
+             f"({path.stat().st_size / 2**20:.1f} MiB) in {timer() - start_ts:.1f}s")
+    return path
+
+
+def manifest_sha256(manifest):
+    """sha256 of the files listed in `manifest`, which names its snapshot."""
+    return hashlib.sha256(json.dumps(manifest["files"], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _is_relative_name(name):
+    """True if the archive name `name` is a relative path which stays under its dir."""
+    path = PurePosixPath(name)
+    return bool(name) and "\\" not in name and not path.is_absolute() and ".." not in path.parts
+
+
+def _root_of(name, roots):
+    return next((root for root in roots if name == root or name.startswith(root + "/")), None)
+
+
+def read_manifest(path):
+    """
+    Read the manifest of the snapshot at `path` and check that it matches the name of the
+    snapshot and lists every file in the archive. Its roots must be among the caches and the
+    `DEFAULT_OUTPUTS`, each with files, and every file must be a relative path under one of
+    them. Raises ValueError otherwise.
+    """
+    with zipfile.ZipFile(str(path)) as archive:
+        manifest = json.loads(archive.read(MANIFEST_NAME).decode("utf-8"))
+        names = set(archive.namelist()) - {MANIFEST_NAME}
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"{str(path)!r}: unsupported manifest version {manifest.get('version')!r}")
+    match = RE_SNAPSHOT_NAME.match(basename(str(path)))
+    if match and not manifest_sha256(manifest).startswith(match.group(1)):
+        raise ValueError(f"{str(path)!r}: manifest doesn't match the name of the snapshot")
+    if names != {file["name"] for file in manifest["files"]}:
+        raise ValueError(f"{str(path)!r}: files in the archive don't match its manifest")
+    roots = manifest["roots"]
+    unknown = set(roots) - {CACHES_ROOT} - set(DEFAULT_OUTPUTS)
+    if unknown:
+        raise ValueError(f"{str(path)!r}: unknown roots {sorted(unknown)}")
+    for name in names:
+        if not _is_relative_name(name) or _root_of(name, roots) is None:
+            raise ValueError(f"{str(path)!r}: {name!r} isn't under the caches or an output")
+    empty = set(roots) - {_root_of(name, roots) for name in names}
+    if empty:
+        raise ValueError(f"{str(path)!r}: no files for roots {sorted(empty)}")
+    return manifest
+
+
+def _extract_files(path, files, staging_dir=None, num_threads=DEFAULT_NUM_THREADS):
+    """
+    Check the size and sha256 of `files` of the snapshot at `path`, in parallel, and extract
+    them under `staging_dir` if given. Raises ValueError on the first mismatch.
+    """
+    local = threading.local()
+
+    def extract(file):
+        if not hasattr(local, "archive"):
+            # ZipFile objects can't be shared between threads.
+            local.archive = zipfile.ZipFile(str(path))
+        sha, size = hashlib.sha256(), 0
+        out = None
+        if staging_dir:
+            target = Path(staging_dir) / file["name"]
+            target.parent.mkdir(parents=True, exist_ok=True)
+            out = open(target, "wb")
+        try:
+            with local.archive.open(file["name"]) as member:
+                for chunk in iter(lambda: member.read(1 << 20), b""):
+                    sha.update(chunk)
+                    size += len(chunk)
+                    if out:
+                        out.write(chunk)
+        finally:
+            if out:
+                out.close()
+        if (size, sha.hexdigest()) != (file["size"], file["sha256"]):
+            raise ValueError(f"{str(path)!r}: {file['name']!r} is corrupt")
+        return size
+
+    # Largest first, so that a large file doesn't end up extracted by a single thread at the end.
+    files = sorted(files, key=lambda file: file["size"], reverse=True)
+    with ThreadPoolExecutor(num_threads) as executor:
+        return sum(executor.map(extract, files))
+
+
+def verify_snapshot(path, num_threads=DEFAULT_NUM_THREADS):
+    """Check every file of the snapshot at `path` against its manifest. Raises ValueError."""
+    manifest = read_manifest(path)
+    return _extract_files(path, manifest["files"], num_threads=num_threads)
+
+
+def restore_snapshot(path, caches_dir=CACHES_DIR, topdir=None, num_threads=DEFAULT_NUM_THREADS):
+    """
+    Replace the caches and outputs in the snapshot at `path` by their contents in the snapshot.
+    Nothing is replaced unless every file of the snapshot is intact, and if replacing one of
+    them fails, those already replaced are put back.
+    """
+    start_ts = timer()
+    topdir = Path(topdir or get_topdir())
+    manifest = read_manifest(path)
+    (topdir / "data").mkdir(exist_ok=True)
+    staging_dir = Path(tempfile.mkdtemp(prefix=".restore-", dir=str(topdir / "data")))
+    # `(target, where the previous contents of target were moved or None)` of each swap.
+    swapped = []
+    keep_staging_dir = False
+    try:
+        size = _extract_files(path, manifest["files"], staging_dir, num_threads=num_threads)
+        log.info(f"Verified and extracted {len(manifest['files'])} files, "
+                 f"{size / 2**20:.1f} MiB, in {timer() - start_ts:.1f}s")
+        for root in manifest["roots"]:
+            target = restore_path(root, caches_dir, topdir)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            old = staging_dir / ".old" / root
+            if target.exists():
+                old.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(target), str(old))
+                swapped.append((target, old))
+            else:
+                swapped.append((target, None))
+            shutil.move(str(staging_dir / root), str(target))
+            log.info(f"Restored {str(target)!r}")
+    except BaseException:
+        try:
+            _undo_swaps(swapped)
+        except BaseException:
+            # The previous caches or outputs which couldn't be put back are still there.
+            keep_staging_dir = True
+            log.exception(f"Failed to put back the previous contents, see {str(staging_dir)!r}")
+        raise
+    finally:
+        if not keep_staging_dir:
+            shutil.rmtree(str(staging_dir), ignore_errors=True)
+    return manifest
+
+
+def _remove(path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(str(path))
+    elif path.exists() or path.is_symlink():
+        path.unlink()
+
+
+def _undo_swaps(swapped):
+    """Put back the previous contents of the targets of `restore_snapshot`, last first."""
+    for target, old in reversed(swapped):
+        _remove(target)
+        if old is not None:
+            shutil.move(str(old), str(target))
+        log.info(f"Put back the previous {str(target)!r}")
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option('--snapshot-dir', type=click.Path(file_okay=False), default=str(DEFAULT_SNAPSHOT_DIR))
+@click.option('--threads', type=click.INT, default=DEFAULT_NUM_THREADS,
+              help='Hash files with this many threads.')
+@click.option('--compresslevel', type=click.IntRange(0, 9), default=6)
+def create(snapshot_dir, threads, compresslevel):
+    """Snapshot the caches and the parsed outputs to a single archive."""
+    print(create_snapshot(snapshot_dir, num_threads=threads, compresslevel=compresslevel))
+
+
+@main.command()
+@click.argument('path', type=click.Path(dir_okay=False, exists=True))
+@click.option('--threads', type=click.INT, default=DEFAULT_NUM_THREADS)
+def verify(path, threads):
+    """Check every file of a snapshot against its manifest."""
+    size = verify_snapshot(path, num_threads=threads)
+    log.info(f"{path!r} is intact, {size / 2**20:.1f} MiB")
+
+
+@main.command()
+@click.argument('path', type=click.Path(dir_okay=False, exists=True))
+@click.option('--threads', type=click.INT, default=DEFAULT_NUM_THREADS,
+              help='Verify and extract files with this many threads.')
+def restore(path, threads):
+    """Verify a snapshot and replace the caches and outputs by its contents."""
+    restore_snapshot(path, num_threads=threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+"""
+Merge the records of every notice a student appears in into one timeline per student.
+
+The same students appear in the regular notice of a semester and in its BACK, RECHECKING,
+REVISED and consolidated ("Conso") notices. `TimelineIndex` indexes all the records of a run by
+roll number and `merge_timeline` orders the records of a student, semester by semester, by
+release date and kind of notice:
+
+    regular < back < rechecking < revised < conso
+
+a later record superseding the marks of the earlier ones subject by subject, and a consolidated
+notice superseding all of them. The result doesn't depend on the order in which pdfs were parsed.
+
+Usage:
+
+    index = TimelineIndex()
+    for results in results_of_every_pdf:
+        index.add(results)
+    for timeline in index.timelines():
+        write(timeline.to_dict())
+
+Sample Run:
+
+$ python src/python/timelines.py --parsed-file data/parsed_data.ndjson --output data/timelines.ndjson
+"""
+from __future__ import absolute_import, division
+
+from   collections              import defaultdict
+import functools
+from   loguru                   import logger as log
+import re
+from   timeit                   import default_timer as timer
+
+import click
+
+from   records                  import StudentResult
+from   utils                    import get_topdir, iter_ndjson, write_ndjson
+
+
+KINDS = ("regular", "back", "rechecking", "revised", "conso")
+"""Kinds of notices, in the order in which they supersede each other when released the same day."""
+
+KIND_RANK = {kind: rank for rank, kind in enumerate(KINDS)}
+
+# Words of the names of the pdfs, e.g. 'E15_BT_DIS_REV_425.pdf', 'BTPT_Conso_304.pdf' or
+# 'RecheckingE12_116.pdf', telling the kind of notice. A pdf matching several kinds, e.g. a
+# revised back notice, is of the kind which supersedes the others.
+RE_KINDS = (
+    ("conso",       re.compile(r"CONSO|(^|[^A-Z])CONS?([^A-Z]|$)")),
+    ("rechecking",  re.compile(r"RECHECK|RECHEKING|REVALUATION|(^|[^A-Z])REC([^A-Z]|$)")),
+    ("revised",     re.compile(r"(^|[^A-Z])REV")),
+    ("back",        re.compile(r"BACK|(^|[^A-Z])(BAC|BK|SUP)([^A-Z]|$)")),
+)
+
+ROMAN_NUMERALS = {"I": 1, "II": 2, "III": 3, "IV": 4, "V": 5, "VI": 6, "VII": 7, "VIII": 8,
+                  "IX": 9, "X": 10}
+
+RE_DATE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{2,4})")
+
+
+def notice_kind(page):
+    """Kind of the notice in `KINDS` a `records.PageMetadata` is part of."""
+    return _notice_kind(page.pdf_filename, page.notice)
+
+
+@functools.lru_cache(maxsize=None)
+def _notice_kind(pdf_filename, notice):
+    text = f"{pdf_filename or ''} {notice or ''}".upper()
+    for kind, regex in RE_KINDS:
+        if regex.search(text):
+            return kind
+    return "regular"
+
+
+def semester_key(semester):
+    """Sort key of a semester, e.g. 'V' or '5', numerals first."""
+    semester = (semester or "").strip().upper()
+    if semester in ROMAN_NUMERALS:
+        return ROMAN_NUMERALS[semester], ""
+    if semester.isdigit():
+        return int(semester), ""
+    return len(ROMAN_NUMERALS) + 1, semester
+
+
+def date_key(release_date):
+    """`(year, month, day)` of a date like '06/01/2015' or '06/01/15', (0, 0, 0) if unknown."""
+    match = RE_DATE.search(release_date or "")
+    if not match:
+        return 0, 0, 0
+    day, month, year = (int(x) for x in match.groups())
+    return (year + 2000 if year < 100 else year), month, day
+
+
+def source_key(result):
+    """Order in which the records of a student for a semester supersede each other."""
+    page = result.page
+    return (date_key(page.release_date), KIND_RANK[notice_kind(page)], page.pdf_filename or "",
+            page.pdf_pagenum or 0)
+
+
+class SemesterResult(object):
+    """
+    Result of a student in a semester after applying all the notices in `sources`, a list of
+    `records.StudentResult` in the order they superseded each other.
+    """
+
+    __slots__ = ("semester", "marks", "SPI", "total_credits", "papers_failed", "sources")
+
+    def __init__(self, semester, marks, SPI, total_credits, papers_failed, sources):
+        self.semester       = semester
+        self.marks          = marks
+        self.SPI            = SPI
+        self.total_credits  = total_credits
+        self.papers_failed  = papers_failed
+        self.sources        = sources
+
+    def to_dict(self):
+        return dict(
+            semester        = self.semester,
+            marks           = self.marks,
+            SPI             = self.SPI,
+            total_credits   = self.total_credits,
+            papers_failed   = self.papers_failed,
+            sources         = [dict(kind=notice_kind(result.page), notice=result.page.notice,
+                                    release_date=result.page.release_date,
+                                    pdf_filename=result.page.pdf_filename,
+                                    pdf_pagenum=result.page.pdf_pagenum,
+                                    marks=dict(zip(result.subject_codes, result.marks)))
+                               for result in self.sources],
+        )
+
+
+class StudentTimeline(object):
+    """Results of a student, one `SemesterResult` per semester in order."""
+
+    __slots__ = ("rollno", "name", "program", "branch", "semesters")
+
+    def __init__(self, rollno, name, program, branch, semesters):
+        self.rollno     = rollno
+        self.name       = name
+        self.program    = program
+        self.branch     = branch
+        self.semesters  = semesters
+
+    def __repr__(self):
+        return f"StudentTimeline({self.rollno!r}, {self.name!r}, {len(self.semesters)} semesters)"
+
+    @property
+    def marks(self):
+        """Latest marks of the student in every subject of every semester."""
+        marks = {}
+        for semester in self.semesters:
+            marks.update(semester.marks)
+        return marks
+
+    def to_dict(self):
+        return dict(rollno=self.rollno, name=self.name, program=self.program, branch=self.branch,
+                    semesters=[semester.to_dict() for semester in self.semesters])
+
+
+def merge_semester(semester, results):
+    """`SemesterResult` of the records of a student in a semester, see `source_key`."""
+    sources = sorted(results, key=source_key)
+    marks, latest = {}, None
+    for result in sources:
+        if notice_kind(result.page) == "conso":
+            marks = {}
+        marks.update((code, mark) for code, mark in zip(result.subject_codes, result.marks)
+                     if mark is not None)
+        if result.SPI is not None or result.total_credits is not None:
+            latest = result
+    return SemesterResult(semester, marks,
+                          latest and latest.SPI, latest and latest.total_credits,
+                          latest and latest.papers_failed, sources)
+
+
+def merge_timeline(rollno, results):
+    """`StudentTimeline` of all the records of the student `rollno`."""
+    by_semester = defaultdict(list)
+    for result in results:
+        by_semester[(result.page.semester or "").strip()].append(result)
+    semesters = [merge_semester(semester, by_semester[semester])
+                 for semester in sorted(by_semester, key=semester_key)]
+    latest = max(results, key=lambda result: (semester_key(result.page.semester),
+                                              source_key(result)))
+    name = next((result.name for result in sorted(results, key=source_key, reverse=True)
+                 if result.name), None)
+    return StudentTimeline(rollno, name, latest.page.program, latest.page.branch, semesters)
+
+
+class TimelineIndex(object):
+    """
+    Records of a run indexed by roll number. A record read again from the same page of the
+    same pdf, e.g. as a pdf is parsed again, replaces the previous one.
+    """
+
+    def __init__(self):
+        self._results = defaultdict(dict)
+        self._pages = {}
+        self.num_records = 0
+        self.num_skipped = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def _intern(self, page):
+        """One `PageMetadata` per page, e.g. for records read back from JSON."""
+        key = page.__reduce__()[1]
+        return self._pages.setdefault(key, page)
+
+    def add(self, results):
+        """Index an iterable of `records.StudentResult`. Returns the roll numbers indexed."""
+        rollnos = set()
+        for result in results:
+            rollno = (result.rollno or "").strip()
+            if not rollno:
+                log.error(f"rollno not present in {result!r}, SKIPPING...")
+                self.num_skipped += 1
+                continue
+            result.page = self._intern(result.page)
+            self._results[rollno][(result.page.pdf_filename, result.page.pdf_pagenum)] = result
+            self.num_records += 1
+            rollnos.add(rollno)
+        return rollnos
+
+    def timelines(self, rollnos=None):
+        """Yields the `StudentTimeline` of every student, or of `rollnos`, by roll number."""
+        for rollno in sorted(self._results if rollnos is None else rollnos):
+            yield merge_timeline(rollno, list(self._results[rollno].values()))
+
+
+def index_parsed_file(parsed_file):
+    """`TimelineIndex` of the records written by `parse_results.parse_all_pdf`."""
+    index = TimelineIndex()
+    index.add(StudentResult.from_dict(record) for record in iter_ndjson(parsed_file))
+    return index
+
+
+@click.command()
+@click.option('--parsed-file', type=click.Path(dir_okay=False, exists=True),
+              default=str(get_topdir() / "data/parsed_data.ndjson"),
+              help='Newline delimited JSON written by parse_results.parse_all_pdf.')
+@click.option('--output', type=click.Path(dir_okay=False),
+              default=str(get_topdir() / "data/timelines.ndjson"),
+              help='Write the timeline of every student to this file as newline delimited JSON.')
+def main(parsed_file, output):
+    start_ts = timer()
+    index = index_parsed_file(parsed_file)
+    log.info(f"Indexed {index.num_records} records of {len(index)} students in "
+             f"{timer() - start_ts:.1f}s")
+    with open(output, "w") as f:
+        write_ndjson((timeline.to_dict() for timeline in index.timelines()), f)
+    log.info(f"Wrote {len(index)} timelines to {output!r} in {timer() - start_ts:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,9 @@
 from __future__ import absolute_import, division
 
+import functools
+import hashlib
+import importlib
+import json
 import re
 
 
@@ -8,11 +12,14 @@ import os
 # https://stackoverflow.com/a/19308592/6463555
 from os.path import realpath, basename
 import sys
-import diskcache
+import tempfile
+from timeit import default_timer as timer
+from loguru import logger as log
 from pathlib import Path
 
-import pdfplumber
-import tabula
+# pandas, pdfplumber, tabula and diskcache are imported by the functions using them,
+# so that importing this module, e.g. in every CLI, stays cheap.
+import metrics
 
 
 def get_filepaths(directory):
@@ -64,6 +71,22 @@ def sanitize_filenames(dir):
         raise ValueError(f"{diff} files lost!")
 
 
+def write_ndjson(records, f):
+    """Write `records` to the file object `f` as newline delimited JSON, one record per line."""
+    for record in records:
+        f.write(json.dumps(record, sort_keys=True))
+        f.write("\n")
+    f.flush()
+
+
+def iter_ndjson(filepath):
+    """Lazily yield the records of a newline delimited JSON file written by `write_ndjson`."""
+    with open(filepath, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
 class RedirectStdStreams(object):
     """This works only on Python calls. Stdout/err from underlying
     C calls would be missed."""
@@ -111,11 +134,12 @@ class HideUnderlyingStderrCtx(object):
         os.dup2(self._oldstdout_fno, 2)
 
 
+@functools.lru_cache(maxsize=None)
 def get_topdir():
     """
     Searches for a file .top in the parent dirs iteratively.
 
-    Returns a `pathlib.PosixPath` object.
+    Returns a `pathlib.PosixPath` object. Memoized, as default arguments of many functions.
     """
     path = Path(os.path.dirname(__file__))
     while True:
@@ -127,33 +151,492 @@ def get_topdir():
         path = path.parent
 
 
-tabula_cache = diskcache.Cache(get_topdir() / "data/caches/tabula")
+CACHES_DIR = Path(os.environ.get("SUPPLEMENTARY_CACHES_DIR", get_topdir() / "data/caches"))
+"""Directory holding the extraction caches. Override with env var SUPPLEMENTARY_CACHES_DIR."""
+
+CACHE_SIZE_LIMIT = int(os.environ.get("SUPPLEMENTARY_CACHE_SIZE_LIMIT", 4 * 2**30))
+"""Size cap in bytes of each extraction cache, beyond which least recently used entries are evicted."""
+
+EXTRACTORS = {
+    "tabula"        : "tabula",
+    "pdfplumber"    : "pdfplumber",
+}
+"""Mapping of an extractor name to the module of the library doing the extraction."""
 
-def tabula_read_pdf(filepath, pages):
-    """Wrapper over `tabule.read_pdf which memoizes results using
-    `os.path.basename(filepath)` and param `pages`."""
+
+def open_cache(name):
+    """Opens the extraction cache `name` from `CACHES_DIR` with LRU eviction and hit/miss stats."""
+    import diskcache
+    cache = diskcache.Cache(str(CACHES_DIR / name),
+                            size_limit=CACHE_SIZE_LIMIT,
+                            eviction_policy="least-recently-used")
+    cache.stats(enable=True)
+    return cache
+
+
+_caches = {}
+
+def get_cache(name):
+    """
+    The cache `name`, see `open_cache`, opened on first use in each process. A forked worker
+    opens its own instead of sharing the SQLite connections of its parent.
+    """
+    pid, cache = _caches.get(name, (None, None))
+    if pid != os.getpid():
+        cache = open_cache(name)
+        _caches[name] = (os.getpid(), cache)
+    return cache
+
+
+def extractor_version(extractor):
+    """Version of the library behind `extractor`."""
+    return importlib.import_module(EXTRACTORS[extractor]).__version__
+
+
+_file_digests = {}
+
+def file_digest(filepath):
+    """
+    sha256 hex digest of the contents of `filepath`.
+
+    Digests are memoized for the lifetime of the process using the path, size and mtime of the file.
+    """
+    stat = os.stat(filepath)
+    memo_key = (realpath(filepath), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_digests:
+        sha = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        _file_digests[memo_key] = sha.hexdigest()
+    return _file_digests[memo_key]
+
+
+def extraction_cache_key(filepath, extractor, **options):
+    """
+    Key of an extraction result in the caches.
+
+    A key is a tuple of `(extractor, extractor version, content digest, options)`. Hence
+    identically named but different pdfs never collide, a modified pdf is re-extracted,
+    and upgrading an extractor invalidates its old entries.
+    """
+    return (extractor, extractor_version(extractor), file_digest(filepath),
+            tuple(sorted(options.items())))
+
+
+def _freeze(value):
+    """A hashable and order independent equivalent of `value` for use in a cache key."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def cache_get_frames(cache, key):
+    """
+    The list of DataFrames stored in `cache`. Raises KeyError if `key` isn't cached, or if its
+    entry isn't a list, e.g. if it was written in the Arrow format of older versions, so that
+    the tables are extracted and cached again.
+    """
+    start_ts = timer()
+    value = cache.get(key)
+    if not isinstance(value, list):
+        raise KeyError(key)
+    metrics.observe("cache_load_seconds", timer() - start_ts, cache=basename(cache.directory))
+    return value
+
+
+def tabula_read_pdf(filepath, pages, **options):
+    """Wrapper over `tabula.read_pdf` which memoizes results using the contents
+    of `filepath`, the version of tabula, param `pages` and the other `options`
+    passed to `tabula.read_pdf`, e.g. `lattice=True`."""
+    import tabula
+
+    tabula_cache = get_cache("tabula")
+    key = extraction_cache_key(filepath, "tabula", pages=pages,
+                               **{name: _freeze(value) for name, value in options.items()})
     try:
-        return tabula_cache[(basename(filepath), pages)]
+        pages_df = cache_get_frames(tabula_cache, key)
+        metrics.inc("cache_requests_total", cache="tabula", result="hit")
+        return pages_df
     except KeyError:
-        pass
-    with HideUnderlyingStderrCtx():
-        pages_df = tabula.read_pdf(filepath, pages=pages)
-    tabula_cache[(basename(filepath), pages)] = pages_df
+        metrics.inc("cache_requests_total", cache="tabula", result="miss")
+    with HideUnderlyingStderrCtx(), metrics.timed("tabula_seconds", mode="read"):
+        pages_df = tabula.read_pdf(filepath, pages=pages, **options)
+    tabula_cache[key] = pages_df
     return pages_df
 
 
-pdfplumber_cache = diskcache.Cache(get_topdir() / "data/caches/pdfplumber")
+def _tabula_extract_from(raw_json):
+    """
+    DataFrames of the JSON output of tabula-java, with the private `tabula.io._extract_from`
+    that `tabula.read_pdf` uses, so that prefetched tables are the ones `tabula_read_pdf` reads.
+    It has the same signature and conversion from tabula-py 2.0.1, pinned in requirements.txt,
+    to 2.10.0.
+    """
+    import tabula
+    extract_from = getattr(tabula.io, "_extract_from", None)
+    if extract_from is None:
+        raise RuntimeError(f"tabula-py {tabula.__version__} has no tabula.io._extract_from, "
+                           f"use the version pinned in requirements.txt")
+    return extract_from(raw_json)
 
-def pdfplumber_extract_text(filepath, page_num):
+
+def tabula_prefetch(filepaths, pages='all'):
+    """
+    Extract tables of many pdfs with a single tabula-java process and memoize them in
+    the tabula cache under the same keys as `tabula_read_pdf`.
+
+    `tabula.read_pdf` starts a JVM per pdf. This uses the batch mode of tabula-java
+    instead, which extracts all the pdfs in a directory in one JVM, so that startup
+    and JIT warmup are paid once per batch. Pdfs already in the cache are skipped. A
+    pdf which tabula-java fails on is left out of the cache, so that it is extracted
+    again (and its error raised) by `tabula_read_pdf`.
+
+    :param filepaths:
+        A list of paths to pdf files
+    :param pages:
+        Same as `tabula_read_pdf`
+    :return:
+        Number of pdfs extracted and added to the cache.
+    """
+    import tabula
+
+    tabula_cache = get_cache("tabula")
+    keys = {}
+    for filepath in filepaths:
+        key = extraction_cache_key(filepath, "tabula", pages=pages)
+        if key not in tabula_cache:
+            keys[filepath] = key
+    metrics.inc("cache_requests_total", len(filepaths) - len(keys), cache="tabula", result="hit")
+    metrics.inc("cache_requests_total", len(keys), cache="tabula", result="miss")
+    if not keys:
+        return 0
+
+    num_extracted = 0
+    with tempfile.TemporaryDirectory(prefix="tabula_batch_") as batch_dir:
+        # tabula-java writes <name>.json next to each <name>.pdf. Link the pdfs with
+        # unique names so that pdfs with the same basename don't clash.
+        batch_names = {}
+        for num, filepath in enumerate(keys):
+            batch_names[filepath] = os.path.join(batch_dir, str(num))
+            os.symlink(realpath(filepath), batch_names[filepath] + ".pdf")
+        try:
+            with HideUnderlyingStderrCtx(), metrics.timed("tabula_seconds", mode="batch"):
+                tabula.convert_into_by_batch(batch_dir, output_format="json",
+                                             java_options=["-Dfile.encoding=UTF8"],
+                                             pages=pages)
+        except Exception as err:
+            # Each pdf will be extracted individually by `tabula_read_pdf`.
+            log.warning(f"tabula batch extraction of {len(keys)} pdfs failed: {err!r}")
+
+        for filepath, key in keys.items():
+            json_path = batch_names[filepath] + ".json"
+            if not os.path.exists(json_path):
+                continue
+            with open(json_path, "r", encoding="utf-8") as f:
+                output = f.read()
+            # Same conversion as `tabula.read_pdf` does for its JSON output.
+            pages_df = _tabula_extract_from(json.loads(output)) if output else []
+            tabula_cache[key] = pages_df
+            num_extracted += 1
+    return num_extracted
+
+
+def pdfplumber_extract_texts(filepath, page_nums=None):
+    """
+    Extract the text of several pages of a pdf, opening the document only once.
+
+    Every page extracted is memoized in the pdfplumber cache using the contents
+    of `filepath`, the version of pdfplumber and its page number, so that
+    subsequent calls to `pdfplumber_extract_text` are served from the cache.
+
+    :param filepath:
+        A path to the pdf file
+    :param page_nums:
+        An iterable of 0-indexed page numbers. All pages are extracted if None.
+    :return:
+        A list with the text of each requested page, in the order of `page_nums`.
+    """
+    import pdfplumber
+
+    pdfplumber_cache = get_cache("pdfplumber")
+    texts = {}
+    if page_nums is not None:
+        page_nums = list(page_nums)
+        for page_num in page_nums:
+            try:
+                texts[page_num] = pdfplumber_cache[
+                    extraction_cache_key(filepath, "pdfplumber", page=page_num)]
+            except KeyError:
+                pass
+        metrics.inc("cache_requests_total", len(texts), cache="pdfplumber", result="hit")
+        if len(texts) == len(set(page_nums)):
+            return [texts[page_num] for page_num in page_nums]
+
+    with pdfplumber.open(filepath) as pdf, metrics.timed("pdfplumber_seconds", op="texts"):
+        pages = pdf.pages
+        if page_nums is None:
+            page_nums = list(range(len(pages)))
+        for page_num in page_nums:
+            if page_num not in range(0, len(pages)):
+                raise ValueError(f"{filepath!r} has {len(pages)}, passed page_num={page_num}")
+        missing = sorted(set(page_nums) - set(texts))
+        metrics.inc("cache_requests_total", len(missing), cache="pdfplumber", result="miss")
+        for page_num in missing:
+            text = pages[page_num].extract_text()
+            pdfplumber_cache[extraction_cache_key(filepath, "pdfplumber", page=page_num)] = text
+            texts[page_num] = text
+    return [texts[page_num] for page_num in page_nums]
+
+
+def pdf_num_pages(filepath):
+    """
+    Number of pages of a pdf, read from its page tree without parsing any page. Memoized in
+    pdfplumber cache like an extraction.
+    """
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+
+    pdfplumber_cache = get_cache("pdfplumber")
+    key = extraction_cache_key(filepath, "pdfplumber", num_pages=True)
     try:
-        return pdfplumber_cache[(basename(filepath), page_num)]
+        return pdfplumber_cache[key]
     except KeyError:
         pass
-    pdf = pdfplumber.open(filepath)
-    pages = list(pdf.pages)
-    if page_num not in range(0, len(pages)):
-        raise ValueError(f"{filepath!r} has {len(pages)}, passed page_num={page_num}")
-    page = pages[page_num]
-    text = page.extract_text()
-    pdfplumber_cache[(basename(filepath), page_num)] = text
-    return text
+    with open(filepath, "rb") as f:
+        document = PDFDocument(PDFParser(f))
+        num_pages = int(resolve1(resolve1(document.catalog["Pages"])["Count"]))
+    pdfplumber_cache[key] = num_pages
+    return num_pages
+
+
+def pdfplumber_extract_text(filepath, page_num):
+    """Wrapper over `pdfplumber_extract_texts` for a single page."""
+    return pdfplumber_extract_texts(filepath, [page_num])[0]
+
+
+PDFPLUMBER_TABLE_LAYOUT = 2
+"""Version of the layout rules in `pdfplumber_read_pdf`. Bump it to invalidate cached tables."""
+
+RE_ROLLNO = re.compile(r"^[0-9A-Z]*\d{2}/[0-9A-Za-z\-]+/\S+$")
+LINE_TOLERANCE = 3
+"""Words whose tops are within this many points are on the same line."""
+
+TABLE_FOOTERS = ("Any discrepancy", "Date :", "Dated :")
+"""Lines which end the result table of a page."""
+
+
+def page_numbers(pages, num_pages):
+    """
+    Translate `pages` as accepted by `tabula.read_pdf` into 0-indexed page numbers.
+
+    :param pages:
+        'all', a 1-indexed page number, a string like '1-3,5' or an iterable of 1-indexed page numbers.
+    :param num_pages:
+        Number of pages in the pdf.
+    """
+    if pages == 'all':
+        return list(range(num_pages))
+    if isinstance(pages, int):
+        return [pages - 1]
+    if isinstance(pages, str):
+        page_nums = []
+        for part in pages.split(","):
+            first, _, last = part.partition("-")
+            page_nums.extend(range(int(first) - 1, int(last or first)))
+        return page_nums
+    return [page - 1 for page in pages]
+
+
+def _group_lines(words):
+    """Group words returned by `pdfplumber.Page.extract_words` into lines, top to bottom."""
+    lines = []
+    for word in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        if lines and abs(word["top"] - lines[-1][0]["top"]) <= LINE_TOLERANCE:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w["x0"]) for line in lines]
+
+
+def _find_header(lines):
+    """
+    Find the header row 'Sr.No. Name Roll No. <subject codes> TC SPI' in `lines` grouped by
+    `_group_lines`. Returns `(line number, words of the line, position of the 'Roll' word,
+    words after 'Roll No.')` or None.
+    """
+    for header_num, line in enumerate(lines):
+        texts = [w["text"] for w in line]
+        if "".join(texts).lower().startswith("sr.no.nameroll"):
+            break
+    else:
+        return None
+
+    roll_idx = next(i for i, text in enumerate(texts) if text.lower().startswith("roll"))
+    # 'Roll No.' may be read as one or two words.
+    value_headers = line[roll_idx + (2 if texts[roll_idx + 1].lower().startswith("no") else 1):]
+    if len(value_headers) < 2:
+        return None
+    return header_num, line, roll_idx, value_headers
+
+
+def _words_to_table(words):
+    """
+    Rebuild the result table of a DTU result page from the positions of its words.
+
+    The header row 'Sr.No. Name Roll No. <subject codes> TC SPI' anchors the table: the
+    centre of every header word after 'Roll No.' is the x-offset of a column. A row is
+    split into the name (words left of the roll number), the roll number, the word
+    closest to each column offset and the papers failed (words right of the SPI
+    column). Rows which wrap have no roll number and only a name or papers failed.
+
+    Returns a `pandas.DataFrame` with the same columns as `tabula.read_pdf` produces
+    for such a page, or None if the page has no result table.
+    """
+    import numpy as np
+    import pandas as pd
+
+    lines = _group_lines(words)
+    header = _find_header(lines)
+    if header is None:
+        return None
+    header_num, line, roll_idx, value_headers = header
+    columns = [w["text"] for w in value_headers]
+    centres = np.array([(w["x0"] + w["x1"]) / 2 for w in value_headers])
+    # Papers failed are written right of the last column, i.e. SPI.
+    papers_failed_x0 = centres[-1] + (centres[-1] - centres[-2]) / 2
+    names_x1 = (line[roll_idx]["x0"] + value_headers[0]["x0"]) / 2
+
+    rows = []
+    for line in lines[header_num + 1:]:
+        text = " ".join(w["text"] for w in line)
+        if text.startswith(TABLE_FOOTERS):
+            break
+        if text.startswith("Max. Marks"):
+            continue
+        roll_pos = next((i for i, w in enumerate(line) if RE_ROLLNO.match(w["text"])), None)
+        name, rollno, papers_failed = [], None, []
+        values = [[] for _ in columns]
+        for pos, word in enumerate(line):
+            centre = (word["x0"] + word["x1"]) / 2
+            if (pos < roll_pos) if roll_pos is not None else (word["x1"] < names_x1):
+                name.append(word["text"])
+            elif pos == roll_pos:
+                rollno = word["text"]
+            elif word["x0"] >= papers_failed_x0:
+                papers_failed.append(word["text"])
+            else:
+                values[int(np.abs(centres - centre).argmin())].append(word["text"])
+        rows.append([np.nan, " ".join(name) or np.nan, rollno or np.nan]
+                    + [" ".join(value) or np.nan for value in values]
+                    + ["".join(papers_failed) or np.nan])
+
+    df = pd.DataFrame(rows, columns=['Unnamed: 0', 'Sr.No. Name', 'Roll No.'] + columns + ['Unnamed: 1'])
+    # Same type inference as `tabula.read_pdf`: columns of numbers only become numeric.
+    for column in df.columns:
+        try:
+            df[column] = pd.to_numeric(df[column])
+        except (ValueError, TypeError):
+            pass
+    return df
+
+
+def pdfplumber_read_pdf(filepath, pages='all'):
+    """
+    Pure Python alternative to `tabula_read_pdf` for DTU result pdfs, built on the word
+    positions found by pdfplumber. See `_words_to_table`.
+
+    Results are memoized like `tabula_read_pdf`. The text of every page read is also
+    added to the pdfplumber cache, so metadata extraction doesn't open the pdf again.
+
+    :return:
+        A list with a `pandas.DataFrame` per page read, None for a page without a result table,
+        e.g. a cover or a signature page, so that the position of a table is its page.
+    """
+    import pdfplumber
+
+    pdfplumber_cache = get_cache("pdfplumber")
+    key = extraction_cache_key(filepath, "pdfplumber", pages=pages, layout=PDFPLUMBER_TABLE_LAYOUT)
+    try:
+        pages_df = pdfplumber_cache[key]
+        metrics.inc("cache_requests_total", cache="pdfplumber", result="hit")
+        return pages_df
+    except KeyError:
+        metrics.inc("cache_requests_total", cache="pdfplumber", result="miss")
+    pages_df = []
+    with pdfplumber.open(filepath) as pdf, metrics.timed("pdfplumber_seconds", op="tables"):
+        for page_num in page_numbers(pages, len(pdf.pages)):
+            page = pdf.pages[page_num]
+            text_key = extraction_cache_key(filepath, "pdfplumber", page=page_num)
+            if text_key not in pdfplumber_cache:
+                pdfplumber_cache[text_key] = page.extract_text()
+            pages_df.append(_words_to_table(page.extract_words()))
+    pdfplumber_cache[key] = pages_df
+    return pages_df
+
+
+def table_hints(filepath):
+    """
+    Hints for `tabula.read_pdf` to read the result table of `filepath`, from the positions
+    of the header words on its first page with a header, see `_words_to_table`:
+
+        area    : [top, left, bottom, right] of the rows below the 'Max. Marks / Credits' row
+        columns : x-offsets of the boundaries between columns
+        names   : names of the columns, as `tabula.read_pdf` reads them from the header
+
+    Returns None if no page has a header.
+    """
+    import pdfplumber
+
+    with pdfplumber.open(filepath) as pdf, metrics.timed("pdfplumber_seconds", op="hints"):
+        for page in pdf.pages:
+            lines = _group_lines(page.extract_words())
+            header = _find_header(lines)
+            if header is None:
+                continue
+            header_num, line, roll_idx, value_headers = header
+            centres = [(w["x0"] + w["x1"]) / 2 for w in value_headers]
+            top = max(w["bottom"] for w in line)
+            following = lines[header_num + 1] if header_num + 1 < len(lines) else []
+            if " ".join(w["text"] for w in following).startswith("Max. Marks"):
+                top = max(w["bottom"] for w in following)
+            # An empty column left of 'Sr.No. Name' and the papers failed right of SPI, as
+            # tabula reads them.
+            columns = ([line[0]["x0"] - 1, line[roll_idx]["x0"] - 1,
+                        centres[0] - (centres[1] - centres[0]) / 2]
+                       + [(left + right) / 2 for left, right in zip(centres, centres[1:])]
+                       + [centres[-1] + (centres[-1] - centres[-2]) / 2])
+            names = (['Unnamed: 0', 'Sr.No. Name', 'Roll No.'] + [w["text"] for w in value_headers]
+                     + ['Unnamed: 1'])
+            return dict(area=[float(top) + 1, 0, float(page.height), float(page.width)],
+                        columns=[float(x) for x in columns], names=names)
+    return None
+
+
+def _drop_footer(df):
+    """Drop the rows of `df` from the first one which reads as one of `TABLE_FOOTERS`."""
+    texts = df.astype(str).where(df.notnull(), "").apply("".join, axis=1).str.replace(" ", "")
+    is_footer = texts.str.startswith(tuple(footer.replace(" ", "") for footer in TABLE_FOOTERS))
+    return df.iloc[:is_footer.values.argmax()] if is_footer.any() else df
+
+
+class TableHeaderNotFound(ValueError):
+    pass
+
+
+def tabula_read_pdf_with_hints(filepath, pages='all'):
+    """
+    `tabula_read_pdf` restricted to the area and columns given by `table_hints`, for pdfs in
+    which tabula doesn't detect the table or its header by itself. Rows from the footer of
+    a page on are dropped. Raises `TableHeaderNotFound` if no page has a header.
+    """
+    hints = table_hints(filepath)
+    if hints is None:
+        raise TableHeaderNotFound(f"Couldn't find the table header in {basename(filepath)!r}")
+    pages_df = tabula_read_pdf(filepath, pages, stream=True, guess=False, area=hints["area"],
+                               columns=hints["columns"],
+                               pandas_options={"header": None, "names": hints["names"]})
+    return [_drop_footer(df) for df in pages_df]
@@ -0,0 +1,268 @@
+"""
+A process pool which bounds the worst case of a task.
+
+`concurrent.futures.ProcessPoolExecutor` can't interrupt a task, so one pdf which hangs tabula
+stalls a run forever, and memory leaked by pandas or the JVM piles up in long lived workers.
+`SupervisedPool` runs one task at a time per worker and
+
+    - kills a worker whose task runs longer than `task_timeout` seconds,
+    - kills a worker whose resident memory, including child processes like the JVM started by
+      tabula, exceeds `max_rss` bytes,
+    - replaces a worker after `max_tasks_per_worker` tasks.
+
+Such failures are reported as `TaskTimeout`, `TaskMemoryExceeded` and `WorkerDied` so that they
+can be told apart from errors raised by the task itself, see `failure_status`.
+
+The `metrics` recorded by a worker during a task are sent back with its result and merged into
+the metrics of the parent. Those of a task which timed out or crashed are lost.
+"""
+from __future__ import absolute_import, division
+
+import multiprocessing
+from   multiprocessing.connection \
+                                import wait
+import signal
+import time
+
+from   loguru                   import logger as log
+
+import metrics
+
+
+DEFAULT_TASK_TIMEOUT            = 10 * 60
+DEFAULT_MAX_RSS                 = 4 * 2**30
+DEFAULT_MAX_TASKS_PER_WORKER    = 100
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+class TaskMemoryExceeded(Exception):
+    pass
+
+
+class WorkerDied(Exception):
+    pass
+
+
+FAILURE_STATUSES = {
+    TaskTimeout         : "timeout",
+    TaskMemoryExceeded  : "memory",
+    WorkerDied          : "crashed",
+}
+
+
+def failure_status(exc):
+    """Class of failure of a task which raised `exc`: 'timeout', 'memory', 'crashed' or 'failed'."""
+    return FAILURE_STATUSES.get(type(exc), "failed")
+
+
+def _worker_main(conn):
+    # Ctrl-C is handled by the parent, which stops the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Drop the metrics inherited from the parent, which already counted them, so that only
+    # those of the tasks of this worker are sent back.
+    metrics.drain()
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        func, args = task
+        start_ts = time.time()
+        try:
+            result = ("ok", func(*args))
+        except Exception as exc:
+            result = ("error", exc)
+        # Timed here, as the parent may read the result long after, e.g. while its consumer is
+        # blocked on a full queue.
+        seconds = time.time() - start_ts
+        snapshot = metrics.drain()
+        try:
+            conn.send(result + (snapshot, seconds))
+        except Exception as exc:
+            # The result or exception couldn't be pickled.
+            conn.send(("error", RuntimeError(f"{result[1]!r} (couldn't send to parent: {exc!r})"),
+                       snapshot, seconds))
+    conn.close()
+
+
+def _kill_tree(pid):
+    import psutil
+    try:
+        process = psutil.Process(pid)
+        for child in process.children(recursive=True):
+            child.kill()
+        process.kill()
+    except psutil.NoSuchProcess:
+        pass
+
+
+def _tree_rss(pid):
+    """Resident memory of `pid` and all its children in bytes."""
+    import psutil
+    try:
+        process = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+    except psutil.NoSuchProcess:
+        return 0
+
+
+class _Worker(object):
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.num_tasks = 0
+        self.key = None
+        self.started_at = None
+        self.seconds = None
+
+    @property
+    def busy(self):
+        return self.started_at is not None
+
+    def submit(self, key, func, args):
+        self.key, self.started_at = key, time.time()
+        self.conn.send((func, args))
+
+    def done(self, seconds=None):
+        """
+        :param seconds:
+            The time the task ran for as measured by the worker. Until now if None, e.g. if the
+            worker was killed.
+        """
+        self.seconds = time.time() - self.started_at if seconds is None else seconds
+        key, self.key, self.started_at = self.key, None, None
+        self.num_tasks += 1
+        return key
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self):
+        _kill_tree(self.process.pid)
+        self.process.join()
+
+
+class SupervisedPool(object):
+    """
+    Usage:
+
+        pool = SupervisedPool(num_workers=8, task_timeout=600, max_rss=4 * 2**30)
+        for key, result, error in pool.run(parse_dtu_result_pdf, ((f, (f,)) for f in filepaths)):
+            ...
+
+    :param num_workers:
+        Number of worker processes.
+    :param task_timeout:
+        Seconds a task may run for. No limit if None.
+    :param max_rss:
+        Bytes of resident memory a worker, including its children, may use. No limit if None.
+    :param max_tasks_per_worker:
+        Replace a worker by a fresh process after this many tasks. Never if None.
+    :param poll_interval:
+        Seconds between checks of the running tasks.
+
+    `task_seconds` maps the key of every finished task, successful or not, to the seconds it
+    ran for. Pop them as results are consumed, e.g. to estimate the cost of future runs.
+    """
+
+    def __init__(self, num_workers, task_timeout=None, max_rss=None, max_tasks_per_worker=None,
+                 poll_interval=1.0):
+        self.num_workers = num_workers
+        self.task_timeout = task_timeout
+        self.max_rss = max_rss
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.poll_interval = poll_interval
+        self.task_seconds = {}
+        self._ctx = multiprocessing.get_context()
+
+    def run(self, func, tasks, task_timeout=None):
+        """
+        Run `func(*args)` for every `(key, args)` in `tasks` and yield `(key, result, error)` as
+        tasks finish, where `error` is None or the exception the task failed with.
+
+        Tasks are consumed from `tasks` only as workers become free, so a slow consumer of
+        the results holds back new tasks.
+
+        :param task_timeout:
+            Overrides the timeout of the pool for these tasks.
+        """
+        task_timeout = task_timeout or self.task_timeout
+
+        def done(worker, seconds=None):
+            key = worker.done(seconds)
+            self.task_seconds[key] = worker.seconds
+            return key
+
+        tasks = iter(tasks)
+        exhausted = False
+        workers = [_Worker(self._ctx) for _ in range(self.num_workers)]
+        try:
+            while True:
+                for worker in workers:
+                    if not worker.busy and not exhausted:
+                        try:
+                            key, args = next(tasks)
+                        except StopIteration:
+                            exhausted = True
+                        else:
+                            worker.submit(key, func, args)
+                busy = [worker for worker in workers if worker.busy]
+                if not busy:
+                    break
+
+                ready = wait([worker.conn for worker in busy], timeout=self.poll_interval)
+                for num, worker in enumerate(workers):
+                    if not worker.busy:
+                        continue
+                    replace = False
+                    # Polled again, as the results yielded before may have been consumed for
+                    # longer than the timeout of a task which has finished since.
+                    if worker.conn in ready or worker.conn.poll():
+                        try:
+                            status, value, snapshot, seconds = worker.conn.recv()
+                        except (EOFError, OSError):
+                            yield done(worker), None, WorkerDied(
+                                f"Worker exited with code {worker.process.exitcode}")
+                            replace = True
+                        else:
+                            metrics.merge(snapshot)
+                            key = done(worker, seconds)
+                            yield (key, value, None) if status == "ok" else (key, None, value)
+                            replace = (self.max_tasks_per_worker is not None
+                                       and worker.num_tasks >= self.max_tasks_per_worker
+                                       or self.max_rss is not None
+                                       and _tree_rss(worker.process.pid) > self.max_rss)
+                            if replace:
+                                log.debug(f"Recycling worker {worker.process.pid} after "
+                                          f"{worker.num_tasks} tasks")
+                                worker.stop()
+                    elif task_timeout is not None and time.time() - worker.started_at > task_timeout:
+                        worker.kill()
+                        yield done(worker), None, TaskTimeout(f"Took longer than {task_timeout}s")
+                        replace = True
+                    elif self.max_rss is not None and _tree_rss(worker.process.pid) > self.max_rss:
+                        worker.kill()
+                        yield done(worker), None, TaskMemoryExceeded(
+                            f"Worker used more than {self.max_rss / 2**20:.0f} MiB")
+                        replace = True
+                    if replace:
+                        if worker.process.is_alive():
+                            worker.kill()
+                        workers[num] = _Worker(self._ctx)
+        finally:
+            for worker in workers:
+                if worker.busy:
+                    worker.kill()
+                else:
+                    worker.stop()
@@ -0,0 +1,509 @@
+"""
+Writers of the timelines of students to a DB, and a process owning the writer.
+
+The records parsed from every pdf are sent to a single `WriterProcess` over a bounded queue.
+The writer process merges them into timelines, see `timelines.TimelineIndex`, and writes the
+students in batches while the pdfs are still being parsed, so that parsing and writing to
+the DB overlap. When the DB is slower than parsing, the queue fills up and `WriterProcess.put`
+blocks, which holds back new tasks of the `worker_pool.SupervisedPool`.
+
+A writer is any object with
+
+    upsert:         True if writing a student again replaces its previous document. Other
+                    writers are given every student once, after all the records are received.
+    target:         The DB written to, e.g. `mongodb://localhost:27017/dtu`, under which the
+                    records written are journaled, see `changes.WrittenHashes`. None, or
+                    missing, if the writer writes every student on every run.
+    open()          called in the writer process before anything is written
+    write(timelines) -> roll numbers of the students written
+    close()
+
+`MongoWriter`, `DynamoDBWriter` and `NdjsonWriter`, e.g. as a stand-in for a DB in tests, are
+in `WRITERS`. A writer is pickled to the writer process, where it connects to its DB in
+`open`, so it must not connect in its `__init__`.
+
+MongoDB holds two collections:
+
+    results             one document per student: subject code -> latest marks, and name,
+                        as read by `app.py`, see `student_document`
+    semester_results    one document per student and page of a notice, i.e. per semester and
+                        notice, with the program, branch, semester, notice, examination and
+                        release dates, and the marks, SPI, TC and papers failed in the notice,
+                        see `semester_documents`
+
+`semester_results` is indexed for cohort queries, e.g. the results of a branch in a semester
+of an examination, see `SEMESTER_RESULTS_INDEXES`.
+
+Given a `hashes_db`, the writer process skips the students whose records were all written to
+the writer's `target` before, see `changes`, so that a run after new notices are added writes
+only the students of those notices.
+
+Usage:
+
+    with WriterProcess(MongoWriter(batch_size=1000), queue_size=64) as writer:
+        for filepath, results, error in parse_pdfs(pool, filepaths):
+            writer.put(results)
+    log.info(f"Wrote {writer.num_written} students, {writer.changes}")
+"""
+from __future__ import absolute_import, division
+
+from   collections              import Counter
+from   loguru                   import logger as log
+import multiprocessing
+import os
+import queue
+import signal
+from   timeit                   import default_timer as timer
+
+from   changes                  import WrittenHashes, timeline_hashes
+import dynamodb
+import metrics
+from   timelines                import TimelineIndex, notice_kind
+from   utils                    import write_ndjson
+
+
+DEFAULT_BATCH_SIZE = 1000
+"""Documents per bulk write to the DB."""
+
+DEFAULT_QUEUE_SIZE = 64
+"""Lists of records, e.g. the records of a pdf, waiting to be indexed by the writer process."""
+
+MONGO_HOST = "localhost"
+MONGO_PORT = 27017
+
+SEMESTER_RESULTS_INDEXES = (
+    [("rollno", 1), ("semester", 1)],
+    [("branch", 1), ("semester", 1), ("examination_date", 1)],
+    [("notice", 1)],
+)
+"""Compound indexes of the `semester_results` collection."""
+
+_mongo = (None, None)
+
+def get_db():
+    """
+    The `dtu` MongoDB database. The client is created on first use in each process, as a
+    MongoClient must not be shared with forked processes.
+    """
+    global _mongo
+    pid, db = _mongo
+    if pid != os.getpid():
+        from pymongo import MongoClient
+        db = MongoClient(host=MONGO_HOST, port=MONGO_PORT).dtu
+        _mongo = (os.getpid(), db)
+    return db
+
+
+def student_document(timeline):
+    """Document of a student in the `results` collection: subject code -> marks, and name."""
+    return dict(timeline.marks, name=timeline.name, _id=timeline.rollno)
+
+
+def semester_documents(timeline):
+    """
+    Documents of a student in the `semester_results` collection, one per page of a notice the
+    student appears in, identified by `<rollno>|<pdf filename>|<page number>`.
+    """
+    for semester in timeline.semesters:
+        for result in semester.sources:
+            page = result.page
+            yield dict(
+                _id                 = f"{timeline.rollno}|{page.pdf_filename}|{page.pdf_pagenum}",
+                rollno              = timeline.rollno,
+                name                = result.name,
+                program             = page.program,
+                branch              = page.branch,
+                semester            = page.semester,
+                notice              = page.notice,
+                kind                = notice_kind(page),
+                examination_date    = page.examination_date,
+                release_date        = page.release_date,
+                pdf_filename        = page.pdf_filename,
+                pdf_pagenum         = page.pdf_pagenum,
+                SPI                 = result.SPI,
+                total_credits       = result.total_credits,
+                papers_failed       = result.papers_failed,
+                marks               = dict(zip(result.subject_codes, result.marks)),
+            )
+
+
+def create_mongodb_indexes(db=None):
+    """Create the `SEMESTER_RESULTS_INDEXES` unless they exist."""
+    from pymongo import IndexModel
+    db = get_db() if db is None else db
+    names = db.semester_results.create_indexes([IndexModel(keys)
+                                                for keys in SEMESTER_RESULTS_INDEXES])
+    log.info(f"Indexes of semester_results: {names}")
+
+
+def dynamodb_item(timeline):
+    """Item of a student in the `dturesults` table: rollno, name and subject code -> marks."""
+    return dict(timeline.marks, name=timeline.name, rollno=timeline.rollno)
+
+
+def _bulk_write_mongodb(db, collection, rows):
+    """
+    Upsert a batch of documents to `collection` in an unordered bulk write, so that a document
+    failing doesn't stop the others.
+
+    :return:
+        The `_id`s of the documents which failed.
+    """
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError, PyMongoError
+    ops = [UpdateOne({"_id": row["_id"]}, {"$set": row}, upsert=True) for row in rows]
+    try:
+        with metrics.timed("mongo_batch_seconds", collection=collection):
+            db[collection].bulk_write(ops, ordered=False)
+        return []
+    except BulkWriteError as err:
+        errors = err.details.get("writeErrors", [])
+        for error in errors[:10]:
+            log.error(f"{rows[error['index']]['_id']}: Failed to insert to DB: "
+                      f"{error.get('errmsg')}")
+        if len(errors) > 10:
+            log.error(f"... and {len(errors) - 10} more errors in this batch")
+        if not errors:
+            return [row["_id"] for row in rows]
+        return [rows[error["index"]]["_id"] for error in errors]
+    except PyMongoError as err:
+        log.error(f"Failed to insert a batch of {len(rows)} documents to DB: {err!r}")
+        return [row["_id"] for row in rows]
+
+
+def insert_timelines_to_mongodb(timelines, batch_size=DEFAULT_BATCH_SIZE, db=None):
+    """
+    Upsert the latest marks of each student, see `timelines.StudentTimeline.marks`, to the
+    document of the student in `results`, and its result in every notice to `semester_results`,
+    in unordered bulk writes of `batch_size` documents. The documents failing to be written
+    are logged and skipped. A student is written only if all of its documents are.
+
+    :param timelines:
+        An iterable of `timelines.StudentTimeline`
+    :param db:
+        The MongoDB database, `get_db()` by default.
+    :return:
+        The roll numbers of the students written.
+    """
+    db = get_db() if db is None else db
+    start_ts = timer()
+    rows, semester_rows, written, failed_rollnos = [], [], [], set()
+
+    def flush(collection, rows):
+        failed = _bulk_write_mongodb(db, collection, rows)
+        metrics.inc("mongo_batches_total", collection=collection,
+                    status="failed" if failed else "ok")
+        metrics.inc("mongo_documents_total", len(rows) - len(failed), collection=collection)
+        failed = set(failed)
+        ids = [row["_id"] for row in rows if row["_id"] not in failed]
+        rows.clear()
+        return ids, failed
+
+    def flush_students():
+        ids, failed = flush("results", rows)
+        written.extend(ids)
+        failed_rollnos.update(failed)
+
+    def flush_semesters():
+        _, failed = flush("semester_results", semester_rows)
+        failed_rollnos.update(_id.split("|", 1)[0] for _id in failed)
+
+    for timeline in timelines:
+        if not timeline.name:
+            log.error(f"name not present in {timeline!r}, SKIPPING...")
+            metrics.inc("students_total", status="skipped")
+            continue
+        row = student_document(timeline)
+        log.debug("Inserting {}".format(row))
+        rows.append(row)
+        semester_rows.extend(semester_documents(timeline))
+        if len(rows) >= batch_size:
+            flush_students()
+        if len(semester_rows) >= batch_size:
+            flush_semesters()
+    if rows:
+        flush_students()
+    if semester_rows:
+        flush_semesters()
+
+    written = [rollno for rollno in written if rollno not in failed_rollnos]
+    metrics.inc("students_total", len(written), status="ok")
+    if failed_rollnos:
+        metrics.inc("students_total", len(failed_rollnos), status="db_failed")
+    seconds = timer() - start_ts
+    log.info(f"Inserted {len(written)} students to DB in {seconds:.1f}s "
+             f"({len(written) / seconds if seconds else 0:.0f} docs/sec), "
+             f"{len(failed_rollnos)} failed")
+    return written
+
+
+class MongoWriter(object):
+    """Upserts students to the `results` collection, see `insert_timelines_to_mongodb`."""
+
+    upsert = True
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.target = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/dtu"
+
+    def open(self):
+        create_mongodb_indexes()
+
+    def write(self, timelines):
+        return insert_timelines_to_mongodb(timelines, self.batch_size)
+
+    def close(self):
+        pass
+
+
+class DynamoDBWriter(object):
+    """
+    Puts students to the DynamoDB table read by `app.py`, keyed by rollno, with the name and
+    the marks of every subject as attributes, see `dynamodb.BatchWriter`.
+    """
+
+    upsert = True
+
+    def __init__(self, table_name=dynamodb.TABLE_NAME, region_name=dynamodb.REGION_NAME,
+                 endpoint_url=dynamodb.ENDPOINT_URL, num_threads=dynamodb.DEFAULT_NUM_THREADS,
+                 max_wcu=dynamodb.DEFAULT_MAX_WCU, create_table=False):
+        self.table_name = table_name
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.num_threads = num_threads
+        self.max_wcu = max_wcu
+        self.create_table = create_table
+        self.target = f"dynamodb://{endpoint_url or region_name}/{table_name}"
+        self._client = None
+
+    def open(self):
+        self._client = dynamodb.get_client(self.region_name, self.endpoint_url)
+        if self.create_table:
+            dynamodb.create_table(self._client, self.table_name, dynamodb.KEY)
+
+    def write(self, timelines):
+        start_ts = timer()
+        rollnos = []
+        with dynamodb.BatchWriter(self._client, self.table_name, dynamodb.KEY,
+                                  num_threads=self.num_threads, max_wcu=self.max_wcu) as writer:
+            for timeline in timelines:
+                if not timeline.name:
+                    log.error(f"name not present in {timeline!r}, SKIPPING...")
+                    metrics.inc("students_total", status="skipped")
+                    continue
+                writer.put(dynamodb_item(timeline))
+                rollnos.append(timeline.rollno)
+        metrics.inc("students_total", writer.num_written, status="ok")
+        if writer.num_failed:
+            metrics.inc("students_total", writer.num_failed, status="db_failed")
+        seconds = timer() - start_ts
+        log.info(f"Put {writer.num_written} students to DynamoDB in {seconds:.1f}s "
+                 f"({writer.num_written / seconds if seconds else 0:.0f} items/sec), "
+                 f"{writer.num_failed} failed")
+        failed = set(writer.failed_keys)
+        return [rollno for rollno in rollnos if rollno not in failed]
+
+    def close(self):
+        pass
+
+
+class NdjsonWriter(object):
+    """
+    Writes the timeline of every student, see `timelines.StudentTimeline.to_dict`, to `path` as
+    newline delimited JSON.
+    """
+
+    upsert = False
+    target = None
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = None
+
+    def open(self):
+        self._file = open(self.path, "w")
+
+    def write(self, timelines):
+        written = []
+
+        def records():
+            for timeline in timelines:
+                written.append(timeline.rollno)
+                yield timeline.to_dict()
+
+        write_ndjson(records(), self._file)
+        metrics.inc("students_total", len(written), status="ok")
+        return written
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+WRITERS = {
+    "mongo"     : MongoWriter,
+    "dynamodb"  : DynamoDBWriter,
+    "ndjson"    : NdjsonWriter,
+}
+
+
+def _writer_main(records_queue, conn, writer, batch_size, hashes_db, force):
+    # Ctrl-C is handled by the parent, which stops the writer once it has sent every record.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Only what this process records is sent back, not what it inherited from the parent.
+    metrics.drain()
+    index, dirty = TimelineIndex(), set()
+    num_written = 0
+    hashes = None
+    # The change of each student written in this run, as of its first write, and the students
+    # skipped as their records were all written before.
+    changes, unchanged = {}, set()
+
+    def changed(timelines, pending):
+        for timeline in timelines:
+            record_hashes = timeline_hashes(timeline)
+            # A student written earlier in this run is written again whatever its records, so
+            # that its last write holds all of them.
+            change = changes.get(timeline.rollno) or hashes.change(timeline.rollno, record_hashes)
+            if change == "unchanged" and not force:
+                unchanged.add(timeline.rollno)
+                continue
+            pending[timeline.rollno] = (change, record_hashes)
+            yield timeline
+
+    def flush():
+        nonlocal num_written
+        if hashes is None:
+            num_written += len(writer.write(index.timelines(dirty)))
+            dirty.clear()
+            return
+        pending = {}
+        written = writer.write(changed(index.timelines(dirty), pending))
+        # Only what the DB acknowledged, so that a student which failed is written next time.
+        hashes.record({rollno: pending[rollno][1] for rollno in written})
+        for rollno in written:
+            changes.setdefault(rollno, pending[rollno][0])
+            unchanged.discard(rollno)
+        num_written += len(written)
+        dirty.clear()
+
+    try:
+        if hashes_db and getattr(writer, "target", None):
+            hashes = WrittenHashes(hashes_db, writer.target)
+        writer.open()
+        while True:
+            results = records_queue.get()
+            if results is None:
+                break
+            dirty.update(index.add(results))
+            # Students are written again as their other notices are received, each write
+            # holding all the records received so far, see `timelines.merge_timeline`. Only
+            # once the queue is drained, so that a writer behind the parsers writes each
+            # student once for all the records waiting for it.
+            if writer.upsert and len(dirty) >= batch_size and records_queue.empty():
+                flush()
+        flush()
+        counts = Counter(changes.values())
+        if hashes is not None:
+            counts["skipped"] = len(unchanged)
+            for change, count in counts.items():
+                metrics.inc("students_changed_total", count, change=change)
+        status = ("ok", (index.num_records, len(index), num_written, dict(counts)))
+    except Exception as exc:
+        log.exception(f"Writer failed: {exc!r}")
+        status = ("error", exc)
+    finally:
+        writer.close()
+        if hashes is not None:
+            hashes.close()
+    conn.send(status + (metrics.drain(),))
+    conn.close()
+
+
+class WriterProcess(object):
+    """
+    A process which merges the records it is sent into timelines and writes them with `writer`.
+    If the writer upserts, the students whose records were received are written whenever there
+    are `batch_size` of them and no records are waiting, i.e. while the parsers are busy.
+    Otherwise every student is written once all the records are received.
+
+    :param queue_size:
+        Lists of records which may wait to be indexed before `put` blocks.
+    :param hashes_db:
+        SQLite journal of the records written to the writer's `target`, see
+        `changes.WrittenHashes`. Students whose records were all written before are skipped.
+        Every student is written if None, or if the writer has no `target`.
+    :param force:
+        Write every student, e.g. after the DB was dropped, and journal them again.
+    """
+
+    def __init__(self, writer, batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE,
+                 poll_interval=1.0, hashes_db=None, force=False):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.num_records = self.num_students = self.num_written = 0
+        self.changes = {}
+        ctx = multiprocessing.get_context()
+        self._queue = ctx.Queue(queue_size)
+        self._conn, child_conn = ctx.Pipe(duplex=False)
+        self._process = ctx.Process(target=_writer_main, daemon=True,
+                                    args=(self._queue, child_conn, writer, batch_size,
+                                          hashes_db and str(hashes_db), force))
+        self._process.start()
+        child_conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _put(self, item, process):
+        """Put `item` in the queue unless `process` exits meanwhile. Returns whether it did."""
+        while process.is_alive():
+            try:
+                self._queue.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def put(self, results):
+        """Send a list of `records.StudentResult` to be written. Blocks while the queue is full."""
+        start_ts = timer()
+        if not self._put(list(results), self._process):
+            # Raises the exception the writer failed with.
+            self.close()
+            raise RuntimeError("Writer exited before all the records were sent")
+        metrics.observe("writer_queue_wait_seconds", timer() - start_ts)
+
+    def close(self):
+        """Wait for every record sent to be written. Raises the exception the writer failed with."""
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        try:
+            self._put(None, process)
+            status, value, snapshot = self._conn.recv()
+        except EOFError:
+            status = None
+        finally:
+            process.join()
+            # Records left in the queue by a writer which died would otherwise block the exit
+            # of this process, see `multiprocessing.Queue.cancel_join_thread`.
+            self._queue.cancel_join_thread()
+            self._queue.close()
+            self._conn.close()
+        if status is None:
+            raise RuntimeError(f"Writer exited with code {process.exitcode}")
+        metrics.merge(snapshot)
+        if status != "ok":
+            raise value
+        self.num_records, self.num_students, self.num_written, self.changes = value
+        log.info(f"Received {self.num_records} records of {self.num_students} students, "
+                 f"{self.num_written} writes in all")
+        if "skipped" in self.changes:
+            counts = ", ".join(f"{count} {change}" for change, count in self.changes.items())
+            log.info(f"Students written and skipped since the last run: {counts}")
@@ -0,0 +1,10 @@
+import os
+from   os.path                  import dirname, realpath
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(dirname(dirname(realpath(__file__))), "src/python"))
+sys.path.insert(0, os.path.join(dirname(dirname(realpath(__file__))), "benchmarks"))
+
+# Before `utils` is imported, so that tests don't read or fill the caches of the repo.
+os.environ["SUPPLEMENTARY_CACHES_DIR"] = tempfile.mkdtemp(prefix="supplementary-caches-")
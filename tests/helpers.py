@@ -0,0 +1,89 @@
+"""Records, writers and clients shared by the tests."""
+from   collections              import Counter
+import json
+import random
+import threading
+
+import dynamodb
+from   records                  import PageMetadata, StudentResult
+
+
+def page(pdf_filename, release_date="06/01/2015", semester="V", notice=None, pagenum=0):
+    return PageMetadata("B.Tech", "MC", semester, release_date, "DEC-2014",
+                        notice or f"No.DTU/Results/{pdf_filename}", pdf_filename, pagenum)
+
+
+def result(page, rollno, marks, SPI="7.0", name="AMAN GUPTA"):
+    return StudentResult(page, name, rollno, SPI, "24", None, tuple(marks),
+                         tuple(marks.values()))
+
+
+class FileWriter(object):
+    """Upserting writer appending the roll numbers of every write to `path` as a JSON line."""
+
+    upsert = True
+
+    def __init__(self, path, target="test://db", fail=()):
+        self.path = str(path)
+        self.target = target
+        self.fail = set(fail)
+
+    def open(self):
+        pass
+
+    def write(self, timelines):
+        written = [timeline.rollno for timeline in timelines if timeline.rollno not in self.fail]
+        with open(self.path, "a") as f:
+            f.write(json.dumps(written) + "\n")
+        return written
+
+    def close(self):
+        pass
+
+    def writes(self):
+        try:
+            with open(self.path) as f:
+                return [rollno for line in f for rollno in json.loads(line)]
+        except FileNotFoundError:
+            return []
+
+
+class Throttled(Exception):
+    response = {"Error": {"Code": "ProvisionedThroughputExceededException"}}
+
+
+class StubClient(object):
+    """
+    `batch_write_item` of a table which throttles `throttle` of the calls and leaves `unprocessed`
+    of the items of the others unprocessed. Items whose key is in `poisoned` are never written.
+    """
+
+    def __init__(self, throttle=0.0, unprocessed=0.0, poisoned=(), error=None, seed=0):
+        self.items = {}
+        self.puts = Counter()
+        self.calls = 0
+        self.throttle = throttle
+        self.unprocessed = unprocessed
+        self.poisoned = set(poisoned)
+        self.error = error
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems):
+        (table_name, requests), = RequestItems.items()
+        assert len(requests) <= dynamodb.MAX_BATCH_SIZE
+        with self.lock:
+            self.calls += 1
+            if self.error:
+                raise self.error
+            if self.rng.random() < self.throttle:
+                raise Throttled()
+            left = [request for request in requests
+                    if request["PutRequest"]["Item"]["rollno"]["S"] in self.poisoned
+                    or self.rng.random() < self.unprocessed]
+            for request in requests:
+                if request not in left:
+                    item = request["PutRequest"]["Item"]
+                    self.items[item["rollno"]["S"]] = item
+                    self.puts[item["rollno"]["S"]] += 1
+        return {"UnprocessedItems": {table_name: left} if left else {}}
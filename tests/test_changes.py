@@ -0,0 +1,139 @@
+import json
+
+from   changes                  import WrittenHashes, timeline_hashes
+from   helpers                  import FileWriter, page, result
+from   timelines                import TimelineIndex
+from   writers                  import WriterProcess
+
+
+def notice(pdf_filename, rollnos, mark=50, semester="V"):
+    pdf_page = page(pdf_filename, semester=semester)
+    return [result(pdf_page, rollno, {f"MC-{semester}": mark}) for rollno in rollnos]
+
+
+def timeline(*notices):
+    index = TimelineIndex()
+    for results in notices:
+        index.add(results)
+    timeline, = index.timelines()
+    return timeline
+
+
+def test_written_hashes(tmp_path):
+    hashes = WrittenHashes(tmp_path / "hashes.sqlite", "test://db")
+    regular = timeline_hashes(timeline(notice("E15_MC.pdf", ["2K12/MC/1"])))
+    assert hashes.change("2K12/MC/1", regular) == "new"
+    hashes.record({"2K12/MC/1": regular})
+    assert hashes.change("2K12/MC/1", regular) == "unchanged"
+
+    both = timeline_hashes(timeline(notice("E15_MC.pdf", ["2K12/MC/1"]),
+                                    notice("E15_MC_BACK.pdf", ["2K12/MC/1"], semester="VI")))
+    assert hashes.change("2K12/MC/1", both) == "updated"
+    changed = timeline_hashes(timeline(notice("E15_MC.pdf", ["2K12/MC/1"], mark=60)))
+    assert hashes.change("2K12/MC/1", changed) == "updated"
+
+    assert WrittenHashes(tmp_path / "hashes.sqlite", "other://db").change(
+        "2K12/MC/1", regular) == "new"
+    hashes.clear()
+    assert hashes.change("2K12/MC/1", regular) == "new"
+    hashes.close()
+
+
+def test_hashes_are_stable_across_record_order():
+    first = timeline(notice("E15_MC.pdf", ["2K12/MC/1"]), notice("E15_MC_REV.pdf", ["2K12/MC/1"]))
+    second = timeline(notice("E15_MC_REV.pdf", ["2K12/MC/1"]), notice("E15_MC.pdf", ["2K12/MC/1"]))
+    assert timeline_hashes(first) == timeline_hashes(second)
+
+
+def run(tmp_path, notices, **kwargs):
+    fake = FileWriter(tmp_path / "writes.jsonl", fail=kwargs.pop("fail", ()))
+    (tmp_path / "writes.jsonl").unlink(missing_ok=True)
+    with WriterProcess(fake, batch_size=1, hashes_db=tmp_path / "hashes.sqlite",
+                       **kwargs) as writer:
+        for results in notices:
+            writer.put(results)
+    return sorted(set(fake.writes())), writer.changes
+
+
+def test_runs_write_only_the_students_which_changed(tmp_path):
+    students = ["2K12/MC/1", "2K12/MC/2", "2K12/MC/3"]
+    notices = [notice("E15_MC.pdf", students)]
+    assert run(tmp_path, notices) == (students, {"new": 3, "skipped": 0})
+    assert run(tmp_path, notices) == ([], {"skipped": 3})
+
+    notices.append(notice("E15_MC_BACK.pdf", ["2K12/MC/2"], semester="VI"))
+    assert run(tmp_path, notices) == (["2K12/MC/2"], {"updated": 1, "skipped": 2})
+    assert run(tmp_path, notices) == ([], {"skipped": 3})
+    assert run(tmp_path, notices, force=True) == (students, {"unchanged": 3, "skipped": 0})
+
+
+def test_students_which_failed_are_written_by_the_next_run(tmp_path):
+    notices = [notice("E15_MC.pdf", ["2K12/MC/1", "2K12/MC/2"])]
+    assert run(tmp_path, notices, fail={"2K12/MC/2"}) == (["2K12/MC/1"],
+                                                          {"new": 1, "skipped": 0})
+    assert run(tmp_path, notices) == (["2K12/MC/2"], {"new": 1, "skipped": 1})
+
+
+class SourcesWriter(FileWriter):
+    """Appends the number of records of every student written instead of its roll number."""
+
+    def write(self, timelines):
+        timelines = list(timelines)
+        with open(self.path, "a") as f:
+            f.write(json.dumps([sum(len(semester.sources) for semester in timeline.semesters)
+                                for timeline in timelines]) + "\n")
+        return [timeline.rollno for timeline in timelines]
+
+
+def test_students_of_several_notices_are_written_whole(tmp_path):
+    regular = notice("E15_MC.pdf", ["2K12/MC/1"])
+    assert run(tmp_path, [regular])[0] == ["2K12/MC/1"]
+    # A new notice received before the known one: the student is written again once both are
+    # received, so that its last write holds both.
+    revised = notice("E15_MC_REV.pdf", ["2K12/MC/1"], mark=70)
+    fake = SourcesWriter(tmp_path / "sources.jsonl")
+    with WriterProcess(fake, batch_size=1, hashes_db=tmp_path / "hashes.sqlite") as writer:
+        writer.put(revised)
+        writer.put(regular)
+    assert fake.writes()[-1] == 2
+    assert writer.changes == {"updated": 1, "skipped": 0}
+
+
+class ReplacingWriter(FileWriter):
+    """Replaces the whole item of every student written, as DynamoDB does."""
+
+    def items(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def write(self, timelines):
+        items = self.items()
+        written = []
+        for timeline in timelines:
+            items[timeline.rollno] = timeline.marks
+            written.append(timeline.rollno)
+        with open(self.path, "w") as f:
+            json.dump(items, f)
+        return written
+
+
+def test_students_written_without_a_notice_are_written_again_once_it_is_back(tmp_path):
+    fake = ReplacingWriter(tmp_path / "items.json")
+
+    def run(*notices):
+        with WriterProcess(fake, batch_size=1, hashes_db=tmp_path / "hashes.sqlite") as writer:
+            for results in notices:
+                writer.put(results)
+        return fake.items()["2K12/MC/1"], writer.changes
+
+    sem_v, sem_vi = (notice("E15_MC.pdf", ["2K12/MC/1"], mark=55),
+                     notice("E15_MC_VI.pdf", ["2K12/MC/1"], mark=60, semester="VI"))
+    assert run(notice("E15_MC.pdf", ["2K12/MC/1"]), sem_vi) == (
+        {"MC-V": 50, "MC-VI": 60}, {"new": 1, "skipped": 0})
+    # The pdf of semester VI failed to parse.
+    assert run(sem_v) == ({"MC-V": 55}, {"updated": 1, "skipped": 0})
+    assert run(sem_v, sem_vi) == ({"MC-V": 55, "MC-VI": 60}, {"updated": 1, "skipped": 0})
+    assert run(sem_v, sem_vi)[1] == {"skipped": 1}
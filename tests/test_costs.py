@@ -0,0 +1,27 @@
+from   costs                    import TaskCosts
+
+
+def test_same_named_pdfs_in_different_dirs(tmp_path):
+    root = tmp_path / "dtu_results"
+    for year in ("2014", "2015"):
+        (root / year).mkdir(parents=True)
+        (root / year / "BTECH_V.pdf").write_bytes(f"%PDF {year}".encode())
+    first, second = root / "2014/BTECH_V.pdf", root / "2015/BTECH_V.pdf"
+
+    costs = TaskCosts(tmp_path / "costs.sqlite", root=root)
+    costs.record(first, "all", 30.0)
+    costs.record(second, "all", 2.0)
+    assert costs.estimate(first) == 30.0
+    assert costs.estimate(second) == 2.0
+    costs.close()
+
+
+def test_changed_pdf_is_estimated_from_its_pages(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF 1")
+    costs = TaskCosts(tmp_path / "costs.sqlite", root=tmp_path)
+    costs.record(pdf, "all", 30.0)
+    pdf.write_bytes(b"%PDF 22")
+    # One page, as it can't be counted, at the 30s per page recorded so far.
+    assert TaskCosts(tmp_path / "costs.sqlite", root=tmp_path).estimate(pdf) == 30.0
+    costs.close()
@@ -0,0 +1,57 @@
+from   decimal                  import Decimal
+
+import dynamodb
+from   helpers                  import StubClient
+
+
+class AccessDenied(Exception):
+    response = {"Error": {"Code": "AccessDeniedException"}}
+
+
+def put_all(client, num_items, **kwargs):
+    with dynamodb.BatchWriter(client, num_threads=4, base_delay=0.001, max_delay=0.01,
+                              **kwargs) as writer:
+        for num in range(num_items):
+            writer.put({"rollno": f"2K12/MC/{num}", "name": "AMAN", "MC-301": num, "SPI": 7.5})
+    return writer
+
+
+def test_throttled_and_unprocessed_items_are_retried():
+    client = StubClient(throttle=0.3, unprocessed=0.3)
+    writer = put_all(client, 500, max_retries=30)
+    assert (writer.num_written, writer.num_failed, writer.failed_keys) == (500, 0, [])
+    assert len(client.items) == 500
+    assert client.items["2K12/MC/7"]["MC-301"] == {"N": "7"}
+    assert client.calls > 500 / dynamodb.MAX_BATCH_SIZE
+
+
+def test_items_left_unprocessed_after_the_retries_fail():
+    client = StubClient(poisoned={"2K12/MC/3", "2K12/MC/40"})
+    writer = put_all(client, 100, max_retries=2)
+    assert (writer.num_written, writer.num_failed) == (98, 2)
+    assert sorted(writer.failed_keys) == ["2K12/MC/3", "2K12/MC/40"]
+    assert "2K12/MC/3" not in client.items and len(client.items) == 98
+
+
+def test_errors_which_cant_be_retried_fail_the_batch():
+    client = StubClient(error=AccessDenied())
+    writer = put_all(client, 30)
+    assert (writer.num_written, writer.num_failed, len(writer.failed_keys)) == (0, 30, 30)
+    assert client.calls == 2
+
+
+def test_last_item_of_a_key_in_a_batch_wins():
+    client = StubClient()
+    with dynamodb.BatchWriter(client) as writer:
+        writer.put({"rollno": "2K12/MC/1", "MC-301": 10})
+        writer.put({"rollno": "2K12/MC/1", "MC-301": 20})
+    assert client.items["2K12/MC/1"]["MC-301"] == {"N": "20"}
+
+
+def test_attribute_values():
+    assert dynamodb.to_item({"rollno": "2K12/MC/1", "SPI": 7.5, "TC": None, "x": float("nan"),
+                             "marks": {"MC-301": 85}, "papers": ["MC-302"]}) == {
+        "rollno": {"S": "2K12/MC/1"}, "SPI": {"N": "7.5"}, "TC": {"NULL": True},
+        "x": {"NULL": True}, "marks": {"M": {"MC-301": {"N": "85"}}},
+        "papers": {"L": [{"S": "MC-302"}]}}
+    assert dynamodb.from_attribute_value({"N": "85"}) == Decimal(85)
@@ -0,0 +1,64 @@
+import pytest
+
+from   helpers                  import page, result
+from   timelines                import TimelineIndex
+import writers
+
+pymongo = pytest.importorskip("pymongo")
+from   pymongo.errors           import BulkWriteError
+
+
+class StubCollection(object):
+    """Applies the `UpdateOne` upserts of a bulk write, failing the documents in `poisoned`."""
+
+    def __init__(self, poisoned):
+        self.documents = {}
+        self.poisoned = poisoned
+
+    def bulk_write(self, ops, ordered=True):
+        errors = []
+        for num, op in enumerate(ops):
+            _id = op._filter["_id"]
+            if _id in self.poisoned:
+                errors.append(dict(index=num, code=2, errmsg="poisoned"))
+            else:
+                self.documents.setdefault(_id, {}).update(op._doc["$set"])
+        if errors:
+            raise BulkWriteError(dict(writeErrors=errors, nInserted=0))
+
+
+class StubDB(dict):
+
+    def __init__(self, poisoned=()):
+        super().__init__(results=StubCollection(set(poisoned)),
+                         semester_results=StubCollection(set(poisoned)))
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+def timelines():
+    index = TimelineIndex()
+    for kind in ("", "_BACK"):
+        pdf_page = page(f"E15_MC{kind}.pdf")
+        index.add([result(pdf_page, f"2K12/MC/{num}", {"MC-301": 40 + num + len(kind)})
+                   for num in range(5)])
+    return list(index.timelines())
+
+
+def test_students_and_their_notices_are_upserted():
+    db = StubDB()
+    written = writers.insert_timelines_to_mongodb(timelines(), batch_size=2, db=db)
+    assert written == [f"2K12/MC/{num}" for num in range(5)]
+    assert db.results.documents["2K12/MC/1"] == {"_id": "2K12/MC/1", "name": "AMAN GUPTA",
+                                                 "MC-301": 46}
+    assert len(db.semester_results.documents) == 10
+    back = db.semester_results.documents["2K12/MC/1|E15_MC_BACK.pdf|0"]
+    assert (back["kind"], back["marks"]) == ("back", {"MC-301": 46})
+
+
+def test_students_with_a_document_which_failed_arent_written():
+    db = StubDB(poisoned={"2K12/MC/1", "2K12/MC/3|E15_MC.pdf|0"})
+    written = writers.insert_timelines_to_mongodb(timelines(), batch_size=2, db=db)
+    assert written == ["2K12/MC/0", "2K12/MC/2", "2K12/MC/4"]
+    assert "2K12/MC/3" in db.results.documents
@@ -0,0 +1,87 @@
+import pytest
+
+pytest.importorskip("pymongo")
+from   bson                     import ObjectId
+from   pymongo.errors           import AutoReconnect
+
+import dynamodb
+from   helpers                  import StubClient
+from   mongodb_to_dynamodb      import MigrationCheckpoint, migrate
+
+
+class StubCursor(object):
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, key, direction):
+        assert (key, direction) == ("_id", 1)
+        return StubCursor(sorted(self.documents, key=lambda document: document["_id"]))
+
+    def limit(self, limit):
+        return StubCursor(self.documents[:limit])
+
+    def __iter__(self):
+        return iter(self.documents)
+
+
+class StubCollection(object):
+    """`find` of a collection, the query `fail_at` raising `AutoReconnect`."""
+
+    def __init__(self, documents, fail_at=None):
+        self.documents = documents
+        self.queries = 0
+        self.fail_at = fail_at
+
+    def find(self, query):
+        self.queries += 1
+        if self.queries == self.fail_at:
+            raise AutoReconnect("connection lost")
+        after = query.get("_id", {}).get("$gt")
+        return StubCursor([document for document in self.documents
+                           if after is None or document["_id"] > after])
+
+
+def documents(num):
+    return [{"_id": ObjectId(), "name": "AMAN", "MC-301": num} for num in range(num)]
+
+
+def run(collection, client, checkpoint_db):
+    checkpoint = MigrationCheckpoint(checkpoint_db, "results", "dturesults")
+    try:
+        return migrate(collection, client, checkpoint=checkpoint, batch_size=10, num_threads=2)
+    finally:
+        checkpoint.close()
+
+
+def test_resumed_migration_writes_every_document_once(tmp_path):
+    results, client = documents(95), StubClient()
+    with pytest.raises(AutoReconnect):
+        run(StubCollection(results, fail_at=4), client, tmp_path / "checkpoints.sqlite")
+    assert len(client.items) == 30
+
+    checkpoint = MigrationCheckpoint(tmp_path / "checkpoints.sqlite", "results", "dturesults")
+    assert checkpoint.load() == (results[29]["_id"], 30)
+    checkpoint.close()
+
+    resumed = StubCollection(results)
+    assert run(resumed, client, tmp_path / "checkpoints.sqlite") == 95
+    assert resumed.queries == 8
+    assert set(client.puts) == {str(document["_id"]) for document in results}
+    assert set(client.puts.values()) == {1}
+    assert client.items[str(results[42]["_id"])]["MC-301"] == {"N": "42"}
+
+
+def test_pages_with_failed_items_are_copied_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(dynamodb.BatchWriter, "_backoff", lambda self, attempt: 0)
+    results = documents(30)
+    client = StubClient(poisoned={str(results[15]["_id"])})
+    with pytest.raises(RuntimeError, match="1 items failed"):
+        run(StubCollection(results), client, tmp_path / "checkpoints.sqlite")
+    client.poisoned.clear()
+    assert run(StubCollection(results), client, tmp_path / "checkpoints.sqlite") == 30
+    assert len(client.items) == 30
+    # The first page was checkpointed, the second one is copied again.
+    assert {client.puts[str(document["_id"])] for document in results[:10]} == {1}
+    assert {client.puts[str(document["_id"])] for document in results[10:20]
+            if document is not results[15]} == {2}
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+from   os.path                  import basename
+
+import parse_results
+from   records                  import PageMetadata, StudentResult
+from   utils                    import iter_ndjson
+
+
+def fake_parse(filepath, engine=None):
+    """One record per line of the fake pdf `filepath`, its marks being the line."""
+    with open(filepath) as f:
+        lines = f.read().split()
+    page = PageMetadata("B.Tech", "MC", "V", "01/01/2015", "DEC-2014", "notice",
+                        basename(filepath), 1)
+    return [StudentResult(page, "S", f"2K12/MC/{num}", "7.0", "24", None, ("MC-301",), (line,))
+            for num, line in enumerate(lines)]
+
+
+def run(root, tmp_path):
+    parse_results.parse_all_pdf(root, progress_file=None, metrics_file=None,
+                                dump_parsed_data_file=tmp_path / "parsed.ndjson",
+                                progress_db=tmp_path / "progress.sqlite")
+    return sorted((record["pdf_filename"], record["marks"]["MC-301"])
+                  for record in iter_ndjson(tmp_path / "parsed.ndjson"))
+
+
+def test_records_of_pdfs_parsed_again_are_replaced(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_results, "parse_dtu_result_pdf", fake_parse)
+    root = tmp_path / "dtu_results"
+    for year in ("2014", "2015"):
+        (root / year).mkdir(parents=True)
+    (root / "2014/A.pdf").write_text("a1 a2")
+    (root / "2014/B.pdf").write_text("b1")
+    (root / "2015/B.pdf").write_text("c1")
+    assert run(root, tmp_path) == [("A.pdf", "a1"), ("A.pdf", "a2"), ("B.pdf", "b1"),
+                                   ("B.pdf", "c1")]
+    assert run(root, tmp_path) == [("A.pdf", "a1"), ("A.pdf", "a2"), ("B.pdf", "b1"),
+                                   ("B.pdf", "c1")]
+
+    (root / "2014/A.pdf").write_text("a3")
+    assert run(root, tmp_path) == [("A.pdf", "a3"), ("B.pdf", "b1"), ("B.pdf", "c1")]
+    # Its records can't be told from those of 2015/B.pdf, which is parsed again too.
+    (root / "2014/B.pdf").write_text("b2 b3")
+    assert run(root, tmp_path) == [("A.pdf", "a3"), ("B.pdf", "b2"), ("B.pdf", "b3"),
+                                   ("B.pdf", "c1")]
+
+
+def test_records_of_a_killed_run_are_kept(tmp_path, monkeypatch):
+    def parse_or_die(filepath, engine=None):
+        if basename(filepath) == "C.pdf":
+            # Killed while writing its records, after those of A.pdf and B.pdf were synced.
+            with open(tmp_path / "parsed.ndjson", "a") as f:
+                f.write('{"pdf_filename": "C.pdf", "marks"')
+            os._exit(9)
+        return fake_parse(filepath)
+
+    root = tmp_path / "dtu_results"
+    root.mkdir()
+    for name in ("A", "B", "C"):
+        (root / f"{name}.pdf").write_text(name.lower())
+    monkeypatch.setattr(parse_results, "get_filepaths",
+                        lambda dirpath: sorted(str(path) for path in root.iterdir()))
+    monkeypatch.setattr(parse_results, "parse_dtu_result_pdf", parse_or_die)
+    killed = multiprocessing.get_context("fork").Process(target=run, args=(root, tmp_path))
+    killed.start()
+    killed.join()
+    assert killed.exitcode == 9
+
+    monkeypatch.setattr(parse_results, "parse_dtu_result_pdf", fake_parse)
+    assert run(root, tmp_path) == [("A.pdf", "a"), ("B.pdf", "b"), ("C.pdf", "c")]
@@ -0,0 +1,149 @@
+from   functools                import partial
+
+import pytest
+
+import parse_results
+from   synthetic_pdf            import result_pages, write_pdf
+from   utils                    import pdfplumber_read_pdf
+
+
+def text_page(*lines):
+    return [(20, 500 - 20 * num, line) for num, line in enumerate(lines)]
+
+
+def test_pages_without_tables_keep_their_page_numbers(tmp_path):
+    first, second = result_pages(2, 8)
+    pdf = str(tmp_path / "notice.pdf")
+    write_pdf(pdf, [text_page("Delhi Technological University", "Result Notification"),
+                    first,
+                    text_page("Controller of Examination"),
+                    second])
+    results = parse_results.parse_dtu_result_pdf(pdf, "pdfplumber", fallback=False)
+    assert len(results) == 16
+    assert sorted({result.page.pdf_pagenum for result in results}) == [1, 3]
+    assert {result.page.semester for result in results} == {"V"}
+
+
+def test_continuation_rows_of_several_lines_are_merged():
+    import numpy as np
+    import pandas as pd
+
+    nan = np.nan
+    df = pd.DataFrame([
+        [nan, "Max. Marks / Credits", nan,          "100/4", nan, nan,     "Papers Failed"],
+        [nan, "1 KOMARAVOLU",         "2K12/MC/30", "86",    26,  "83.67", "MC-305MC-303MC-"],
+        [nan, nan,                    nan,          nan,     nan, nan,     "302MC-"],
+        [nan, nan,                    nan,          nan,     nan, nan,     "301"],
+        [nan, "NITIN",                nan,          nan,     nan, nan,     nan],
+        [nan, "BHARDWAJ",             nan,          nan,     nan, nan,     nan],
+        [nan, "2 KRISHNA KUMAR",      "2K12/MC/31", "47",    30,  "53.13", nan],
+        [nan, "VENKATA",              nan,          nan,     nan, nan,     nan],
+        [nan, "SAI",                  nan,          nan,     nan, nan,     nan],
+        [nan, "REDDY",                nan,          nan,     nan, nan,     nan],
+    ], columns=["Unnamed: 0", "Sr.No. Name", "Roll No.", "MC-301", "TC", "SPI", "Unnamed: 1"])
+    sanitized = parse_results.sanitize_df(df)
+    assert list(sanitized.index) == [0, 1]
+    assert list(sanitized.rollno) == ["2K12/MC/30", "2K12/MC/31"]
+    assert list(sanitized.name) == ["KOMARAVOLU NITIN BHARDWAJ", "KRISHNA KUMAR VENKATA SAI REDDY"]
+    assert sanitized.papers_failed[0] == "MC-305MC-303MC- 302MC- 301"
+    assert pd.isnull(sanitized.papers_failed[1])
+    assert list(sanitized["MC-301"]) == ["86", "47"]
+
+
+def test_synthetic_total_credits_arent_negative():
+    from synthetic_pdf import SUBJECT_SPACING, SUBJECTS, X_FIRST_SUBJECT, result_pages
+    x_tc = X_FIRST_SUBJECT + len(SUBJECTS) * SUBJECT_SPACING
+    pages = result_pages(4, 40, wrap_every=4, max_papers_failed_lines=5)
+    credits = [int(text) for texts in pages for x, _, text in texts
+               if x == x_tc and text.lstrip("-").isdigit()]
+    assert credits and min(credits) >= 0
+
+
+class Strategies(object):
+    """Extraction strategies raising the errors in `errors`, or reading the pdf with pdfplumber."""
+
+    def __init__(self, monkeypatch, tmp_path, **errors):
+        self.calls = []
+        self.errors = {name.replace("_", "-"): exc for name, exc in errors.items()}
+        monkeypatch.setattr("utils.CACHES_DIR", tmp_path / "caches")
+        monkeypatch.setattr("utils._caches", {})
+        monkeypatch.setattr(parse_results, "EXTRACTION_STRATEGIES", {
+            name: partial(self.extract, name)
+            for name in ("tabula", "pdfplumber", "tabula-hints", "tabula-lattice")})
+        tmp_path.mkdir(exist_ok=True)
+        self.pdf = str(tmp_path / "notice.pdf")
+        write_pdf(self.pdf, result_pages(1, 5))
+
+    def extract(self, name, filepath, pages='all'):
+        self.calls.append(name)
+        if name in self.errors:
+            raise self.errors[name]
+        return pdfplumber_read_pdf(filepath, pages)
+
+    def parse(self):
+        self.calls = []
+        return parse_results.parse_dtu_result_pdf(self.pdf, "tabula")
+
+
+def test_fallbacks_depend_on_the_failure(monkeypatch, tmp_path):
+    strategies = Strategies(monkeypatch, tmp_path, tabula=KeyError("name"),
+                            tabula_hints=parse_results.NoTablesFound("no tables"))
+    assert len(strategies.parse()) == 5
+    assert strategies.calls == ["tabula", "tabula-hints", "pdfplumber"]
+    # Remembered for the next run.
+    strategies.parse()
+    assert strategies.calls == ["pdfplumber"]
+
+    strategies = Strategies(monkeypatch, tmp_path / "crash", tabula=RuntimeError("JVM crashed"))
+    strategies.parse()
+    assert strategies.calls == ["tabula", "pdfplumber"]
+
+
+def test_only_deterministic_failures_are_remembered(monkeypatch, tmp_path):
+    every = ("tabula", "pdfplumber", "tabula_hints", "tabula_lattice")
+    strategies = Strategies(monkeypatch, tmp_path, **{name: IndexError("empty page")
+                                                      for name in every})
+    with pytest.raises(IndexError):
+        strategies.parse()
+    assert strategies.calls == ["tabula", "pdfplumber", "tabula-lattice", "tabula-hints"]
+    with pytest.raises(IndexError):
+        strategies.parse()
+    assert strategies.calls == ["tabula"]
+
+    strategies = Strategies(monkeypatch, tmp_path / "flaky", **{name: IndexError("empty page")
+                                                               for name in every})
+    strategies.errors["tabula-lattice"] = OSError("disk full")
+    with pytest.raises(IndexError):
+        strategies.parse()
+    del strategies.errors["tabula-lattice"]
+    assert len(strategies.parse()) == 5
+    assert strategies.calls == ["tabula", "pdfplumber", "tabula-lattice"]
+
+
+def test_sharded_parse_equals_the_whole_pdf(tmp_path):
+    from synthetic_pdf import LINE_HEIGHT, X_NAME
+    from worker_pool import SupervisedPool
+
+    # The name of the last student of every page wraps over to the next page, from page 2 to 3
+    # across the ranges of two pages parsed by different tasks.
+    pages = result_pages(4, 8, wrap_every=8)
+    for above, below in zip(pages, pages[1:]):
+        last = min((text for text in above if text[2] == "BHARDWAJ"), key=lambda text: text[1])
+        above.remove(last)
+        wrapped = last[2]
+        first_row = max(y for x, y, text in below if text.startswith("2K12/MC/"))
+        below[:] = [(x, y - LINE_HEIGHT if y <= first_row else y, text) for x, y, text in below]
+        below.append((X_NAME, first_row, wrapped))
+    pdf = str(tmp_path / "notice.pdf")
+    write_pdf(pdf, pages)
+
+    whole = parse_results.parse_dtu_result_pdf(pdf, "pdfplumber")
+    assert parse_results.shard_pages(pdf, 2) == ["1-2", "3-4"]
+    (filepath, sharded, error), = parse_results.parse_pdfs(SupervisedPool(2), [pdf], "pdfplumber",
+                                                           pages_per_task=2)
+    assert error is None
+    assert [result.to_dict() for result in sharded] == [result.to_dict() for result in whole]
+    names = {result.rollno: result.name for result in sharded}
+    assert len(names) == 32
+    assert all(names[f"2K12/MC/{rollno}"].endswith(" BHARDWAJ") for rollno in (8, 16, 24))
+    assert {result.page.pdf_pagenum for result in sharded} == {0, 1, 2, 3}
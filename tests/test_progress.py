@@ -0,0 +1,33 @@
+from   progress                 import ParseProgress
+
+
+def test_same_named_pdfs_in_different_dirs(tmp_path):
+    root = tmp_path / "dtu_results"
+    for year in ("2014", "2015"):
+        (root / year).mkdir(parents=True)
+        (root / year / "BTECH_V.pdf").write_bytes(f"%PDF {year}".encode())
+    first, second = root / "2014/BTECH_V.pdf", root / "2015/BTECH_V.pdf"
+
+    progress = ParseProgress(tmp_path / "progress.sqlite", root=root)
+    progress.record(first, "v1", num_records=3)
+    assert not progress.needs_parse(first, "v1")
+    assert progress.needs_parse(second, "v1")
+    progress.record(second, "v1", error=ValueError("no tables"))
+    assert not progress.needs_parse(first, "v1")
+    assert progress.needs_parse(second, "v1")
+    assert progress.needs_parse(first, "v2")
+
+    progress.export_json(tmp_path / "progress.json")
+    assert (tmp_path / "progress.json").read_text().count("BTECH_V.pdf") == 2
+    progress.close()
+
+
+def test_changed_pdf_is_parsed_again(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF 1")
+    progress = ParseProgress(tmp_path / "progress.sqlite", root=tmp_path)
+    progress.record(pdf, "v1", num_records=1)
+    assert not progress.needs_parse(pdf, "v1")
+    pdf.write_bytes(b"%PDF 22")
+    assert progress.needs_parse(pdf, "v1")
+    progress.close()
@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("pyarrow")
+import result_store
+
+
+def record(rollno, semester="V", branch="Mathematics and Computing", marks=None):
+    return dict(rollno=rollno, name="AMAN GUPTA", program="Bachelor of Technology",
+                branch=branch, semester=semester, notice="notice", release_date="06/01/2015",
+                examination_date="DEC-2014", pdf_filename="E15_MC.pdf", pdf_pagenum=1,
+                SPI=7.5, total_credits=24, papers_failed=None,
+                marks=marks or {"MC-301": 70.0, "MC-302": "A"})
+
+
+def records():
+    return [record("2K12/MC/1"), record("2K12/MC/2"), record("2K13/MC/1"),
+            record("2K12/MC/1", semester="VI"),
+            record("2K12/CO/1", branch="Computer Engineering")]
+
+
+def test_export_again_replaces_the_partitions_exported(tmp_path):
+    root = tmp_path / "store"
+    assert result_store.export_records(records(), root, chunk_size=2) == 5
+    assert result_store.export_records(records(), root, chunk_size=2) == 5
+    assert len(result_store.load_results(root)) == 5
+
+    # Only semester V of MC is exported again, the other partitions are kept.
+    result_store.export_records([record("2K12/MC/1", marks={"MC-301": 80})], root)
+    df = result_store.load_results(root, columns=["rollno", "semester", "marks"])
+    assert sorted(zip(df.rollno, df.semester)) == [
+        ("2K12/CO/1", "V"), ("2K12/MC/1", "V"), ("2K12/MC/1", "VI")]
+    assert list(df[df.semester == "V"].sort_values("rollno").marks.map(list)) == [["70", "A"],
+                                                                                  ["80"]]
+    assert not (tmp_path / "store.export").exists()
+
+
+def test_load_results_prunes_partitions_and_columns(tmp_path):
+    root = tmp_path / "store"
+    result_store.export_records(records(), root)
+    df = result_store.load_results(root, columns=["rollno", "subject_codes", "marks"],
+                                   batch="2K12", branch_code="MC", semester="V")
+    assert list(df.columns) == ["rollno", "subject_codes", "marks"]
+    assert list(df.rollno) == ["2K12/MC/1", "2K12/MC/2"]
+    assert list(df.subject_codes[0]) == ["MC-301", "MC-302"]
+
+    df = result_store.load_results(root, columns=["rollno", "SPI"],
+                                   branch="Computer Engineering")
+    assert df.to_dict("records") == [dict(rollno="2K12/CO/1", SPI="7.5")]
+
+    long_df = result_store.explode_marks(result_store.load_results(root, semester="VI"))
+    assert long_df.to_dict("records") == [
+        dict(rollno="2K12/MC/1", subject_code="MC-301", marks="70"),
+        dict(rollno="2K12/MC/1", subject_code="MC-302", marks="A")]
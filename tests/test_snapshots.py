@@ -0,0 +1,84 @@
+import hashlib
+import json
+import shutil
+import zipfile
+
+import pytest
+
+import snapshots
+
+
+def make_tree(tmp_path, version):
+    topdir, caches_dir = tmp_path / "top", tmp_path / "caches"
+    (topdir / "data").mkdir(parents=True, exist_ok=True)
+    (caches_dir / "tabula").mkdir(parents=True, exist_ok=True)
+    (topdir / "data/parsed_data.ndjson").write_text(f'{{"version": {version}}}\n')
+    (caches_dir / "tabula/cache.bin").write_text(f"tables {version}")
+    return topdir, caches_dir
+
+
+def evil_snapshot(path, roots, files):
+    manifest = dict(version=snapshots.MANIFEST_VERSION, roots=roots,
+                    files=[dict(name=name, size=len(data),
+                                sha256=hashlib.sha256(data).hexdigest())
+                           for name, data in files.items()])
+    with zipfile.ZipFile(str(path), "w") as archive:
+        archive.writestr(snapshots.MANIFEST_NAME, json.dumps(manifest))
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return path
+
+
+def test_roundtrip(tmp_path):
+    topdir, caches_dir = make_tree(tmp_path, 1)
+    path = snapshots.create_snapshot(tmp_path / "snapshots", caches_dir, topdir=topdir)
+    make_tree(tmp_path, 2)
+    snapshots.restore_snapshot(path, caches_dir, topdir)
+    assert (topdir / "data/parsed_data.ndjson").read_text() == '{"version": 1}\n'
+    assert (caches_dir / "tabula/cache.bin").read_text() == "tables 1"
+    assert [p.name for p in (topdir / "data").iterdir()] == ["parsed_data.ndjson"]
+
+
+@pytest.mark.parametrize("roots, name", [
+    (["data/parsed_data.ndjson"], "../../evil"),
+    (["data/parsed_data.ndjson"], "/tmp/evil"),
+    (["data/parsed_data.ndjson"], "data/parsed_data.ndjson/../../evil"),
+    (["data/parsed_data.ndjson"], "caches/evil"),
+    (["etc"], "etc/passwd"),
+])
+def test_paths_outside_the_caches_and_outputs_are_rejected(tmp_path, roots, name):
+    topdir, caches_dir = make_tree(tmp_path, 1)
+    path = evil_snapshot(tmp_path / "evil.zip", roots, {name: b"evil"})
+    with pytest.raises(ValueError):
+        snapshots.restore_snapshot(path, caches_dir, topdir)
+    assert (topdir / "data/parsed_data.ndjson").read_text() == '{"version": 1}\n'
+    assert not (tmp_path / "evil").exists()
+
+
+def test_root_without_files_is_rejected(tmp_path):
+    topdir, caches_dir = make_tree(tmp_path, 1)
+    path = evil_snapshot(tmp_path / "evil.zip", ["caches", "data/parsed_data.ndjson"],
+                         {"caches/tabula/cache.bin": b"tables 2"})
+    with pytest.raises(ValueError):
+        snapshots.restore_snapshot(path, caches_dir, topdir)
+    assert (topdir / "data/parsed_data.ndjson").exists()
+
+
+def test_failed_swap_puts_back_the_previous_contents(tmp_path, monkeypatch):
+    topdir, caches_dir = make_tree(tmp_path, 1)
+    path = snapshots.create_snapshot(tmp_path / "snapshots", caches_dir, topdir=topdir)
+    make_tree(tmp_path, 2)
+    move = shutil.move
+
+    def failing_move(src, dst):
+        # Swapping in the second root fails.
+        if "parsed_data" in src and ".old" not in src and ".restore-" in src:
+            raise OSError("disk full")
+        return move(src, dst)
+
+    monkeypatch.setattr(shutil, "move", failing_move)
+    with pytest.raises(OSError):
+        snapshots.restore_snapshot(path, caches_dir, topdir)
+    assert (topdir / "data/parsed_data.ndjson").read_text() == '{"version": 2}\n'
+    assert (caches_dir / "tabula/cache.bin").read_text() == "tables 2"
+    assert [p.name for p in (topdir / "data").iterdir()] == ["parsed_data.ndjson"]
@@ -0,0 +1,64 @@
+import random
+
+from   helpers                  import page, result
+from   timelines                import TimelineIndex, merge_semester, notice_kind
+
+
+def test_notice_kinds():
+    assert notice_kind(page("E15_MC_301.pdf")) == "regular"
+    assert notice_kind(page("E15_MC_BACK_302.pdf")) == "back"
+    assert notice_kind(page("RecheckingE12_116.pdf")) == "rechecking"
+    assert notice_kind(page("E15_BT_DIS_REV_425.pdf")) == "revised"
+    assert notice_kind(page("BTPT_Conso_304.pdf")) == "conso"
+
+
+def test_later_kinds_supersede_earlier_ones_released_the_same_day():
+    regular = result(page("E15_MC.pdf"), "2K12/MC/1", {"MC-301": 30, "MC-302": 50}, SPI="5.0")
+    back = result(page("E15_MC_BACK.pdf"), "2K12/MC/1", {"MC-301": 45}, SPI=None)
+    revised = result(page("E15_MC_REV.pdf"), "2K12/MC/1", {"MC-302": 55}, SPI="6.0")
+    for _ in range(5):
+        records = [regular, back, revised]
+        random.shuffle(records)
+        semester = merge_semester("V", records)
+        assert semester.sources == [regular, back, revised]
+        assert semester.marks == {"MC-301": 45, "MC-302": 55}
+        assert semester.SPI == "6.0"
+
+
+def test_conso_replaces_every_subject():
+    regular = result(page("E15_MC.pdf"), "2K12/MC/1", {"MC-301": 30, "MC-302": 50})
+    conso = result(page("E15_MC_Conso.pdf", "01/07/2015"), "2K12/MC/1", {"MC-303": 70})
+    back = result(page("E15_MC_BACK.pdf", "01/08/2015"), "2K12/MC/1", {"MC-303": 75})
+    assert merge_semester("V", [back, conso, regular]).marks == {"MC-303": 75}
+    assert merge_semester("V", [regular, conso]).marks == {"MC-303": 70}
+
+
+def test_release_date_orders_before_kind():
+    revised = result(page("E15_MC_REV.pdf", "06/01/2015"), "2K12/MC/1", {"MC-301": 40})
+    back = result(page("E15_MC_BACK.pdf", "06/03/2015"), "2K12/MC/1", {"MC-301": 60})
+    assert merge_semester("V", [back, revised]).marks == {"MC-301": 60}
+
+
+def test_index_is_independent_of_the_order_of_pdfs():
+    records = [result(page(f"E15_MC_{semester}{kind}.pdf", semester=semester), f"2K12/MC/{num}",
+                      {f"MC-{semester}0{kind_num}": kind_num * 10 + num})
+               for num in range(3) for semester in ("V", "VI")
+               for kind_num, kind in enumerate(("", "_BACK", "_REV"))]
+    expected = None
+    for _ in range(5):
+        random.shuffle(records)
+        index = TimelineIndex()
+        assert index.add(records) == {"2K12/MC/0", "2K12/MC/1", "2K12/MC/2"}
+        timelines = [timeline.to_dict() for timeline in index.timelines()]
+        assert expected is None or timelines == expected
+        expected = timelines
+    assert [semester["semester"] for semester in expected[0]["semesters"]] == ["V", "VI"]
+
+
+def test_record_of_a_page_parsed_again_replaces_the_previous_one():
+    index = TimelineIndex()
+    index.add([result(page("E15_MC.pdf"), "2K12/MC/1", {"MC-301": 30})])
+    index.add([result(page("E15_MC.pdf"), "2K12/MC/1", {"MC-301": 35})])
+    timeline, = index.timelines()
+    assert timeline.marks == {"MC-301": 35}
+    assert len(timeline.semesters[0].sources) == 1
@@ -0,0 +1,17 @@
+import pandas as pd
+import pytest
+
+from   utils                    import cache_get_frames, open_cache
+
+
+def test_cached_frames_and_arrow_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr("utils.CACHES_DIR", tmp_path)
+    cache = open_cache("tabula")
+    cache["pickled"] = [pd.DataFrame({"a": ["x", None]})]
+    # Written by the Arrow format of older versions.
+    cache["arrow"] = b"SUPARW01\0\0\0\0"
+    assert cache_get_frames(cache, "pickled")[0].equals(pd.DataFrame({"a": ["x", None]}))
+    for key in ("arrow", "missing"):
+        with pytest.raises(KeyError):
+            cache_get_frames(cache, key)
+    cache.close()
@@ -0,0 +1,47 @@
+import metrics
+from   worker_pool              import SupervisedPool, TaskTimeout, failure_status
+
+
+def count_task(value):
+    metrics.inc("test_tasks_total")
+    return value
+
+
+def sleep_task(seconds):
+    import time
+    time.sleep(seconds)
+
+
+def counter(name):
+    return metrics.REGISTRY.counters.get((name, ()), 0)
+
+
+def test_metrics_of_recycled_workers_are_counted_once():
+    metrics.drain()
+    # Inherited by every worker forked from now on.
+    metrics.inc("test_tasks_total", 100)
+    pool = SupervisedPool(2, max_tasks_per_worker=2, poll_interval=0.1)
+    results = list(pool.run(count_task, ((i, (i,)) for i in range(10))))
+    assert sorted(result for _, result, _ in results) == list(range(10))
+    assert counter("test_tasks_total") == 110
+    metrics.drain()
+
+
+def test_timeout():
+    pool = SupervisedPool(1, task_timeout=0.5, poll_interval=0.1)
+    (key, result, error), = pool.run(sleep_task, [("slow", (30,))])
+    assert key == "slow" and isinstance(error, TaskTimeout)
+    assert failure_status(error) == "timeout"
+
+
+def test_tasks_finished_while_the_consumer_is_blocked_dont_time_out():
+    import time
+    pool = SupervisedPool(2, task_timeout=2, poll_interval=0.1)
+    results = {}
+    for key, result, error in pool.run(sleep_task, [("fast", (0.1,)), ("slow", (0.8,))]):
+        results[key] = error
+        if key == "fast":
+            # E.g. a writer blocking on a full queue.
+            time.sleep(3)
+    assert results == {"fast": None, "slow": None}
+    assert 0.8 <= pool.task_seconds["slow"] < 2
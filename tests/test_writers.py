@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from   helpers                  import FileWriter, page, result
+import metrics
+from   utils                    import iter_ndjson
+from   writers                  import NdjsonWriter, WriterProcess
+
+
+def pdf_results(num_pdfs=4, num_students=5):
+    """Records of every pdf: each student in a regular and a back notice of two semesters."""
+    pdfs = []
+    for num in range(num_pdfs):
+        semester, kind = ("V", "VI")[num // 2], ("", "_BACK")[num % 2]
+        pdf_page = page(f"E15_MC_{semester}{kind}.pdf", semester=semester)
+        pdfs.append([result(pdf_page, f"2K12/MC/{student}", {f"MC-{semester}": num})
+                     for student in range(num_students)])
+    return pdfs
+
+
+class FailingWriter(FileWriter):
+
+    def write(self, timelines):
+        raise ValueError("DB is down")
+
+
+class DyingWriter(FileWriter):
+
+    def write(self, timelines):
+        os._exit(3)
+
+
+def test_ndjson_writer_writes_every_student_once(tmp_path):
+    with WriterProcess(NdjsonWriter(tmp_path / "timelines.ndjson"), batch_size=2) as writer:
+        for results in pdf_results():
+            writer.put(results)
+    timelines = list(iter_ndjson(tmp_path / "timelines.ndjson"))
+    assert [timeline["rollno"] for timeline in timelines] == [f"2K12/MC/{n}" for n in range(5)]
+    assert [len(semester["sources"]) for semester in timelines[0]["semesters"]] == [2, 2]
+    assert (writer.num_records, writer.num_students, writer.num_written) == (20, 5, 5)
+
+
+def test_upsert_writer_writes_every_student_at_least_once(tmp_path):
+    fake = FileWriter(tmp_path / "writes.jsonl")
+    with WriterProcess(fake, batch_size=2, queue_size=1) as writer:
+        for results in pdf_results():
+            writer.put(results)
+    assert set(fake.writes()) == {f"2K12/MC/{n}" for n in range(5)}
+    assert writer.num_written == len(fake.writes())
+
+
+def test_metrics_of_the_writer_are_counted_once(tmp_path):
+    metrics.drain()
+    metrics.inc("students_total", 100, status="ok")
+    with WriterProcess(NdjsonWriter(tmp_path / "timelines.ndjson")) as writer:
+        for results in pdf_results():
+            writer.put(results)
+    assert metrics.REGISTRY.counters[("students_total", (("status", "ok"),))] == 105
+    metrics.drain()
+
+
+def test_writer_errors_are_raised_by_close(tmp_path):
+    writer = WriterProcess(FailingWriter(tmp_path / "writes.jsonl"))
+    writer.put(pdf_results()[0])
+    with pytest.raises(ValueError, match="DB is down"):
+        writer.close()
+
+
+def test_writer_errors_are_raised_by_put(tmp_path):
+    writer = WriterProcess(FailingWriter(tmp_path / "writes.jsonl"), batch_size=1,
+                           queue_size=1, poll_interval=0.1)
+    with pytest.raises(ValueError, match="DB is down"):
+        for _ in range(100):
+            for results in pdf_results():
+                writer.put(results)
+
+
+def test_death_of_the_writer_is_raised(tmp_path):
+    writer = WriterProcess(DyingWriter(tmp_path / "writes.jsonl"), batch_size=1, queue_size=1,
+                           poll_interval=0.1)
+    with pytest.raises(RuntimeError, match="code 3"):
+        for _ in range(100):
+            for results in pdf_results():
+                writer.put(results)
+        writer.close()